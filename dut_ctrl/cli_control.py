@@ -9,21 +9,73 @@ logging.basicConfig(
                     datefmt='%H:%M:%S')
 
 from common_enums import InterfaceOp, AclCtrlPlaneType, FrameType, InterfaceType
+from cli_table import parse_table, get_template
+from fsm import FSM
 
+import re
+import atexit
+import contextlib
+import functools
 import pexpect
 
+# Prompts and markers are searched in the tail of the output only, instead of rescanning the whole
+# output on every read. Must not be smaller than the pexpect spawn maxread (2000), so that each read is searched in full.
+SEARCH_WINDOW_SIZE = 2048
+
+# Prompts are anchored to the end of the output - A prompt is the last thing printed before the shell waits for input
+ONL_PROMPT_RE      = re.compile(r"root@localhost:~# ?$")
+LOGIN_PROMPT_RE    = re.compile(r"localhost login: ?$")
+PING_DONE_RE       = re.compile(r"rtt min/avg/max/mdev")
+
+# Kinds of CLI sessions kept by CliSessionPool
+CPM_SESSION = "cpm"
+ONL_SESSION = "onl"
+# Seconds to wait for the prompt, when checking that a kept session is responsive
+SESSION_PROBE_TIMEOUT = 3
+
 # ***************************************************************************************
 # Module helper functions
 # ***************************************************************************************
-def _print_system_mod (cli_comm) :
-    logging.info("Send command \"show sys mod\"")
-    cli_comm.sendline('show sys mod')
+@functools.lru_cache(maxsize=None)
+def _cpm_prompt_re (device_number: str = r"\d+") -> "re.Pattern" :
+    """
+    DUT CLI prompt, such as "R3010[2023-03-30-18:02:14]# ", anchored to the end of the output
+    Input : device_number - Such as '3010'. By default, the prompt of any device.
+    """
+    return re.compile(rf"R{device_number}[^\r\n]*# ?$")
+
+def _expect_prompt (cli_comm, patterns: list, timeout = -1) -> int :
+    """
+    Wait for one of precompiled patterns, searching the tail of the output only
+    Input : patterns - List of compiled regular expressions (such as ONL_PROMPT_RE), pexpect.TIMEOUT or pexpect.EOF
+            timeout - Seconds. -1 for the cli_comm default timeout
+    Return value : Index of the matching pattern. The output up to the match is in cli_comm.before
+    """
+    return cli_comm.expect_list(patterns, timeout = timeout, searchwindowsize = SEARCH_WINDOW_SIZE)
+
+def _expect_marker (cli_comm, markers, timeout = -1) -> int :
+    """
+    Wait for one of literal strings (such as "password:"), searching the new output only
+    Input : markers - String, or list of strings
+    Return value : Index of the matching string
+    """
+    return cli_comm.expect_exact(markers, timeout = timeout, searchwindowsize = SEARCH_WINDOW_SIZE)
 
-    logging.info("Expecting: \"BOX/SLOT\"")
-    cli_comm.expect('.*BOX/SLOT.*')
+def _drop_pending_output (cli_comm) :
+    """
+    Drop output that was received, or is waiting to be read, but was not consumed by an expect
+    (such as an extra prompt), so that it is not mistaken for the output of the next command
+    """
+    cli_comm.buffer = cli_comm.string_type()
+    try :
+        while True :
+            cli_comm.read_nonblocking(size = SEARCH_WINDOW_SIZE, timeout = 0)
+    except pexpect.exceptions.TIMEOUT :
+        pass
 
-    logging.info("Received results")
-    print(cli_comm.after)
+def _print_system_mod (cli_comm) :
+    logging.info("Send command \"show sys mod\"")
+    print(execute_cli_command(cli_comm, 'show sys mod'))
 
 def _get_dut_alias_to_cmd (device_num: str, device_type: str, command: str) -> str:
     """
@@ -31,25 +83,14 @@ def _get_dut_alias_to_cmd (device_num: str, device_type: str, command: str) -> s
     device_num  : e.g., '3010'
     device_type : Applicable values : 'dl', 'ec', 'al', 'uf'
     command     : Applicable values : 'm', 'o', 'off', 'on', 'reset', 's', 'sc' 
+    The alias file is parsed once, and again only when it changes (see alias_index.py)
     """
-    import re
+    from alias_index import get_dut_alias_to_cmd
 
-    alias_file = '/home/exaware/alias_sw_lab_new'
-    dev_specific_num = device_num[-2:]
+    aliased_command = get_dut_alias_to_cmd(device_num, device_type, command)
     
-    with open(alias_file, 'r') as f:
-        text = f.read()
-
-    full_command = f"alias exa-il01-{device_type}-30{dev_specific_num}-{command}"
-    pattern = f"{full_command}='(.*)'"
-
-    matches = re.findall(pattern, text)
-
-    if len(matches) != 1 :
-        raise Exception (f"Could not find command {full_command} in alias file {alias_file}")
-    
-    print(f"Command {full_command} in aliased to {matches[0]}")
-    return matches[0]
+    print(f"Command alias exa-il01-{device_type}-30{device_num[-2:]}-{command} in aliased to {aliased_command}")
+    return aliased_command
 
 def get_official_install_file_name(cli_response, build_number) :
     """
@@ -59,9 +100,8 @@ def get_official_install_file_name(cli_response, build_number) :
     """
     required_file_name = None
 
-    normalised_input = [line.lstrip() for line in cli_response.splitlines()]
-    for i, line in enumerate(normalised_input) :
-        build_name = (line.split())[-1]
+    for row in parse_table("ls -l", cli_response) :
+        build_name = row["NAME"]
         if build_name.endswith(f"b{build_number}") :
             required_file_name = build_name            
             break
@@ -78,9 +118,8 @@ def get_official_latest_build(cli_response: str) -> str :
     get_build_num_pattern       = r"\d+$"
     max_build_num = 0
 
-    normalised_input = [line.lstrip() for line in cli_response.splitlines()]
-    for i, line in enumerate(normalised_input) :
-        file_name = (line.split())[-1]
+    for row in parse_table("ls -l", cli_response) :
+        file_name = row["NAME"]
         if re.search(install_file_name_pattern, file_name) :
             match = re.search(get_build_num_pattern, file_name)
             build_num = int(match.group())
@@ -109,29 +148,86 @@ def get_build_number_from_build_param_file(file_name):
                 break 
     return build_num
 
-def _parse_show_counter(cli_response, policy_name, rule_name) :
+def _parse_acl_counters(cli_response, template_name = "show acl interface detail", is_summed = False) -> dict :
+    """
+        Parse the whole ACL counters table of "show acl interface detail" / "show ctrl-plane acl detail"
+        Input : template_name - cli_table template of the command, see _get_acl_table_template()
+                cli_response - String multi line of the DUT response, such as :
+                    INTERFACE   DIR  POL                     RULE          ACTION  COUNT
+                    ----------------------------------------------------------------------
+                    x-eth0/0/1  in   canary_pol_deny_src_ip  r1            deny    20
+                                                             rule-default  permit  30
+                The leading columns and the policy name are printed on the first rule row of a policy only.
+                Any number of policies and rules is supported.
+                is_summed - Rows of the same policy and rule (such as a policy attached in both directions) are summed if True.
+                            Otherwise the first row is taken, as the DUT prints it.
+        Return value : Dictionary {(policy_name, rule_name) : Integer counter}, in the order of the table
+    """
+    counters = {}
+
+    for row in parse_table(template_name, cli_response) :
+        if row["POL"] == "" :
+            raise Exception (f"ACL counter row without policy: {row}")
+        key = (row["POL"], row["RULE"])
+        if key in counters :
+            logging.warning(f"{get_time()} Several counter rows of policy {key[0]} rule {key[1]}. " + \
+                            ("Summing them." if is_summed else "Taking the first."))
+            if not is_summed :
+                continue
+        counters[key] = counters.get(key, 0) + row["COUNT"]
+
+    return counters
+
+def find_acl_counter_key(counters: dict, policy_name, rule_name) :
+    """
+    Find a rule in parsed ACL counters. Names are matched case insensitively, and policy_name may be a part of the
+    policy name in the table. The first policy that matches is taken.
+    Input : counters - Dictionary returned by _parse_acl_counters() / get_acl_counter_snapshot()
+    Return value : Key (policy_name, rule_name) of counters, None if no policy matches.
+                   Raises an exception if the policy has no such rule.
+    """
+    policy_name, rule_name = policy_name.lower(), rule_name.lower()
+    policies = [policy for policy, _ in counters if policy_name in policy.lower()]
+    if len(policies) == 0 :
+        return None
+    for policy, rule in counters :
+        if policy == policies[0] and rule.lower() == rule_name :
+            return (policy, rule)
+    raise Exception (f"Unrecognized Rule name: {rule_name}")
+
+def _parse_show_counter(cli_response, policy_name, rule_name, template_name = "show acl interface detail", is_summed = False) :
     """
         Parse input from DUT for acl show command, and return the counter value
         Input : cli_response - String multi line of the DUT response
-                policy_name  - String 
+                policy_name  - String. Matched as in find_acl_counter_key()
                 rule_name    - String
-        Return value : Integer counter of the rule_name acl counter
-
-        Hidden assumption : There are only two rules in the acl policy : 
-                            Regular rule (such as "r1"), and a default rule (name always "rule-default")
-    """
-    normalised_input = [line.lstrip() for line in cli_response.lower().splitlines()]
-    for i, line in enumerate(normalised_input) :
-        if policy_name in line :
-            # The Rule name is the third word from the end of the line
-            first_rule  = (normalised_input[i].split())[-3]
-            second_rule = (normalised_input[i+1].split())[-3]
-            if rule_name == first_rule :
-                return int((normalised_input[i].split())[-1])
-            if rule_name == second_rule :
-                return int((normalised_input[i+1].split())[-1])
-            else :
-                raise Exception (f"Unrecognized Rule name: {rule_name}")
+                template_name - cli_table template of the command
+                is_summed - Sum the rows of the same policy and rule, see _parse_acl_counters()
+        Return value : Integer counter of the rule_name acl counter, None if policy_name is not in the response
+    """
+    counters = _parse_acl_counters(cli_response, template_name, is_summed)
+    key = find_acl_counter_key(counters, policy_name, rule_name)
+    return counters[key] if key != None else None
+
+def _get_acl_show_command(interface_type, interface) -> str :
+    """
+    Input : interface_type - Enumeration InterfaceType, values "CTRL_PLANE", "X_ETH"
+            interface - Physical interface such as "4". Not used for CTRL_PLANE.
+    Return value : CLI command String that shows the ACL counters
+    """
+    return get_template(_get_acl_table_template(interface_type)).get_command(interface = interface)
+
+def _get_acl_table_template(interface_type) -> str :
+    """
+    Input : interface_type - Enumeration InterfaceType, values "CTRL_PLANE", "X_ETH"
+    Return value : Name of the cli_table template of the ACL counters table
+    """
+    if interface_type is InterfaceType.CTRL_PLANE :
+        return "show ctrl-plane acl detail"
+    elif interface_type is InterfaceType.X_ETH:
+        return "show acl interface detail"
+    else :
+        raise Exception (f"Unrecognized interface type: {interface_type}")
 
 def _reset_serial_server_connection(device_number, device_type) :
     """
@@ -158,6 +254,191 @@ def _reset_serial_server_connection(device_number, device_type) :
     process = subprocess.Popen(command.split(), stdout=subprocess.PIPE)
     output, error = process.communicate()
 
+def _open_onl_serial_session(device_number, device_type, timeout = 20) :
+    """
+    Open a pexpect session to the ONL shell through the serial server, and login if needed.
+    Another client connected to the serial server is disconnected first.
+    Input : device_number - Such as 3010
+            device_type - Applicable values : 'dl', 'ec', 'al', 'uf'
+            timeout - Default expect timeout of the session, in seconds
+    Return value : Spawned pexpect process (cli_comm), at the ONL prompt
+    """
+    # Disconnect other client if connected to serial server 
+    _reset_serial_server_connection(device_number, device_type)
+
+    # Telnet into the machine using the serial server
+    logging.info(f"{get_time()} Opening ONL CLI connection to device number: {device_number}, device type: {device_type}")
+    dut_cmd = "s"
+    command = _get_dut_alias_to_cmd(device_number, device_type, dut_cmd)
+    cli_comm = pexpect.spawn(command, encoding='utf-8', timeout=timeout, codec_errors='ignore')
+
+    try :
+        # From the serial server banner, through the login or the DUT CLI, to the ONL prompt
+        console = ConsoleStateMachine(cli_comm, device_number)
+        console.reach(CONSOLE_ONL)
+    except Exception :
+        cli_comm.close()
+        raise
+
+    return cli_comm
+
+# ***************************************************************************************
+# Console state machine
+# ***************************************************************************************
+# Console states. The shell states (CONSOLE_ONL, CONSOLE_CPM) are the targets of ConsoleStateMachine.reach()
+CONSOLE_UNKNOWN      = "UNKNOWN"
+CONSOLE_CONNECTED    = "CONNECTED"
+CONSOLE_LOGIN        = "LOGIN"
+CONSOLE_PASSWORD     = "PASSWORD"
+CONSOLE_HOST_KEY     = "HOST_KEY"
+CONSOLE_SSC_PASSWORD = "SSC_PASSWORD"
+CONSOLE_ONL          = "ONL"
+CONSOLE_CPM          = "CPM"
+
+# Console output (input symbol of the state machine) -> the console state it shows
+CONSOLE_SYMBOL_STATES = {
+    "ESCAPE"       : CONSOLE_CONNECTED,
+    "LOGIN"        : CONSOLE_LOGIN,
+    "PASSWORD"     : CONSOLE_PASSWORD,
+    "HOST_KEY"     : CONSOLE_HOST_KEY,
+    "SSC_PASSWORD" : CONSOLE_SSC_PASSWORD,
+    "ONL"          : CONSOLE_ONL,
+    "CPM"          : CONSOLE_CPM,
+}
+
+# (console state, target shell) -> line to send. A state that is not listed, for a target, is the target.
+CONSOLE_ROUTES = {
+    (CONSOLE_CONNECTED,    CONSOLE_ONL) : '',
+    (CONSOLE_CONNECTED,    CONSOLE_CPM) : '',
+    (CONSOLE_LOGIN,        CONSOLE_ONL) : 'root',
+    (CONSOLE_LOGIN,        CONSOLE_CPM) : 'root',
+    (CONSOLE_PASSWORD,     CONSOLE_ONL) : 'root',
+    (CONSOLE_PASSWORD,     CONSOLE_CPM) : 'root',
+    (CONSOLE_HOST_KEY,     CONSOLE_ONL) : 'no',
+    (CONSOLE_HOST_KEY,     CONSOLE_CPM) : 'yes',
+    (CONSOLE_SSC_PASSWORD, CONSOLE_ONL) : 'admin',
+    (CONSOLE_SSC_PASSWORD, CONSOLE_CPM) : 'admin',
+    (CONSOLE_ONL,          CONSOLE_CPM) : 'ssc',
+    (CONSOLE_CPM,          CONSOLE_ONL) : 'exit',
+}
+
+# Seconds to wait for the console, after a line was sent in a state. Other states use the cli_comm timeout.
+# The DUT CLI login ("ssc" password) waits for the swapp.
+CONSOLE_STATE_TIMEOUTS = {CONSOLE_SSC_PASSWORD : 300}
+
+# Empty lines sent to a silent console, before giving up
+CONSOLE_MAX_WAKEUPS = 3
+
+class ConsoleStateMachine(object):
+    """
+    Drives a DUT console to a target shell (ONL or DUT CLI) from any state, such as the serial server banner,
+    the login prompt, or the other shell. The transitions are the FSM tables, built from CONSOLE_SYMBOL_STATES and
+    CONSOLE_ROUTES : each console output moves to the state it shows, and sends the one line that leads to the target.
+    Every transition is timed, in self.transitions.
+    Input : cli_comm - Spawned pexpect process of the console
+            device_number - Such as '3010'
+            initial_state - Console state, if known. Such as CONSOLE_ONL for a session at the ONL prompt.
+    """
+    def __init__(self, cli_comm, device_number, initial_state=CONSOLE_UNKNOWN, state_timeouts=None):
+        self.cli_comm = cli_comm
+        self.device_number = device_number
+        self.state_timeouts = state_timeouts if state_timeouts != None else CONSOLE_STATE_TIMEOUTS
+        # List of (from state, input symbol, to state, seconds)
+        self.transitions = []
+
+        symbols = list(CONSOLE_SYMBOL_STATES) + ["TIMEOUT", "EOF"]
+        self.symbols = symbols
+        self.patterns = [re.compile(r"Escape character is"),
+                         LOGIN_PROMPT_RE,
+                         re.compile(r"Password: ?$"),
+                         re.compile(r"Are you sure you want to continue connecting"),
+                         re.compile(r"password: ?$"),
+                         ONL_PROMPT_RE,
+                         _cpm_prompt_re(device_number),
+                         pexpect.TIMEOUT,
+                         pexpect.EOF]
+
+        self.fsm = FSM(initial_state, memory = {"target" : None, "wakeups" : 0}, print_transitions = False)
+        states = [CONSOLE_UNKNOWN] + list(CONSOLE_SYMBOL_STATES.values())
+        for symbol, next_state in CONSOLE_SYMBOL_STATES.items() :
+            for state in states :
+                self.fsm.add_transition(symbol, state, self._send_toward_target, next_state)
+        # A console that is idle prints nothing until a line is sent
+        self.fsm.add_transition("TIMEOUT", CONSOLE_UNKNOWN, self._wake_console, CONSOLE_UNKNOWN)
+        self.fsm.add_transition("TIMEOUT", CONSOLE_CONNECTED, self._wake_console, CONSOLE_CONNECTED)
+        self.fsm.set_default_transition(self._raise_console_error, CONSOLE_UNKNOWN)
+
+    @property
+    def current_state(self):
+        return self.fsm.current_state
+
+    def _send_toward_target(self, fsm):
+        line = CONSOLE_ROUTES.get((fsm.next_state, fsm.memory["target"]))
+        if line != None :
+            # Output left from the previous state (such as a second prompt) must not be taken for the next state
+            _drop_pending_output(self.cli_comm)
+            self.cli_comm.sendline(line)
+
+    def _wake_console(self, fsm):
+        fsm.memory["wakeups"] += 1
+        if fsm.memory["wakeups"] > CONSOLE_MAX_WAKEUPS :
+            self._raise_console_error(fsm)
+        self.cli_comm.sendline('')
+
+    def _raise_console_error(self, fsm):
+        if fsm.input_symbol == "TIMEOUT" :
+            raise pexpect.exceptions.TIMEOUT(f"Console of {self.device_number} stuck in state {fsm.current_state}")
+        raise pexpect.exceptions.EOF(f"Console of {self.device_number} got {fsm.input_symbol} in state {fsm.current_state}")
+
+    def start(self, target):
+        """
+        Set the target shell. From a known state, the first line is sent at once.
+        """
+        self.fsm.memory["target"] = target
+        self.fsm.memory["wakeups"] = 0
+        line = CONSOLE_ROUTES.get((self.current_state, target))
+        if line != None :
+            _drop_pending_output(self.cli_comm)
+            self.cli_comm.sendline(line)
+
+    def is_done(self) -> bool :
+        return self.current_state == self.fsm.memory["target"]
+
+    def get_timeout(self):
+        return self.state_timeouts.get(self.current_state, -1)
+
+    def process(self, index, seconds):
+        """
+        Process the console output that matched self.patterns[index], after seconds of waiting
+        """
+        prev_state = self.current_state
+        self.fsm.process(self.symbols[index])
+        self.transitions.append((prev_state, self.symbols[index], self.current_state, seconds))
+        logging.debug(f"{get_time()} Console {self.device_number}: {prev_state} -> {self.current_state} in {seconds:.2f} seconds")
+
+    def reach(self, target) -> list :
+        """
+        Drive the console to the target shell
+        Input : target - CONSOLE_ONL or CONSOLE_CPM
+        Return value : List of the transitions (from state, input symbol, to state, seconds) taken
+        """
+        import time
+
+        first = len(self.transitions)
+        self.start(target)
+        while not self.is_done() :
+            start = time.perf_counter()
+            i = _expect_prompt(self.cli_comm, self.patterns, timeout = self.get_timeout())
+            self.process(i, time.perf_counter() - start)
+        logging.info(f"{get_time()} Console {self.device_number} reached {target}: {format_console_transitions(self.transitions[first:])}")
+        return self.transitions[first:]
+
+def format_console_transitions(transitions) -> str :
+    """
+    Return value : String such as "UNKNOWN -> CONNECTED 0.10s, CONNECTED -> ONL 0.05s"
+    """
+    return ", ".join(f"{prev_state} -> {state} {seconds:.2f}s" for prev_state, _, state, seconds in transitions)
+
 # ***************************************************************************************
 # External API functions
 # ***************************************************************************************
@@ -194,42 +475,18 @@ def reset_dut_connections(device_number: str, device_type: str, is_reset_cpm_con
 
 
     logging.info(f"{get_time()} Begin reset_dut_connections")
-
-    # 1. Disconnect other client if connected to serial server 
-    _reset_serial_server_connection(device_number, device_type)
+    is_session_ok = False
 
     try :
-        # 2. Telnet into the machine using the serial server and send "dhclient ma1"
-        logging.info(f"{get_time()} Opening ONL CLI connection to device number: {device_number}, device type: {device_type}")
-        dut_cmd = "s"
-        command = _get_dut_alias_to_cmd(device_number, device_type, dut_cmd)
-        cli_comm = pexpect.spawn(command, encoding='utf-8', timeout=TIMEOUT, codec_errors='ignore')
+        # 1. ONL CLI connection using the serial server. A new connection disconnects other client
+        #    if connected to serial server. An open and responsive connection is reused.
+        cli_comm = CLI_SESSION_POOL.get_onl_session(device_number, device_type, timeout = TIMEOUT)
 
-        # Wait for the password prompt and enter the password
-        logging.info(f"{get_time()} Waiting for Serial server prompt")
-        cli_comm.expect('.*Escape character.*')
-
-        logging.info(f"{get_time()}  send \\n")
-        cli_comm.sendline('')
-
-        logging.info(f"{get_time()} Expecting connection with DUT")
-        i = cli_comm.expect([f'.*{ONL_PROMPT}.*', f'.*{CPM_PROMPT}.*', '.*localhost login:.*'])
-        if i == 0:
-            logging.info(f"{get_time()}  ONL CLI Shell. Doing nothing")
-        elif i == 1:
-            logging.info(f"{get_time()}  DUT CLI Shell. Exiting")
-            cli_comm.sendline('exit')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')
-        elif i == 2:
-            logging.info(f"{get_time()} New CLI shell. Performing logging")
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*Password:.*')
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')            
+        # 2. Send "dhclient ma1"
         logging.info(f"{get_time()} Sending \"dhclient ma1\"")
         cli_comm.sendline('dhclient ma1')
         logging.info(f"{get_time()} Expecting ONL prompt: {ONL_PROMPT}")
-        i = cli_comm.expect([f'.*{ONL_PROMPT}.*', pexpect.TIMEOUT, pexpect.EOF], timeout=300)
+        i = _expect_prompt(cli_comm, [ONL_PROMPT_RE, pexpect.TIMEOUT, pexpect.EOF], timeout=300)
         if i == 0 :
             logging.info(f"{get_time()} Got: {ONL_PROMPT}. Continuing")
         elif i == 1 :
@@ -246,40 +503,32 @@ def reset_dut_connections(device_number: str, device_type: str, is_reset_cpm_con
         if is_reset_cpm_connection == True:
             logging.info(f"{get_time()} Resetting CPM connection (to IP 10.3.XX.1)")
             logging.info(f"{get_time()} Connecting to DUT CLI (using command \"ssc\")")
-            cli_comm.sendline('ssc')
-            cli_comm.expect(['.*Are you sure you want to continue connecting (yes/no)?.*', '.*password:.*'])
-            if i == 0:
-                logging.info(f"{get_time()} First time connection to DUT.")
-                cli_comm.sendline('yes')
-                cli_comm.expect('.*password:.*')
-            logging.info(f"{get_time()} Sending password")
-            cli_comm.sendline('admin')
-            logging.info(f"{get_time()} Expecting CPM prompt: {CPM_PROMPT} with timeout=30")
-            cli_comm.expect([f'.*{CPM_PROMPT}.*'], timeout= 300)
+            console = ConsoleStateMachine(cli_comm, device_number, initial_state = CONSOLE_ONL)
+            console.reach(CONSOLE_CPM)
 
             ping_command = f'ping vrf management 10.3.{device_number[-2:]}.254'
             logging.info(f"{get_time()} Sending ping command: \"{ping_command}\"")
             cli_comm.sendline(f'ping vrf management 10.3.{device_number[-2:]}.254')
             logging.info(f"{get_time()} Expecting end of ping")
-            cli_comm.expect([f'.*rtt min/avg/max/mdev.*', f'.*{CPM_PROMPT}.*'])
+            _expect_prompt(cli_comm, [PING_DONE_RE, _cpm_prompt_re(device_number)])
 
             # Exiting DUT CLI back to ONL, in preparation for the tests 
             logging.info(f"{get_time()} Sending \\n")
             cli_comm.sendline('')
             logging.info(f"{get_time()} Expecting CPM prompt: {CPM_PROMPT}")
-            cli_comm.expect(f'.*{CPM_PROMPT}.*')
-            logging.info(f"{get_time()} Sending exit command")
-            cli_comm.sendline('exit')
-            logging.info(f"{get_time()} Expecting ONL prompt: {ONL_PROMPT}")
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')
+            _expect_prompt(cli_comm, [_cpm_prompt_re(device_number)])
+            logging.info(f"{get_time()} Exiting to ONL prompt: {ONL_PROMPT}")
+            console.reach(CONSOLE_ONL)
+        is_session_ok = True
 
     except pexpect.exceptions.TIMEOUT :
         raise Exception(f"{get_time()} Waiting for CLI response exceeded {TIMEOUT} seconds")
     except pexpect.exceptions.EOF :
         raise Exception(f"{get_time()} pexpect EOF exception")    
     finally:
-        logging.info(f"{get_time()} Closing ONL CLI connection")
-        cli_comm.close()
+        if not is_session_ok :
+            logging.info(f"{get_time()} Closing ONL CLI connection")
+            CLI_SESSION_POOL.invalidate(device_number, ONL_SESSION)
     
     logging.info(f"{get_time()} End reset_dut_connections")
 
@@ -293,37 +542,9 @@ def reboot_dut(device_number, device_type, is_set_install_mode = False):
 
     logging.info(f"{get_time()} Begin set_install_mode_and_reboot_dut")
 
-    # 1. Disconnect other client if connected to serial server 
-    _reset_serial_server_connection(device_number, device_type)
-
     try :
-        # 2. Telnet into the machine using the serial server
-        logging.info(f"{get_time()} Opening ONL CLI connection to device number: {device_number}, device type: {device_type}")
-        dut_cmd = "s"
-        command = _get_dut_alias_to_cmd(device_number, device_type, dut_cmd)                                 
-        cli_comm = pexpect.spawn(command, encoding='utf-8', timeout=TIMEOUT, codec_errors='ignore')
-
-        # Wait for the password prompt and enter the password
-        logging.info(f"{get_time()} Waiting for Serial server prompt")
-        cli_comm.expect('.*Escape character.*')
-
-        logging.info(f"{get_time()} send \\n")
-        cli_comm.sendline('')
-
-        logging.info(f"{get_time()} Expecting connection with DUT")
-        i = cli_comm.expect([f'.*{ONL_PROMPT}.*', f'.*{CPM_PROMPT}.*', '.*localhost login:.*'])
-        if i == 0:
-            logging.info(f"{get_time()} ONL CLI Shell. Doing nothing")
-        elif i == 1:
-            logging.info(f"{get_time()} DUT CLI Shell. Exiting")
-            cli_comm.sendline('exit')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')
-        elif i == 2:
-            logging.info(f"{get_time()} New CLI shell. Performing logging")
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*Password:.*')
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')       
+        # 1. ONL CLI connection using the serial server
+        cli_comm = CLI_SESSION_POOL.get_onl_session(device_number, device_type, timeout = TIMEOUT)
 
         if is_set_install_mode == True :
             # Setting boot mode to install
@@ -332,7 +553,7 @@ def reboot_dut(device_number, device_type, is_set_install_mode = False):
             logging.info(f"{get_time()} Sending \"{command}\"")
             cli_comm.sendline(command)
             logging.info(f"{get_time()} Expecting: \"{expected_response}\"")
-            cli_comm.expect(f'.*{expected_response}.*')
+            _expect_marker(cli_comm, expected_response)
             
         # Rebooting
         command = "/sbin/reboot"
@@ -341,8 +562,9 @@ def reboot_dut(device_number, device_type, is_set_install_mode = False):
     except pexpect.exceptions.TIMEOUT :
         raise Exception(f"{get_time()} Waiting for CLI response exceeded {TIMEOUT} seconds")
     finally:
+        # The DUT sessions do not survive the reboot
         logging.info(f"{get_time()} Closing ONL CLI connection")
-        cli_comm.close()
+        CLI_SESSION_POOL.invalidate(device_number)
 
     logging.info(f"{get_time()} End reset_dut_connections")
 
@@ -355,38 +577,11 @@ def add_dev_machine_ssh_key_to_dut(device_number, device_type):
     cli_comm    = None
 
     logging.info(f"{get_time()} add_dev_machine_ssh_key_to_dut")
-
-    # 1. Disconnect other client if connected to serial server 
-    _reset_serial_server_connection(device_number, device_type)
+    is_session_ok = False
 
     try :
-        # 2. Telnet into the machine using the serial server
-        logging.info(f"{get_time()} Opening ONL CLI connection to device number: {device_number}, device type: {device_type}")
-        dut_cmd = "s"
-        command = _get_dut_alias_to_cmd(device_number, device_type, dut_cmd) 
-        cli_comm = pexpect.spawn(command, encoding='utf-8', timeout=TIMEOUT, codec_errors='ignore')
-
-        # Wait for the password prompt and enter the password
-        logging.info(f"{get_time()} Waiting for Serial server prompt")
-        cli_comm.expect('.*Escape character.*')
-
-        logging.info(f"{get_time()} send \\n")
-        cli_comm.sendline('')
-
-        logging.info(f"{get_time()} Expecting connection with DUT")
-        i = cli_comm.expect([f'.*{ONL_PROMPT}.*', f'.*{CPM_PROMPT}.*', '.*localhost login:.*'])
-        if i == 0:
-            logging.info(f"{get_time()} ONL CLI Shell. Doing nothing")
-        elif i == 1:
-            logging.info(f"{get_time()} DUT CLI Shell. Exiting")
-            cli_comm.sendline('exit')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')
-        elif i == 2:
-            logging.info(f"{get_time()} New CLI shell. Performing logging")
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*Password:.*')
-            cli_comm.sendline('root')
-            cli_comm.expect(f'.*{ONL_PROMPT}.*')       
+        # 1. ONL CLI connection using the serial server
+        cli_comm = CLI_SESSION_POOL.get_onl_session(device_number, device_type, timeout = TIMEOUT)
 
         # Creating ~/.ssh directory
         command = "mkdir ~/.ssh"
@@ -394,7 +589,7 @@ def add_dev_machine_ssh_key_to_dut(device_number, device_type):
         logging.info(f"{get_time()} Sending \"{command}\"")
         cli_comm.sendline(command)
         logging.info(f"{get_time()} Expecting: \"{expected_response}\"")
-        cli_comm.expect(f'.*{expected_response}.*')
+        _expect_prompt(cli_comm, [ONL_PROMPT_RE])
 
         # Creating ~/.ssh/authorized_keys file
         command = 'echo "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABgQDEX/adijlM2zGZpqeJ9mz5J4RYW0k3LQWISW/lN31NVfZEY8LxghsiGWnsJfFMWRUP/n1NE72mfSZOozFv/WmLtSaRLdzBlpK1cg7nMuQvE7zL9/Y9WdzgSKEs6Khx/8tFPbjr0VyEmM+aSFGuc8xSyaTYCcNcfvN/rbmVFWaS379FQRFXyFrlZZ5ynrP1gCKblLK3m1cNUq/B7NXWyuoQHDLvGHe+B5UnviUQRl8xmTUuq/VVccwGvNNcuvXYxnE8GE5zM/mKhPDChgusy5Km3W33nK2jGTleaZWAIVPk4FSJyCTI/2F/4AOGbjp4b5iBkRtesQFAQtDN6hkV9iAtLVpydx3rMUArgFcuwo06VK7BN3lOfXy7h+0E1f/q/7rRHVSD2O0jCk/36LmMbllqqbsScAHuUZfxX1fJnd7gCC2XedMU/3WUJ62O3L8LiPQP9XhBUpSUgKoBeXxIHgg4QRiqm/I+gXCsUVSVf9nN+DfKuvZcRzMSbK3ZDByUjZs= sharonf@DEV107" > ~/.ssh/authorized_keys'
@@ -402,12 +597,14 @@ def add_dev_machine_ssh_key_to_dut(device_number, device_type):
         logging.info(f"{get_time()} Sending \"{command}\"")
         cli_comm.sendline(command)
         logging.info(f"{get_time()} Expecting: \"{expected_response}\"")
-        cli_comm.expect(f'.*{expected_response}.*')
+        _expect_prompt(cli_comm, [ONL_PROMPT_RE])
+        is_session_ok = True
     except pexpect.exceptions.TIMEOUT :
         raise Exception(f"{get_time()} Waiting for CLI response exceeded {TIMEOUT} seconds")
     finally:
-        logging.info(f"{get_time()} Closing ONL CLI connection")
-        cli_comm.close()
+        if not is_session_ok :
+            logging.info(f"{get_time()} Closing ONL CLI connection")
+            CLI_SESSION_POOL.invalidate(device_number, ONL_SESSION)
 
 def open_cpm_session(device_number):
     """
@@ -431,13 +628,13 @@ def open_cpm_session(device_number):
 
         # Wait for the password prompt and enter the password
         logging.info(f"{get_time()} Waiting for password prompt")
-        cli_comm.expect('password:')
+        _expect_marker(cli_comm, 'password:')
 
         logging.info(f"{get_time()} send password")
         cli_comm.sendline('admin')
 
         logging.info(f"{get_time()} Expecting CPM prompt: {CPM_PROMPT}")
-        cli_comm.expect(f'.*{CPM_PROMPT}.*')
+        _expect_prompt(cli_comm, [_cpm_prompt_re(device_number)])
     except pexpect.exceptions.TIMEOUT :
         logging.error(f"{get_time()} Cannot connect to device {device_number}")
 
@@ -452,7 +649,29 @@ def close_cpm_session(cli_comm):
     logging.info(f"{get_time()} Closing CLI connection")
     cli_comm.close()
 
-def get_show_counter (cli_comm, interface, interface_type, policy_name, rule_name) :
+def execute_cli_command (cli_comm, command: str, timeout = -1, prompt_re = None) -> str :
+    """
+    Send a command to the CLI, and wait until its output is complete - that is, until the prompt is printed after it
+    Input : cli_comm - Spawned pexpect process, at the prompt (such as returned by open_cpm_session())
+            command - CLI command String
+            timeout - Seconds. -1 for the cli_comm default timeout
+            prompt_re - Compiled prompt pattern, anchored to the end of the output. By default, the DUT CLI prompt.
+    Return value : String, the full output of the command, without the echoed command and the prompt.
+                   Lines end with "\\n".
+    """
+    if prompt_re == None :
+        prompt_re = _cpm_prompt_re()
+
+    _drop_pending_output(cli_comm)
+    logging.debug(f"{get_time()} Send command: \"{command}\"")
+    cli_comm.sendline(command)
+    _expect_prompt(cli_comm, [prompt_re], timeout)
+
+    # The output starts with the echoed command line
+    output = cli_comm.before.replace('\r\n', '\n')
+    return output.partition('\n')[2]
+
+def get_show_counter (cli_comm, interface, interface_type, policy_name, rule_name, is_summed = False) :
     """
     Reading ACL counter according to interface, policy name and action
     Input : cli_comm - 
@@ -460,51 +679,196 @@ def get_show_counter (cli_comm, interface, interface_type, policy_name, rule_nam
             interface_type - Enumeration InterfaceType, values "CTRL_PLANE", "X_ETH"
             policy_name - String
             rule_name : String
-    Caveat :Sending each command twice due to bug in acl show function
+            is_summed - Sum the rows of the same policy and rule, see _parse_acl_counters()
     """
     logging.info(f"{get_time()} Policy : {policy_name}, Rule name: {rule_name} on type: {interface_type}, interface {interface}")
-    if interface_type is InterfaceType.CTRL_PLANE :
-        command = f'show ctrl-plane acl detail'
-        expect_string = '.*MODE.*'
-    elif interface_type is InterfaceType.X_ETH:
-        command = f'show acl interface detail x-eth0/0/{interface}'
-        expect_string = '.*INTERFACE.*'
-    else :
-        raise Exception (f"Unrecognized interface type: {interface_type}")
-
-    # First counter read. Disregard results
-    logging.info(f"{get_time()} Send command 1st: \"{command}\"")
-    cli_comm.sendline(command)
-    logging.info(f"{get_time()} Expecting: {expect_string}")
-    cli_comm.expect(expect_string)
-    response = cli_comm.after
+    command = _get_acl_show_command(interface_type, interface)
 
-    # Second counter read. This is the actual value. Need to read twice due to bug
-    logging.info(f"{get_time()} Send command 2nd: \"{command}\"")
-    cli_comm.sendline(command)
-    logging.info(f"{get_time()} Expecting: {expect_string}")
-    cli_comm.expect(expect_string)
-    response = cli_comm.after
+    # A single read - the command output is complete once the CLI prompt is printed after it
+    logging.info(f"{get_time()} Send command: \"{command}\"")
+    response = execute_cli_command(cli_comm, command)
 
-    counter = _parse_show_counter(response, policy_name, rule_name)
+    counter = _parse_show_counter(response, policy_name, rule_name, _get_acl_table_template(interface_type), is_summed)
     logging.info(f"{get_time()} Counter value: {counter}")
 
     return counter
 
+def get_acl_counter_snapshot (cli_comm, interface_type, interface, is_summed = False) -> dict :
+    """
+    Read all the ACL counters of an interface (or of the ctrl-plane) in one command
+    Input : cli_comm - 
+            interface - Physical interface such as "4"
+            interface_type - Enumeration InterfaceType, values "CTRL_PLANE", "X_ETH"
+            is_summed - Sum the rows of the same policy and rule, see _parse_acl_counters()
+    Return value : Dictionary {(policy_name, rule_name) : Integer counter}. See find_acl_counter_key() to look up a rule.
+    """
+    command = _get_acl_show_command(interface_type, interface)
+    logging.info(f"{get_time()} Send command: \"{command}\"")
+    snapshot = _parse_acl_counters(execute_cli_command(cli_comm, command), _get_acl_table_template(interface_type), is_summed)
+    logging.info(f"{get_time()} ACL counters: {snapshot}")
+    return snapshot
+
+def diff_acl_counter_snapshots (prev_snapshot: dict, curr_snapshot: dict) -> dict :
+    """
+    Input : prev_snapshot, curr_snapshot - Snapshots returned by get_acl_counter_snapshot()
+    Return value : Dictionary {(policy_name, rule_name) : Integer delta} of all the rules in curr_snapshot.
+                   A rule that is not in prev_snapshot counts from 0.
+    """
+    return {key : counter - prev_snapshot.get(key, 0) for key, counter in curr_snapshot.items()}
+
+def get_acl_counter_deltas (cli_comm, interface_type, interface, prev_snapshot: dict, is_summed = False) -> dict :
+    """
+    Read the ACL counters again, and return the deltas of all the rules since prev_snapshot, in one command
+    Input : is_summed - As in the get_acl_counter_snapshot() call of prev_snapshot
+    Return value : Dictionary {(policy_name, rule_name) : Integer delta}. See diff_acl_counter_snapshots()
+    """
+    curr_snapshot = get_acl_counter_snapshot(cli_comm, interface_type, interface, is_summed)
+    return diff_acl_counter_snapshots(prev_snapshot, curr_snapshot)
+
+# ***************************************************************************************
+# CLI session pool
+# ***************************************************************************************
+def is_session_alive (cli_comm, prompt_re, timeout = SESSION_PROBE_TIMEOUT) -> bool :
+    """
+    Check that a session is responsive : send an empty line, and expect the prompt
+    Input : cli_comm - Spawned pexpect process
+            prompt_re - Compiled prompt pattern, such as ONL_PROMPT_RE
+    Return value : True if the prompt was received within timeout seconds
+    """
+    if cli_comm == None or not cli_comm.isalive() :
+        return False
+    try :
+        _drop_pending_output(cli_comm)
+        cli_comm.sendline('')
+        _expect_prompt(cli_comm, [prompt_re], timeout = timeout)
+        _drop_pending_output(cli_comm)
+        return True
+    except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) :
+        return False
+
+class CliSessionPool(object):
+    """
+    Logged in CLI sessions, kept open between operations : one DUT CLI (CPM) session, and one ONL shell session through
+    the serial server, per DUT. So login and banner are paid once, and not on every operation.
+    A kept session is checked with an empty line / prompt probe before it is returned, and reopened if it does not respond.
+    Input : open_cpm - Function open_cpm(device_number), returns a cli_comm at the DUT CLI prompt
+            open_onl - Function open_onl(device_number, device_type, timeout), returns a cli_comm at the ONL prompt
+            probe_timeout - Seconds to wait for the prompt in the probe
+    """
+    def __init__(self, open_cpm=None, open_onl=None, probe_timeout=SESSION_PROBE_TIMEOUT):
+        self.open_cpm = open_cpm if open_cpm != None else open_cpm_session
+        self.open_onl = open_onl if open_onl != None else _open_onl_serial_session
+        self.probe_timeout = probe_timeout
+        # (session kind, device number) -> cli_comm
+        self.sessions = {}
+        self.num_of_opens = 0
+
+    def get_cpm_session(self, device_number):
+        """
+        Return value : cli_comm at the DUT CLI prompt
+        """
+        return self._get_session(CPM_SESSION, device_number, _cpm_prompt_re(device_number),
+                                 lambda : self.open_cpm(device_number))
+
+    def get_onl_session(self, device_number, device_type, timeout = 20):
+        """
+        Input : timeout - Default expect timeout of the returned session, in seconds
+        Return value : cli_comm at the ONL prompt
+        """
+        cli_comm = self._get_session(ONL_SESSION, device_number, ONL_PROMPT_RE,
+                                     lambda : self.open_onl(device_number, device_type, timeout))
+        cli_comm.timeout = timeout
+        return cli_comm
+
+    def _get_session(self, kind, device_number, prompt_re, open_session):
+        key = (kind, device_number)
+        cli_comm = self.sessions.get(key)
+        if cli_comm != None :
+            if is_session_alive(cli_comm, prompt_re, self.probe_timeout) :
+                logging.debug(f"{get_time()} Reusing {kind} session of device {device_number}")
+                return cli_comm
+            logging.info(f"{get_time()} The {kind} session of device {device_number} is not responsive. Reconnecting")
+            self.invalidate(device_number, kind)
+
+        cli_comm = open_session()
+        if not is_session_alive(cli_comm, prompt_re, self.probe_timeout) :
+            if cli_comm != None :
+                cli_comm.close()
+            raise Exception (f"{get_time()} Cannot open {kind} session to device {device_number}")
+        self.num_of_opens += 1
+        self.sessions[key] = cli_comm
+        return cli_comm
+
+    @contextlib.contextmanager
+    def lease_cpm_session(self, device_number):
+        """
+        Lease the DUT CLI session for a block, such as a test module. The session is checked when it is returned,
+        and closed if it does not respond, so a half-open session is not handed to the next lease.
+        Usage : with pool.lease_cpm_session("3010") as cli_comm : ...
+        """
+        cli_comm = self.get_cpm_session(device_number)
+        try :
+            yield cli_comm
+        finally :
+            self._release(CPM_SESSION, device_number, _cpm_prompt_re(device_number), cli_comm)
+
+    def _release(self, kind, device_number, prompt_re, cli_comm):
+        if self.sessions.get((kind, device_number)) is not cli_comm :
+            # Already replaced or invalidated during the lease
+            cli_comm.close()
+        elif not is_session_alive(cli_comm, prompt_re, self.probe_timeout) :
+            logging.info(f"{get_time()} The returned {kind} session of device {device_number} is not responsive. Closing")
+            self.invalidate(device_number, kind)
+
+    def invalidate(self, device_number, kind = None):
+        """
+        Close the kept sessions of a DUT, such as after an error or a reboot. The next get reopens them.
+        Input : kind - CPM_SESSION or ONL_SESSION. None for both.
+        """
+        for key in [key for key in self.sessions if key[1] == device_number and kind in [None, key[0]]] :
+            cli_comm = self.sessions.pop(key)
+            try :
+                cli_comm.close()
+            except Exception as error :
+                logging.debug(f"{get_time()} Closing {key[0]} session of device {device_number}: {error}")
+
+    def close_all(self):
+        for device_number in {device_number for _, device_number in self.sessions} :
+            self.invalidate(device_number)
+
+CLI_SESSION_POOL = CliSessionPool()
+atexit.register(CLI_SESSION_POOL.close_all)
+
+def get_cpm_session(device_number) :
+    """
+    DUT CLI session of the default pool. Opened on first use, and kept open. Do not close it.
+    Input : Device number, such as 3010
+    Return value : Spawned pexpect process (cli_comm), at the DUT CLI prompt
+    """
+    return CLI_SESSION_POOL.get_cpm_session(device_number)
+
+def lease_cpm_session(device_number) :
+    """
+    Lease the DUT CLI session of the default pool for a block. See CliSessionPool.lease_cpm_session()
+    Usage : with lease_cpm_session("3010") as cli_comm : ...
+    """
+    return CLI_SESSION_POOL.lease_cpm_session(device_number)
+
+def get_onl_session(device_number, device_type, timeout = 20) :
+    """
+    ONL shell session (through the serial server) of the default pool. Opened on first use, and kept open. Do not close it.
+    Return value : Spawned pexpect process (cli_comm), at the ONL prompt
+    """
+    return CLI_SESSION_POOL.get_onl_session(device_number, device_type, timeout)
+
 # ***************************************************************************************
 # UT
 # ***************************************************************************************
 def _print_acl_interface_details(cli_comm, interface_number) :
     """show acl interface detail x-eth0/0/1"""
-    command = f'show acl interface detail x-eth0/0/{str(interface_number)}'
+    command = _get_acl_show_command(InterfaceType.X_ETH, interface_number)
     logging.info(f"{get_time()} Send command: \"{command}\"")
-    cli_comm.sendline(command)
-
-    logging.info("{get_time()} Expecting: \"INTERFACE\"")
-    cli_comm.expect('.*INTERFACE.*')
-
-    logging.info("{get_time()} Received results")
-    print(cli_comm.after)
+    print(execute_cli_command(cli_comm, command))
 
 def _test_acl_show_counter() :
    # Command :
@@ -535,6 +899,302 @@ def _test_acl_show_counter() :
     counter = _parse_show_counter(show_acl_ctrl_plane_detail, "canary_pol_deny_src_ip", "rule-default")
     print (counter)
 
+def _test_acl_counter_snapshot() :
+    """
+    Verify parsing of tables with several policies of any number of rules, and counter deltas
+    """
+    show_acl_ctrl_plane_detail_prev = """
+                                                            HIT
+        MODE         POL                     RULE          ACTION  COUNT
+        ------------------------------------------------------------------
+        egress       canary_pol_deny_src_ip  r1            deny    40
+                                             r2            deny    0
+                                             r3            permit  7
+                                             rule-default  permit  317
+        nni-ingress  pol_ipv4                r1            permit  5
+                                             rule-default  deny    2
+    """
+    show_acl_ctrl_plane_detail_curr = """
+                                                            HIT
+        MODE         POL                     RULE          ACTION  COUNT
+        ------------------------------------------------------------------
+        egress       canary_pol_deny_src_ip  r1            deny    72
+                                             r2            deny    0
+                                             r3            permit  7
+                                             rule-default  permit  320
+        nni-ingress  pol_ipv4                r1            permit  5
+                                             r9            permit  1
+                                             rule-default  deny    2
+    """
+    prev_snapshot = _parse_acl_counters(show_acl_ctrl_plane_detail_prev)
+    assert prev_snapshot == {("canary_pol_deny_src_ip", "r1") : 40, ("canary_pol_deny_src_ip", "r2") : 0,
+                             ("canary_pol_deny_src_ip", "r3") : 7, ("canary_pol_deny_src_ip", "rule-default") : 317,
+                             ("pol_ipv4", "r1") : 5, ("pol_ipv4", "rule-default") : 2}
+    assert _parse_show_counter(show_acl_ctrl_plane_detail_prev, "canary_pol_deny_src_ip", "r3") == 7
+    assert _parse_show_counter(show_acl_ctrl_plane_detail_prev, "pol_ipv6", "r1") == None
+    # Names are matched case insensitively, and by a part of the policy name - The first matching policy is taken
+    assert _parse_show_counter(show_acl_ctrl_plane_detail_prev, "CANARY_POL", "R3") == 7
+    assert _parse_show_counter(show_acl_ctrl_plane_detail_prev, "pol_", "rule-default") == 317
+    try :
+        _parse_show_counter(show_acl_ctrl_plane_detail_prev, "pol_ipv4", "r2")
+        assert False
+    except Exception as error :
+        assert "Unrecognized Rule name" in str(error)
+
+    # A policy attached in both directions - The first row, unless summing is requested
+    show_acl_ifc_detail_both_directions = """
+                                                                    HIT
+        INTERFACE   DIR  POL                     RULE          ACTION  COUNT
+        ----------------------------------------------------------------------
+        x-eth0/0/1  in   canary_pol_deny_src_ip  r1            deny    20
+                                                 rule-default  permit  30
+        x-eth0/0/1  out  canary_pol_deny_src_ip  r1            deny    4
+                                                 rule-default  permit  5
+    """
+    assert _parse_show_counter(show_acl_ifc_detail_both_directions, "canary_pol_deny_src_ip", "r1") == 20
+    assert _parse_show_counter(show_acl_ifc_detail_both_directions, "canary_pol_deny_src_ip", "r1", is_summed = True) == 24
+
+    deltas = diff_acl_counter_snapshots(prev_snapshot, _parse_acl_counters(show_acl_ctrl_plane_detail_curr))
+    assert deltas[("canary_pol_deny_src_ip", "r1")] == 32
+    assert deltas[("canary_pol_deny_src_ip", "rule-default")] == 3
+    assert deltas[("pol_ipv4", "r9")] == 1
+    assert sum(deltas.values()) == 36
+
+    logging.info(f"{get_time()} _test_acl_counter_snapshot passed")
+
+def _create_show_acl_output(num_of_interfaces, prompt = "R3010[2023-03-30-18:02:14]# ") -> str :
+    """
+    Output of "show acl interface detail" for num_of_interfaces interfaces, ending with the prompt.
+    Lines end with "\\n" - printed through a pty (see _spawn_output()), they end with "\\r\\n" like the CLI lines.
+    """
+    lines = ["show acl interface detail",
+             "                                                            HIT",
+             "INTERFACE   DIR  POL                     RULE          ACTION  COUNT",
+             "----------------------------------------------------------------------"]
+    for i in range(num_of_interfaces) :
+        lines.append(f"{f'x-eth0/0/{i}':<12}in   {f'pol_{i}':<24}r1            deny    {i}")
+        lines.append(f"{'':<41}rule-default  permit  {i * 10}")
+    return "\n".join(lines) + "\n" + prompt
+
+def _spawn_output(output: str) :
+    """
+    Spawn a pexpect process that prints output, as a stand-in for a CLI session
+    """
+    import tempfile
+
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f :
+        f.write(output)
+    return pexpect.spawn('cat', [f.name], encoding='utf-8', timeout=600, codec_errors='ignore')
+
+def _test_prompt_match() :
+    """
+    Verify that the anchored prompt waits for the complete output, unlike the '.*INTERFACE.*' pattern
+    """
+    output = _create_show_acl_output(50)
+
+    cli_comm = _spawn_output(output)
+    cli_comm.expect('.*INTERFACE.*')
+    assert "pol_49" not in cli_comm.after
+    cli_comm.close()
+
+    cli_comm = _spawn_output(output)
+    assert _expect_prompt(cli_comm, [ONL_PROMPT_RE, _cpm_prompt_re("3010"), LOGIN_PROMPT_RE]) == 1
+    assert _parse_show_counter(cli_comm.before, "pol_49", "rule-default") == 490
+    cli_comm.close()
+
+    # Another device prompt does not match
+    cli_comm = _spawn_output(output)
+    assert _expect_prompt(cli_comm, [_cpm_prompt_re("3054"), pexpect.EOF]) == 1
+    cli_comm.close()
+
+    cli_comm = _spawn_output("Trying 10.1.10.253...\nEscape character is '^]'.\n\nlocalhost login: ")
+    assert _expect_marker(cli_comm, 'Escape character') == 0
+    assert _expect_prompt(cli_comm, [ONL_PROMPT_RE, _cpm_prompt_re("3010"), LOGIN_PROMPT_RE]) == 2
+    cli_comm.close()
+
+    logging.info(f"{get_time()} _test_prompt_match passed")
+
+# Stand-in for the DUT CLI, run by _spawn_fake_cli(). Prints the table header, then the rows after a delay,
+# like the DUT does for "show acl interface detail". The counters grow on every command.
+_FAKE_CLI_SCRIPT = """
+import sys, time
+PROMPT = "R3010[2023-03-30-18:02:14]# "
+delay = float(sys.argv[1])
+num_of_commands = 0
+sys.stdout.write(PROMPT)
+sys.stdout.flush()
+for line in sys.stdin :
+    command = line.strip()
+    if command == "exit" :
+        break
+    num_of_commands += 1
+    if command.startswith("show acl interface detail") :
+        sys.stdout.write("                                                            HIT\\n")
+        sys.stdout.write("INTERFACE   DIR  POL                     RULE          ACTION  COUNT\\n")
+        sys.stdout.flush()
+        time.sleep(delay)
+        sys.stdout.write("----------------------------------------------------------------------\\n")
+        sys.stdout.write("x-eth0/0/1  in   canary_pol_deny_src_ip  r1            deny    %d\\n" % (num_of_commands * 10))
+        sys.stdout.write("                                         rule-default  permit  %d\\n" % (num_of_commands * 100))
+    sys.stdout.write(PROMPT)
+    sys.stdout.flush()
+"""
+
+def _spawn_fake_cli(delay = 0.1) :
+    import sys
+
+    return pexpect.spawn(sys.executable, ['-c', _FAKE_CLI_SCRIPT, str(delay)], encoding='utf-8', timeout=10, codec_errors='ignore')
+
+def _test_execute_cli_command(num_of_reads = 5, delay = 0.1) :
+    """
+    Verify that a single command returns the complete table, and measure the counter read time
+    """
+    import time
+
+    cli_comm = _spawn_fake_cli(delay)
+    _expect_prompt(cli_comm, [_cpm_prompt_re("3010")])
+
+    output = execute_cli_command(cli_comm, "show acl interface detail x-eth0/0/1")
+    assert output.startswith("   ") and output.endswith("permit  100\n")
+    assert "show acl" not in output and "R3010" not in output
+    assert _parse_show_counter(output, "canary_pol_deny_src_ip", "r1") == 10
+
+    # A pending extra prompt is not taken for the end of the next command
+    cli_comm.sendline("")
+    time.sleep(0.1)
+    assert execute_cli_command(cli_comm, "show acl interface detail x-eth0/0/1").endswith("permit  300\n")
+
+    start = time.perf_counter()
+    for i in range(num_of_reads) :
+        counter = get_show_counter(cli_comm, 1, InterfaceType.X_ETH, "canary_pol_deny_src_ip", "rule-default")
+        assert counter == (i + 4) * 100
+    read_time = (time.perf_counter() - start) / num_of_reads
+
+    cli_comm.sendline("exit")
+    cli_comm.close()
+    logging.info(f"{get_time()} _test_execute_cli_command passed. Counter read {read_time * 1000:.0f} ms, CLI output delay {delay * 1000:.0f} ms")
+
+def _test_console_state_machine() :
+    """
+    Drive the stand-in serial console of console_async between the shells, and verify the round trips
+    """
+    import sys
+    from console_async import _FAKE_CONSOLE_SCRIPT
+
+    cli_comm = pexpect.spawn(sys.executable, ['-c', _FAKE_CONSOLE_SCRIPT, "3010", "0"], encoding='utf-8', timeout=5, codec_errors='ignore')
+    console = ConsoleStateMachine(cli_comm, "3010")
+
+    transitions = console.reach(CONSOLE_ONL)
+    assert [state for _, _, state, _ in transitions] == [CONSOLE_CONNECTED, CONSOLE_LOGIN, CONSOLE_PASSWORD, CONSOLE_ONL]
+    transitions = console.reach(CONSOLE_CPM)
+    assert [state for _, _, state, _ in transitions] == [CONSOLE_SSC_PASSWORD, CONSOLE_CPM]
+    assert execute_cli_command(cli_comm, "show version", prompt_re = _cpm_prompt_re("3010")) == ""
+    transitions = console.reach(CONSOLE_ONL)
+    assert [state for _, _, state, _ in transitions] == [CONSOLE_ONL]
+    assert console.reach(CONSOLE_ONL) == []
+
+    # A session that is known to be at the DUT CLI
+    console = ConsoleStateMachine(cli_comm, "3010", initial_state = CONSOLE_ONL)
+    assert [state for _, _, state, _ in console.reach(CONSOLE_CPM)] == [CONSOLE_SSC_PASSWORD, CONSOLE_CPM]
+
+    cli_comm.close()
+    logging.info(f"{get_time()} _test_console_state_machine passed")
+
+def _test_session_pool(num_of_gets = 20) :
+    """
+    Verify that sessions are kept and reused, and reopened when they exit or hang.
+    The DUT CLI is the fake CLI, and the ONL shell is a local bash with the ONL prompt.
+    """
+    import time
+    import signal
+
+    def open_onl(device_number, device_type, timeout) :
+        cli_comm = pexpect.spawn('bash', ['--norc', '--noprofile'], env = {"PS1" : "root@localhost:~# ", "PATH" : "/bin:/usr/bin"},
+                                 encoding='utf-8', timeout=timeout, codec_errors='ignore')
+        _expect_prompt(cli_comm, [ONL_PROMPT_RE])
+        return cli_comm
+
+    def open_cpm(device_number) :
+        # Login delay of the real session is not simulated - The reuse saving is larger on a DUT
+        cli_comm = _spawn_fake_cli(delay = 0)
+        _expect_prompt(cli_comm, [_cpm_prompt_re(device_number)])
+        return cli_comm
+
+    pool = CliSessionPool(open_cpm = open_cpm, open_onl = open_onl, probe_timeout = 0.5)
+
+    cli_comm = pool.get_cpm_session("3010")
+    start = time.perf_counter()
+    for i in range(num_of_gets) :
+        assert pool.get_cpm_session("3010") is cli_comm
+    reuse_time = (time.perf_counter() - start) / num_of_gets
+    assert pool.num_of_opens == 1
+    output = execute_cli_command(cli_comm, "show acl interface detail x-eth0/0/1")
+    assert _parse_show_counter(output, "canary_pol_deny_src_ip", "r1") > 0
+
+    # The session exited - Reopened
+    cli_comm.sendline("exit")
+    cli_comm.expect(pexpect.EOF)
+    assert pool.get_cpm_session("3010") is not cli_comm
+    assert pool.num_of_opens == 2
+
+    onl_comm = pool.get_onl_session("3010", "dl", timeout = 5)
+    assert pool.get_onl_session("3010", "dl") is onl_comm
+    assert execute_cli_command(onl_comm, "echo hello", prompt_re = ONL_PROMPT_RE) == "hello\n"
+
+    # The session hangs - Reopened
+    onl_comm.sendline("sleep 30")
+    assert pool.get_onl_session("3010", "dl") is not onl_comm
+    assert not onl_comm.isalive()
+    assert pool.num_of_opens == 4
+
+    # A leased session is checked when it is returned - Kept if it responds, closed if it hangs
+    cli_comm = pool.get_cpm_session("3010")
+    with pool.lease_cpm_session("3010") as leased_comm :
+        assert leased_comm is cli_comm
+    assert pool.sessions[(CPM_SESSION, "3010")] is cli_comm
+    try :
+        with pool.lease_cpm_session("3010") as leased_comm :
+            # The CLI stops responding in a failed test
+            leased_comm.kill(signal.SIGSTOP)
+            raise ValueError("Failed test")
+    except ValueError :
+        pass
+    assert (CPM_SESSION, "3010") not in pool.sessions and not leased_comm.isalive()
+    assert pool.get_cpm_session("3010") is not leased_comm
+    assert pool.num_of_opens == 5
+
+    pool.invalidate("3010", ONL_SESSION)
+    assert list(pool.sessions) == [(CPM_SESSION, "3010")]
+    pool.close_all()
+    assert pool.sessions == {}
+
+    logging.info(f"{get_time()} _test_session_pool passed. Getting a kept session (with probe) {reuse_time * 1000:.1f} ms")
+
+def _benchmark_prompt_match(num_of_interfaces = 500) :
+    """
+    Wait for the prompt at the end of a large "show" output, with the '.*R3010.*' pattern
+    (whole output rescanned on every read) and with the anchored, windowed prompt
+    """
+    import time
+
+    output = _create_show_acl_output(num_of_interfaces)
+    logging.info(f"{get_time()} Output of {len(output) / 1e6:.1f} MB")
+
+    cli_comm = _spawn_output(output)
+    start = time.perf_counter()
+    cli_comm.expect('.*R3010.*')
+    legacy_time = time.perf_counter() - start
+    cli_comm.close()
+
+    cli_comm = _spawn_output(output)
+    start = time.perf_counter()
+    _expect_prompt(cli_comm, [_cpm_prompt_re("3010")])
+    anchored_time = time.perf_counter() - start
+    assert f"pol_{num_of_interfaces - 1} " in cli_comm.before
+    cli_comm.close()
+
+    logging.info(f"{get_time()} '.*R3010.*' {legacy_time * 1000:.0f} ms, anchored prompt {anchored_time * 1000:.0f} ms")
+
 def _test_basic() :
     DEVICE_NUMBER = '3010'
     cli_comm = open_cpm_session(DEVICE_NUMBER)
@@ -580,14 +1240,21 @@ def _test_official_builds_manipulation():
 -rwxrwxrwx 1 buildslave sw-all 700857989 Jan  8 00:18 vbox-vdevelop.8.0.0-2023-01-07-22-15-27-l-nl-g9c0dd54c-b481.tar.gz
 -rwxrwxrwx 1 buildslave sw-all        33 Jan  8 00:18 vbox-vdevelop.8.0.0-2023-01-07-22-15-27-l-nl-g9c0dd54c-b481.tar.gz.bsc"""
 
-    # get_official_install_file_name(input, '538')
-    get_official_latest_build(input)
+    assert get_official_install_file_name(input, '538') == "onie-installer-vdevelop.8.0.0-2023-04-02-21-18-22-l-nl-g03b2807b-b538"
+    assert get_official_latest_build(input) == "539"
+    logging.info(f"{get_time()} _test_official_builds_manipulation passed")
 
 if __name__ == "__main__" :
     logging.info(f"{get_time()} Started")
     # _test_get_counters()
     # _test_basic()
     # _test_acl_show_counter()
+    # _test_acl_counter_snapshot()
+    # _test_prompt_match()
+    # _test_execute_cli_command()
+    # _test_session_pool()
+    # _test_console_state_machine()
+    # _benchmark_prompt_match()
     # reset_dut_connections(device_number = '3010', is_reset_cpm_connection = True)
 
     # _test_official_builds_manipulation()
@@ -0,0 +1,248 @@
+"""
+Table driven parsing of CLI outputs.
+A table is described by a TableTemplate, registered once by name. Parsing an output is then a single pass
+over its lines - no per command parsing code.
+
+Two table layouts are supported :
+    TABLE_LAYOUT_DASHED - Column titles line, followed by a dashed line, such as "show acl interface detail" :
+                                                                            HIT
+                                INTERFACE   DIR  POL                     RULE          ACTION  COUNT
+                                ----------------------------------------------------------------------
+                                x-eth0/0/1  in   canary_pol_deny_src_ip  r1            deny    20
+                                                                         rule-default  permit  30
+                          The column boundaries are learned from the titles line above the dashed line, once per layout.
+                          Rows are then cut into columns by the precomputed offsets, so values may be empty,
+                          and values may hold spaces. A value may start up to COLUMN_SLACK characters left of its title.
+    TABLE_LAYOUT_FIELDS - No titles. Each line is split by whitespace into the template columns, the last column
+                          takes the rest of the line. Such as "ls -l".
+"""
+import re
+import bisect
+import logging
+
+logging.basicConfig(
+                    format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                    level=logging.INFO,
+                    datefmt='%H:%M:%S')
+
+TABLE_LAYOUT_DASHED = "dashed"
+TABLE_LAYOUT_FIELDS = "fields"
+
+# A dashed line, under the column titles
+DASHED_LINE_RE = re.compile(r"^\s*-{3,}\s*$")
+WORD_RE        = re.compile(r"\S+")
+# A word that starts up to COLUMN_SLACK characters before a column title, belongs to that column
+COLUMN_SLACK   = 2
+
+class TableTemplate(object):
+    """
+    Description of a CLI table
+    Input : name - Template name, such as "show acl interface detail"
+            command - CLI command format String, such as 'show acl interface detail x-eth0/0/{interface}'
+            layout - TABLE_LAYOUT_DASHED or TABLE_LAYOUT_FIELDS
+            columns - TABLE_LAYOUT_DASHED : Column titles that the table must have.
+                      TABLE_LAYOUT_FIELDS : All the column names, in order.
+            fill_down - Columns that are printed on the first row of a group only. An empty value is taken from the row above.
+            int_columns - Columns converted to Integer
+    """
+    def __init__(self, name, command, layout, columns, fill_down=(), int_columns=()):
+        self.name = name
+        self.command = command
+        self.layout = layout
+        self.columns = list(columns)
+        self.fill_down = list(fill_down)
+        self.int_columns = list(int_columns)
+        # Titles line -> (column names, column start offsets), learned once per layout
+        self.column_offsets = {}
+
+    def get_command(self, **kwargs):
+        """
+        Return value : The CLI command String, such as get_command(interface = 4)
+        """
+        return self.command.format(**kwargs)
+
+    def parse(self, output):
+        """
+        Parse a CLI output
+        Input : output - String multi line, such as returned by cli_control.execute_cli_command()
+        Return value : List of rows, each a dictionary {column name : value}
+        """
+        if self.layout == TABLE_LAYOUT_DASHED :
+            rows = self._parse_dashed(output)
+        elif self.layout == TABLE_LAYOUT_FIELDS :
+            rows = self._parse_fields(output)
+        else :
+            raise Exception (f"Unrecognized table layout: {self.layout}")
+
+        table = []
+        prev_row = {}
+        for row in rows :
+            if any(column in row and not row[column].isdigit() for column in self.int_columns) :
+                # Not a table row, such as a summary line
+                logging.debug(f"Table {self.name}: skipping row {row}")
+                continue
+            for column in self.fill_down :
+                if row.get(column) == "" :
+                    row[column] = prev_row.get(column, "")
+            for column in self.int_columns :
+                if column in row :
+                    row[column] = int(row[column])
+            table.append(row)
+            prev_row = row
+        return table
+
+    def _get_column_offsets(self, titles_line):
+        """
+        Return value : (column names, column start offsets) of a titles line
+        """
+        if titles_line not in self.column_offsets :
+            titles = [(match.group(), match.start()) for match in WORD_RE.finditer(titles_line)]
+            names = [title for title, _ in titles]
+            missing = [column for column in self.columns if column not in names]
+            if len(missing) > 0 :
+                raise Exception (f"Table {self.name} is missing columns {missing}. Titles line: {titles_line}")
+            self.column_offsets[titles_line] = (names, [offset for _, offset in titles])
+        return self.column_offsets[titles_line]
+
+    def _parse_dashed(self, output):
+        rows = []
+        names = None
+        prev_line = ""
+
+        for line in output.splitlines() :
+            if names == None :
+                if DASHED_LINE_RE.match(line) :
+                    names, offsets = self._get_column_offsets(prev_line)
+                prev_line = line
+                continue
+            if line.strip() == "" or DASHED_LINE_RE.match(line) :
+                continue
+
+            row = {name : "" for name in names}
+            for match in WORD_RE.finditer(line) :
+                column = max(0, bisect.bisect_right(offsets, match.start() + COLUMN_SLACK) - 1)
+                value = row[names[column]]
+                row[names[column]] = match.group() if value == "" else f"{value} {match.group()}"
+            rows.append(row)
+
+        return rows
+
+    def _parse_fields(self, output):
+        rows = []
+        num_of_columns = len(self.columns)
+
+        for line in output.splitlines() :
+            values = line.split(None, num_of_columns - 1)
+            if len(values) != num_of_columns :
+                # Not a table row, such as the "total" line of "ls -l"
+                continue
+            rows.append(dict(zip(self.columns, values)))
+
+        return rows
+
+# ***************************************************************************************
+# Template registry
+# ***************************************************************************************
+TABLE_TEMPLATES = {}
+
+def register_template(template) :
+    """
+    Add a TableTemplate to the registry, replacing a template of the same name
+    """
+    TABLE_TEMPLATES[template.name] = template
+
+def get_template(name) :
+    if name not in TABLE_TEMPLATES :
+        raise Exception (f"Unrecognized table template: {name}")
+    return TABLE_TEMPLATES[name]
+
+def parse_table(name, output) :
+    """
+    Parse a CLI output by the name template
+    Return value : List of rows, each a dictionary {column name : value}
+    """
+    return get_template(name).parse(output)
+
+register_template(TableTemplate("show acl interface detail",
+                                'show acl interface detail x-eth0/0/{interface}',
+                                TABLE_LAYOUT_DASHED,
+                                columns     = ["POL", "RULE", "ACTION", "COUNT"],
+                                fill_down   = ["INTERFACE", "DIR", "POL"],
+                                int_columns = ["COUNT"]))
+
+register_template(TableTemplate("show ctrl-plane acl detail",
+                                'show ctrl-plane acl detail',
+                                TABLE_LAYOUT_DASHED,
+                                columns     = ["POL", "RULE", "ACTION", "COUNT"],
+                                fill_down   = ["MODE", "POL"],
+                                int_columns = ["COUNT"]))
+
+register_template(TableTemplate("ls -l",
+                                'ls -l {path}',
+                                TABLE_LAYOUT_FIELDS,
+                                columns     = ["PERMISSIONS", "LINKS", "OWNER", "GROUP", "SIZE", "MONTH", "DAY", "TIME", "NAME"],
+                                int_columns = ["LINKS", "SIZE"]))
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _test_parse_table() :
+    show_acl_ifc_detail = """
+                                                                    HIT
+        INTERFACE   DIR  POL                     RULE          ACTION  COUNT
+        ----------------------------------------------------------------------
+        x-eth0/0/1  in   canary_pol_deny_src_ip  r1            deny    20
+                                                rule-default  permit  30
+        x-eth0/0/1  out  pol_out                 r1            deny    123456
+                                                 r2                    7
+    """
+    rows = parse_table("show acl interface detail", show_acl_ifc_detail)
+    assert rows == [
+        {"INTERFACE" : "x-eth0/0/1", "DIR" : "in",  "POL" : "canary_pol_deny_src_ip", "RULE" : "r1",           "ACTION" : "deny",   "COUNT" : 20},
+        {"INTERFACE" : "x-eth0/0/1", "DIR" : "in",  "POL" : "canary_pol_deny_src_ip", "RULE" : "rule-default", "ACTION" : "permit", "COUNT" : 30},
+        {"INTERFACE" : "x-eth0/0/1", "DIR" : "out", "POL" : "pol_out",                "RULE" : "r1",           "ACTION" : "deny",   "COUNT" : 123456},
+        {"INTERFACE" : "x-eth0/0/1", "DIR" : "out", "POL" : "pol_out",                "RULE" : "r2",           "ACTION" : "",       "COUNT" : 7}]
+    assert len(get_template("show acl interface detail").column_offsets) == 1
+
+    # Another layout of the same template
+    show_acl_ctrl_plane_detail = """
+        MODE    POL         RULE          ACTION  COUNT
+        -----------------------------------------------
+        egress  my pol      r1            deny    40
+    """
+    rows = parse_table("show acl interface detail", show_acl_ctrl_plane_detail)
+    assert rows == [{"MODE" : "egress", "POL" : "my pol", "RULE" : "r1", "ACTION" : "deny", "COUNT" : 40}]
+    assert parse_table("show ctrl-plane acl detail", "") == []
+
+    ls_output = """total 1435845
+-rw-r--r-- 1 buildslave sw-all 734982823 Apr  2 00:19 onie-installer-vdevelop.8.0.0-2023-04-01-21-18-06-l-nl-g03b2807b-b537
+-rw-r--r-- 1 buildslave sw-all        33 Apr  2 00:19 onie-installer-vdevelop.8.0.0-2023-04-01-21-18-06-l-nl-g03b2807b-b537.bsc"""
+    rows = parse_table("ls -l", ls_output)
+    assert [row["NAME"] for row in rows] == ["onie-installer-vdevelop.8.0.0-2023-04-01-21-18-06-l-nl-g03b2807b-b537",
+                                             "onie-installer-vdevelop.8.0.0-2023-04-01-21-18-06-l-nl-g03b2807b-b537.bsc"]
+    assert rows[0]["SIZE"] == 734982823
+
+    logging.info("_test_parse_table passed")
+
+def _benchmark_parse_table(num_of_rules = 100000) :
+    """
+    Parse a large "show acl interface detail" output, to verify that parsing time is linear in the output size
+    """
+    import time
+
+    for num in [num_of_rules // 10, num_of_rules] :
+        lines = ["INTERFACE   DIR  POL                     RULE          ACTION  COUNT",
+                 "----------------------------------------------------------------------"]
+        for i in range(num) :
+            lines.append(f"x-eth0/0/1  in   pol_{i // 10:<18}  r{i % 10:<11}  deny    {i}")
+        output = "\n".join(lines)
+
+        start = time.perf_counter()
+        rows = parse_table("show acl interface detail", output)
+        elapsed = time.perf_counter() - start
+        assert len(rows) == num and rows[-1]["COUNT"] == num - 1
+        logging.info(f"{num} rows ({len(output) / 1e6:.1f} MB) : {elapsed * 1000:.0f} ms, {elapsed / num * 1e6:.2f} us per row")
+
+if __name__ == "__main__" :
+    _test_parse_table()
+    # _benchmark_parse_table()
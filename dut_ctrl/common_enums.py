@@ -23,8 +23,9 @@ class FrameType(Enum):
     """
     Enumeration for the different frame types that can be injected into BCM
     """
-    L2_L3_FRAME = 1
-    ICMP_FRAME  = 2
+    L2_L3_FRAME   = 1
+    ICMP_FRAME    = 2
+    L3_DSCP_FRAME = 3
 
 class InterfaceType(Enum):
     """
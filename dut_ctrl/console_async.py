@@ -0,0 +1,329 @@
+"""
+Asyncio serial console driver, for recovering several DUTs concurrently (such as after a lab power event).
+Runs the reset_dut_connections() sequence - ONL login, "dhclient ma1", and optionally "ssc" and the management VRF ping -
+on many DUTs at once. Each DUT reports its outcome and the time of every step :
+
+    results = asyncio.run(recover_duts([("3010", "dl"), ("3054", "ec"), ("3062", "ec")], is_reset_cpm_connection = True))
+    print(format_recovery_report(results))
+"""
+import asyncio
+import time
+import logging
+
+logging.basicConfig(
+                    format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                    level=logging.INFO,
+                    datefmt='%H:%M:%S')
+
+import pexpect
+from cli_control import get_time, _get_dut_alias_to_cmd, _cpm_prompt_re, \
+                        ONL_PROMPT_RE, PING_DONE_RE, SEARCH_WINDOW_SIZE, \
+                        ConsoleStateMachine, format_console_transitions, CONSOLE_ONL, CONSOLE_CPM
+
+# Default bound of DUT consoles driven at the same time
+MAX_PARALLEL_CONSOLES = 16
+# Seconds, default expect timeout of a console
+CONSOLE_TIMEOUT = 20
+# Seconds, timeout of "dhclient ma1"
+DHCLIENT_TIMEOUT = 300
+# Seconds to wait before sending a line (the pexpect delaybeforesend default)
+SEND_DELAY = 0.05
+
+async def _spawn_serial_console(device_number, device_type, timeout) :
+    """
+    Disconnect other client of the serial server, and telnet to the DUT console through the serial server
+    Return value : Spawned pexpect process, before the "Escape character" line
+    """
+    command = _get_dut_alias_to_cmd(device_number, device_type, "sc")
+    process = await asyncio.create_subprocess_exec(*command.split(), stdout=asyncio.subprocess.PIPE)
+    await process.communicate()
+
+    command = _get_dut_alias_to_cmd(device_number, device_type, "s")
+    return pexpect.spawn(command, encoding='utf-8', timeout=timeout, codec_errors='ignore')
+
+class RecoveryResult(object):
+    """
+    Outcome of the recovery of one DUT
+    """
+    def __init__(self, device_number):
+        self.device_number = device_number
+        self.is_ok = False
+        self.error = None
+        self.elapsed = 0
+        # List of (step name, seconds)
+        self.steps = []
+
+    def __repr__(self):
+        return f"RecoveryResult({self.device_number}, is_ok={self.is_ok}, elapsed={self.elapsed:.1f}, error={self.error})"
+
+class AsyncConsole(object):
+    """
+    Serial console of a DUT, driven with asyncio
+    Input : device_number - Such as '3010'
+            device_type - Applicable values : 'dl', 'ec', 'al', 'uf'
+            spawn_console - Coroutine function spawn_console(device_number, device_type, timeout), returns the spawned
+                            console process, before the "Escape character" line
+            dhclient_timeout - Seconds, timeout of "dhclient ma1"
+    """
+    def __init__(self, device_number, device_type, timeout=CONSOLE_TIMEOUT, spawn_console=_spawn_serial_console,
+                 dhclient_timeout=DHCLIENT_TIMEOUT):
+        self.device_number = device_number
+        self.device_type = device_type
+        self.timeout = timeout
+        self.dhclient_timeout = dhclient_timeout
+        self.spawn_console = spawn_console
+        self.cli_comm = None
+        self.state_machine = None
+
+    async def expect_prompt(self, patterns, timeout=-1) -> int :
+        """
+        Asyncio version of cli_control._expect_prompt()
+        """
+        return await self._expect(self.cli_comm.expect_list, patterns, timeout)
+
+    async def expect_marker(self, markers, timeout=-1) -> int :
+        """
+        Asyncio version of cli_control._expect_marker()
+        """
+        if isinstance(markers, str) :
+            markers = [markers]
+        return await self._expect(self.cli_comm.expect_exact, markers, timeout)
+
+    async def _expect(self, expect, patterns, timeout):
+        """
+        Search the output received so far without blocking, and wait for more output in the event loop.
+        (The pexpect expect async_ option is not used - in pexpect 4.8 it does not run on Python 3.11.)
+        After timeout seconds (-1 for the console default timeout), returns the index of pexpect.TIMEOUT if it is in
+        patterns, like pexpect does, or raises pexpect.exceptions.TIMEOUT.
+        """
+        loop = asyncio.get_running_loop()
+        if timeout == -1 :
+            timeout = self.cli_comm.timeout
+        deadline = loop.time() + timeout
+        # Each non blocking search times out at once - The timeout is handled here
+        indexes = [index for index, pattern in enumerate(patterns) if pattern is not pexpect.TIMEOUT]
+
+        while True :
+            try :
+                i = expect([patterns[index] for index in indexes], timeout = 0, searchwindowsize = SEARCH_WINDOW_SIZE)
+                return indexes[i]
+            except pexpect.exceptions.TIMEOUT :
+                remaining = deadline - loop.time()
+                if remaining <= 0 :
+                    if len(indexes) < len(patterns) :
+                        return patterns.index(pexpect.TIMEOUT)
+                    raise
+                await self._wait_readable(remaining)
+
+    async def _wait_readable(self, timeout):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.cli_comm.child_fd
+        loop.add_reader(fd, lambda : readable.done() or readable.set_result(None))
+        try :
+            await asyncio.wait_for(readable, timeout)
+        except asyncio.TimeoutError :
+            pass
+        finally :
+            loop.remove_reader(fd)
+
+    async def sendline(self, line=''):
+        # The pexpect delaybeforesend sleep would block the event loop - The delay is awaited instead
+        await asyncio.sleep(SEND_DELAY)
+        self.cli_comm.sendline(line)
+
+    async def open(self):
+        """
+        Open the console and reach the ONL prompt, login if needed
+        """
+        self.cli_comm = await self.spawn_console(self.device_number, self.device_type, self.timeout)
+        self.cli_comm.delaybeforesend = None
+        self.state_machine = ConsoleStateMachine(self.cli_comm, self.device_number)
+        await self.reach(CONSOLE_ONL)
+
+    async def reach(self, target):
+        """
+        Asyncio version of cli_control.ConsoleStateMachine.reach()
+        """
+        state_machine = self.state_machine
+        first = len(state_machine.transitions)
+        state_machine.start(target)
+        while not state_machine.is_done() :
+            start = time.perf_counter()
+            i = await self.expect_prompt(state_machine.patterns, state_machine.get_timeout())
+            state_machine.process(i, time.perf_counter() - start)
+        logging.info(f"{get_time()} Console {self.device_number} reached {target}: "
+                     f"{format_console_transitions(state_machine.transitions[first:])}")
+
+    async def run_dhclient(self):
+        await self.sendline('dhclient ma1')
+        await self.expect_prompt([ONL_PROMPT_RE], timeout = self.dhclient_timeout)
+
+    async def ping_management_vrf(self):
+        """
+        Login to the DUT CLI ("ssc"), ping in the management VRF to revive the CPM connection, and exit back to ONL
+        """
+        cpm_prompt_re = _cpm_prompt_re(self.device_number)
+
+        await self.reach(CONSOLE_CPM)
+
+        await self.sendline(f'ping vrf management 10.3.{self.device_number[-2:]}.254')
+        await self.expect_prompt([PING_DONE_RE, cpm_prompt_re])
+
+        await self.sendline()
+        await self.expect_prompt([cpm_prompt_re])
+        await self.reach(CONSOLE_ONL)
+
+    async def close(self):
+        if self.cli_comm != None :
+            # pexpect close sleeps while terminating the process - Not in the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.cli_comm.close)
+            self.cli_comm = None
+
+# ***************************************************************************************
+# Multi DUT functions
+# ***************************************************************************************
+async def recover_dut(device_number, device_type, is_reset_cpm_connection, spawn_console=_spawn_serial_console,
+                      dhclient_timeout=DHCLIENT_TIMEOUT) -> RecoveryResult :
+    """
+    reset_dut_connections() sequence of one DUT, as a coroutine
+    Return value : RecoveryResult. Errors are reported in the result, and not raised.
+    """
+    result = RecoveryResult(device_number)
+    console = AsyncConsole(device_number, device_type, spawn_console = spawn_console, dhclient_timeout = dhclient_timeout)
+    steps = [("login", console.open), ("dhclient", console.run_dhclient)]
+    if is_reset_cpm_connection == True :
+        steps.append(("vrf ping", console.ping_management_vrf))
+
+    start = time.perf_counter()
+    step_name = None
+    try :
+        for step_name, step in steps :
+            step_start = time.perf_counter()
+            await step()
+            result.steps.append((step_name, time.perf_counter() - step_start))
+        result.is_ok = True
+    except pexpect.exceptions.TIMEOUT :
+        result.error = f"Timeout in step {step_name}"
+    except pexpect.exceptions.EOF :
+        result.error = f"EOF in step {step_name}"
+    except Exception as error :
+        result.error = f"{error} in step {step_name}"
+    finally :
+        await console.close()
+        result.elapsed = time.perf_counter() - start
+
+    if result.is_ok :
+        logging.info(f"{get_time()} {device_number}: Recovered in {result.elapsed:.1f} seconds")
+    else :
+        logging.error(f"{get_time()} {device_number}: {result.error}")
+    return result
+
+async def recover_duts(duts, is_reset_cpm_connection, max_parallel=MAX_PARALLEL_CONSOLES, spawn_console=_spawn_serial_console,
+                       dhclient_timeout=DHCLIENT_TIMEOUT) -> list :
+    """
+    Recover several DUTs concurrently, at most max_parallel DUTs at a time
+    Input : duts - List of (device_number, device_type), such as [("3010", "dl"), ("3054", "ec")]
+    Return value : List of RecoveryResult, in the order of duts
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def recover(device_number, device_type) :
+        async with semaphore :
+            return await recover_dut(device_number, device_type, is_reset_cpm_connection, spawn_console, dhclient_timeout)
+
+    return await asyncio.gather(*[recover(device_number, device_type) for device_number, device_type in duts])
+
+def format_recovery_report(results) -> str :
+    """
+    Return value : String multi line, a row per DUT with its outcome and step times
+    """
+    lines = [f"{'DUT':<8}{'RESULT':<8}{'TOTAL':>8}  STEPS"]
+    for result in results :
+        steps = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in result.steps)
+        outcome = "OK" if result.is_ok else "FAILED"
+        lines.append(f"{result.device_number:<8}{outcome:<8}{result.elapsed:>7.1f}s  {steps}{'' if result.is_ok else '  ' + str(result.error)}")
+    return "\n".join(lines)
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+# Stand-in for a DUT serial console : login, ONL shell, and the DUT CLI ("ssc").
+# "dhclient ma1" and the ping take delay seconds. A device number ending with "99" never answers "dhclient ma1".
+_FAKE_CONSOLE_SCRIPT = """
+import sys, time
+device_number = sys.argv[1]
+delay = float(sys.argv[2])
+ONL_PROMPT = "root@localhost:~# "
+CPM_PROMPT = "R%s[2023-03-30-18:02:14]# " % device_number
+def write(text) :
+    sys.stdout.write(text)
+    sys.stdout.flush()
+write("Trying 10.1.10.253...\\nConnected to 10.1.10.253.\\nEscape character is '^]'.\\n")
+state = "login"
+for line in sys.stdin :
+    command = line.strip()
+    if state == "login" :
+        if command == "" :
+            write("localhost login: ")
+        elif command == "root" :
+            write("Password: ")
+            state = "password"
+    elif state == "password" :
+        write(ONL_PROMPT)
+        state = "onl"
+    elif state == "onl" :
+        if command == "dhclient ma1" :
+            if device_number.endswith("99") :
+                continue
+            time.sleep(delay)
+        elif command == "ssc" :
+            write("admin@10.3.%s.1's password: " % device_number[-2:])
+            state = "ssc"
+            continue
+        write(ONL_PROMPT)
+    elif state == "ssc" :
+        write(CPM_PROMPT)
+        state = "cpm"
+    elif state == "cpm" :
+        if command == "exit" :
+            write(ONL_PROMPT)
+            state = "onl"
+            continue
+        if command.startswith("ping") :
+            time.sleep(delay)
+            write("5 packets transmitted, 5 received, 0% packet loss\\nrtt min/avg/max/mdev = 0.1/0.2/0.3/0.1 ms\\n")
+        write(CPM_PROMPT)
+"""
+
+def _test_recover_duts(num_of_duts=8, delay=0.3) :
+    """
+    Recover stand-in DUTs concurrently, one of them hangs in "dhclient ma1"
+    """
+    import sys
+
+    async def spawn_console(device_number, device_type, timeout) :
+        return pexpect.spawn(sys.executable, ['-c', _FAKE_CONSOLE_SCRIPT, device_number, str(delay)],
+                             encoding='utf-8', timeout=timeout, codec_errors='ignore')
+
+    dhclient_timeout = 5 * delay + 2
+    duts = [(f"30{index:02d}", "ec") for index in range(num_of_duts - 1)] + [("3099", "ec")]
+
+    start = time.perf_counter()
+    results = asyncio.run(recover_duts(duts, is_reset_cpm_connection = True, spawn_console = spawn_console,
+                                       dhclient_timeout = dhclient_timeout))
+    elapsed = time.perf_counter() - start
+
+    print(format_recovery_report(results))
+    assert [result.device_number for result in results] == [device_number for device_number, _ in duts]
+    assert all(result.is_ok for result in results[:-1])
+    assert [name for name, _ in results[0].steps] == ["login", "dhclient", "vrf ping"]
+    assert not results[-1].is_ok and "dhclient" in results[-1].error
+    # Serially, the DUTs would take (dhclient + ping) delays each, and the hanging DUT its timeout
+    serial_time = (num_of_duts - 1) * 2 * delay + dhclient_timeout
+    assert elapsed < serial_time
+    logging.info(f"{get_time()} _test_recover_duts passed. {num_of_duts} DUTs recovered in {elapsed:.1f} seconds, "
+                 f"serially at least {serial_time:.1f} seconds")
+
+if __name__ == "__main__" :
+    _test_recover_duts()
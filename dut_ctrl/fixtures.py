@@ -8,13 +8,13 @@ logging.basicConfig(
                     level=logging.INFO,
                     datefmt='%H:%M:%S')
 import pytest
-import paramiko
 from typing import Tuple
+# paramiko is imported by the functions that use it - its import is slow, and test collection does not need it
 
 # ***************************************************************************************
 # Helper functions
 # ***************************************************************************************
-def run_remote_shell_cmd(ssh_client: paramiko.SSHClient, cmd_string: str) -> Tuple[int, str] :
+def run_remote_shell_cmd(ssh_client: "paramiko.SSHClient", cmd_string: str) -> Tuple[int, str] :
     """
     Run remote shell command
     """
@@ -106,6 +106,35 @@ def wait_for_onl_after_reboot():
     logging.info(f"{get_time()} SSH server is up!")
     return True
 
+def _is_tcp_port_open(host: str, port: int, timeout: float) -> bool :
+    """
+    Return value : True if a TCP connection to host:port is accepted within timeout seconds
+    """
+    import socket
+
+    try :
+        with socket.create_connection((host, port), timeout = timeout) :
+            return True
+    except OSError :
+        return False
+
+def probe_tcp_ports(addresses, timeout: float = 2) -> dict :
+    """
+    Check TCP reachability of several addresses in parallel
+    Input : addresses - List of (host, port) tuples
+            timeout - Seconds, per address. The whole probe takes about the slowest address.
+    Return value : Dictionary {(host, port) : True if reachable}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from cli_control import get_time
+
+    with ThreadPoolExecutor(max_workers = max(1, len(addresses))) as executor :
+        results = executor.map(lambda address : _is_tcp_port_open(address[0], address[1], timeout), addresses)
+        reachability = dict(zip(addresses, results))
+
+    logging.info(f"{get_time()} TCP reachability: {reachability}")
+    return reachability
+
 def _create_ssh_client(is_reset_cpm_connection):
     import configparser
     import paramiko
@@ -117,78 +146,344 @@ def _create_ssh_client(is_reset_cpm_connection):
     constants = configparser.ConfigParser()
     constants.read('config.ini')
     host_onl = constants['COMM']['HOST_ONL']
+    host_cpm = constants['COMM']['HOST_CPM']
+    probe_timeout = float(constants['COMM'].get('PREFLIGHT_TIMEOUT', fallback = '2'))
+    netconf_port = int(constants['NETCONF']['PORT'])
     dut_num = constants['GENERAL']['DUT_NUM']
     dut_type = constants['GENERAL']['DUT_TYPE']
 
-    # Reset the Managament interface 10.3.XX.10 (host_onl) by sending "dhclient ma1" in ONL CLI,
-    # and CPM interface (10.3.XX.1) by sending ping to vrf management in the DUT CLI, using the serial server 
-    cli_control.reset_dut_connections(device_number = dut_num, device_type = dut_type, is_reset_cpm_connection = is_reset_cpm_connection)
+    def reset_dut_connections() :
+        # Reset the Managament interface 10.3.XX.10 (host_onl) by sending "dhclient ma1" in ONL CLI,
+        # and CPM interface (10.3.XX.1) by sending ping to vrf management in the DUT CLI, using the serial server 
+        cli_control.reset_dut_connections(device_number = dut_num, device_type = dut_type, is_reset_cpm_connection = is_reset_cpm_connection)
+
+    def connect() :
+        # Connecting over SSH and Managament interface 10.3.XX.10 (host_onl) to the device
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        logging.info(f"Opening connection to host_onl {host_onl}")
+        client.connect(hostname=host_onl, username="root", password="root")
+        return client
+
+    # Pre-flight : the serial console recovery is needed only if the management (or CPM) interface is not reachable
+    addresses = [(host_onl, 22)]
+    if is_reset_cpm_connection == True :
+        addresses.append((host_cpm, netconf_port))
+    if not all(probe_tcp_ports(addresses, probe_timeout).values()) :
+        reset_dut_connections()
+        return connect()
+
+    logging.info("DUT connections are reachable. Skipping reset_dut_connections")
+    try :
+        return connect()
+    except Exception as error :
+        logging.warning(f"SSH connection to {host_onl} failed: {error}. Resetting DUT connections")
+        reset_dut_connections()
+        return connect()
+   
+# ***************************************************************************************
+# SFTP transfers
+# Files are transferred over SFTP channels of one SSH connection - no SSH handshake per file. Several files are
+# transferred concurrently, each on its own SFTP channel. paramiko pipelines the writes of put() and prefetches the
+# reads of get(), so a file is not transferred one request / response at a time.
+# ***************************************************************************************
+TRANSFER_PUT = "put"
+TRANSFER_GET = "get"
 
-    # Connecting over SSH and Managament interface 10.3.XX.10 (host_onl) to the device
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    logging.info(f"Opening connection to host_onl {host_onl}")
-    client.connect(hostname=host_onl, username="root", password="root")
+class FileTransferResult(object):
+    """
+    Outcome of the transfer of one file
+    """
+    def __init__(self, local_path, remote_path):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.is_ok = False
+        self.error = None
+        self.num_of_bytes = 0
+        self.num_of_attempts = 0
+        self.elapsed = 0
+
+    def get_throughput(self) -> float :
+        """
+        Return value : Bytes per second of the successful attempt
+        """
+        return self.num_of_bytes / self.elapsed if self.elapsed > 0 else 0
+
+    def __repr__(self):
+        return f"FileTransferResult({self.local_path}, {self.remote_path}, is_ok={self.is_ok}, bytes={self.num_of_bytes}, " \
+               f"attempts={self.num_of_attempts}, error={self.error})"
+
+def transfer_files(ssh_client: "paramiko.SSHClient", direction: str, transfers,
+                   max_parallel: int = 4,
+                   num_of_retries: int = 3,
+                   backoff_seconds: float = 1,
+                   max_backoff_seconds: float = 60) -> list :
+    """
+    Transfer files over SFTP, concurrently. A failed file is retried alone, after an exponential backoff.
+    Input : direction - TRANSFER_PUT (local to DUT) or TRANSFER_GET (DUT to local)
+            transfers - List of (local path, remote path)
+            max_parallel - Maximal number of files transferred at once
+            num_of_retries - Attempts of a file after its first failure
+            backoff_seconds - Sleep before the first retry of a file, doubled before every other retry, up to max_backoff_seconds
+    Return value : List of FileTransferResult, in the order of transfers. Raises an exception if a file failed all its attempts.
+    """
+    import os
+    import time
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from cli_control import get_time
 
-    return client
-   
-def copy_files_from_local_to_dut(dut_num, local_files_list, remote_dut_path):
+    if direction not in [TRANSFER_PUT, TRANSFER_GET] :
+        raise Exception (f"Unrecognized transfer direction: {direction}")
+
+    # An SFTP channel per worker thread, reopened after a failure
+    sftp_clients = []
+    thread_data = threading.local()
+    lock = threading.Lock()
+
+    def get_sftp(is_reopen) :
+        sftp = getattr(thread_data, "sftp", None)
+        if sftp is not None and is_reopen :
+            with lock :
+                sftp_clients.remove(sftp)
+            try :
+                sftp.close()
+            except Exception :
+                pass
+            sftp = None
+        if sftp is None :
+            sftp = ssh_client.open_sftp()
+            thread_data.sftp = sftp
+            with lock :
+                sftp_clients.append(sftp)
+        return sftp
+
+    def transfer(local_path, remote_path) :
+        result = FileTransferResult(local_path, remote_path)
+        backoff = backoff_seconds
+        while result.num_of_attempts <= num_of_retries :
+            if result.num_of_attempts > 0 :
+                logging.warning(f"{get_time()} Retrying {direction} {local_path} <-> {remote_path} in {backoff} seconds. Error: {result.error}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff_seconds)
+            result.num_of_attempts += 1
+            try :
+                sftp = get_sftp(is_reopen = result.error is not None)
+                start = time.perf_counter()
+                if direction == TRANSFER_PUT :
+                    result.num_of_bytes = sftp.put(local_path, remote_path).st_size
+                else :
+                    sftp.get(remote_path, local_path)
+                    result.num_of_bytes = os.path.getsize(local_path)
+                result.elapsed = time.perf_counter() - start
+                result.is_ok = True
+                result.error = None
+                logging.debug(f"{get_time()} {direction} {local_path} <-> {remote_path}: {result.num_of_bytes} bytes, {result.get_throughput() / 1e6:.2f} MB/s")
+                break
+            except Exception as error :
+                result.error = error
+        return result
+
+    start = time.perf_counter()
+    try :
+        with ThreadPoolExecutor(max_workers = max(1, min(max_parallel, len(transfers)))) as executor :
+            results = list(executor.map(lambda paths : transfer(*paths), transfers))
+    finally :
+        for sftp in sftp_clients :
+            sftp.close()
+    elapsed = time.perf_counter() - start
+
+    num_of_bytes = sum(result.num_of_bytes for result in results if result.is_ok)
+    logging.info(f"{get_time()} {direction}: {len(transfers)} files, {num_of_bytes / 1e6:.2f} MB in {elapsed:.2f} seconds, "
+                 f"{num_of_bytes / 1e6 / elapsed if elapsed > 0 else 0:.2f} MB/s, "
+                 f"{sum(result.num_of_attempts - 1 for result in results)} retries")
+
+    failed = [result for result in results if not result.is_ok]
+    if len(failed) > 0 :
+        raise Exception (f"{get_time()} Failed {direction} of {len(failed)} files: {failed}")
+    return results
+
+def _open_dut_ssh_client(dut_num: str, num_of_retries: int = 0, backoff_seconds: float = 1, max_backoff_seconds: float = 60) :
+    """
+    Connect to the ONL of the DUT, 10.3.XX.10
+    Input : num_of_retries - Connection attempts after the first failure, with an exponential backoff
+    Return value : paramiko.SSHClient
+    """
+    import time
+    import paramiko
+    from cli_control import get_time
+
+    host_onl = f"10.3.{dut_num[-2:]}.10"
+    backoff = backoff_seconds
+    for attempt in range(num_of_retries + 1) :
+        try :
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(hostname = host_onl, username = "root", password = "root")
+            return client
+        except Exception as error :
+            if attempt == num_of_retries :
+                raise
+            logging.warning(f"{get_time()} SSH connection to {host_onl} failed: {error}. Retrying in {backoff} seconds")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff_seconds)
+
+def _get_put_transfers(sftp, local_files_list, remote_dut_path) -> list :
+    """
+    Resolve the remote target of each file, the way scp does :
+        remote_dut_path is an existing directory - Each file is copied into it, by its name.
+        Otherwise - remote_dut_path is the target file, so a single file can be copied.
+    A missing directory is created if several files are copied, or if remote_dut_path ends with "/". Its parent must exist.
+    Input : sftp - Open SFTP client to the DUT
+    Return value : List of (local path, remote path)
+    """
+    import os
+    import posixpath
+    import stat
+
+    try :
+        is_dir = stat.S_ISDIR(sftp.stat(remote_dut_path).st_mode)
+    except IOError :
+        is_dir = None
+        if len(local_files_list) > 1 or remote_dut_path.endswith("/") :
+            logging.info(f"Creating the directory {remote_dut_path} in the DUT")
+            sftp.mkdir(remote_dut_path)
+            is_dir = True
+
+    if is_dir :
+        return [(file, posixpath.join(remote_dut_path, os.path.basename(file))) for file in local_files_list]
+    if len(local_files_list) != 1 :
+        raise Exception (f"{remote_dut_path} is not a directory in the DUT, and {len(local_files_list)} files were given")
+    return [(local_files_list[0], remote_dut_path)]
+
+def copy_files_from_local_to_dut(dut_num, local_files_list, remote_dut_path, ssh_client = None):
     """
     Copy files into remote_dut_path in DUT.
     Input : local_files_list - list of Strings
-            remote_dut_path  - String
-    Hidden assumption : That id_rsa.pub file has been created in DEV machine using ssh-keygen and copied to DUT using ssh-copy-id,
-                        so that no password prompt is given 
+            remote_dut_path  - String. A directory, or the target file of a single file - as in scp. See _get_put_transfers().
+            ssh_client - Open SSH connection to the DUT ONL. If None, a connection is opened for the copy.
+    Return value : List of FileTransferResult
     """
     from cli_control import get_time
     logging.info(f"{get_time()} copy_files_from_local_to_dut")
 
-    for file in local_files_list :
-        command = f"scp {file} root@10.3.{dut_num[-2:]}.10:{remote_dut_path}"
-        rc, output = run_local_shell_cmd(command)
-        if rc != 0 :
-            raise Exception(f"Failed copying {file} to {remote_dut_path}")
-        else :
-            logging.info((f"Succeeded in copying {file} to {remote_dut_path}"))
-
-def copy_files_from_dut_to_local(dut_num: str, remote_dir: str, remote_files_list, local_path):
+    client = ssh_client if ssh_client is not None else _open_dut_ssh_client(dut_num)
+    try :
+        sftp = client.open_sftp()
+        try :
+            transfers = _get_put_transfers(sftp, local_files_list, remote_dut_path)
+        finally :
+            sftp.close()
+        results = transfer_files(client, TRANSFER_PUT, transfers)
+    finally :
+        if ssh_client is None :
+            client.close()
+    logging.info(f"Succeeded in copying {local_files_list} to {remote_dut_path}")
+    return results
+
+def copy_files_from_dut_to_local(dut_num: str, remote_dir: str, remote_files_list, local_path, ssh_client = None):
     """
     Copy files from remote_files_list in DUT to local_path.
     Input : remote_dir - Remote directory
             remote_files_list - list of Strings
             local_path  - String
-    Hidden assumption : That id_rsa.pub file has been created in DEV machine using ssh-keygen and copied to DUT using ssh-copy-id,
-                        so that no password prompt is given 
+            ssh_client - Open SSH connection to the DUT ONL. If None, a connection is opened for the copy.
+    Return value : List of FileTransferResult
+    The connection and each file are retried for about 4 minutes, since the files may be read while the DUT boots.
     """
     import os
+    import posixpath
     from cli_control import get_time
-    import time
 
-    logging.debug(f"{get_time()} copy_files_from_local_to_dut")
-    
-    num_of_retries = 5
-    SLEEP_BETWEEN_RETRIES_SECONDS = 60
-    full_file_path = None
-    is_finished = False
-
-    while num_of_retries > 0 and is_finished == False:
-        for index, file in enumerate(remote_files_list) :
-            full_file_path = os.path.join (remote_dir, file)
-            command = f"scp root@10.3.{dut_num[-2:]}.10:{full_file_path} {local_path}"
-            rc, output = run_local_shell_cmd(command)
-            if rc != 0 :
-                num_of_retries -= 1
-                logging.error((f"{get_time()} Error in copying {full_file_path} to {local_path}. RC: {rc}, Output: {output}. Retries left: {num_of_retries}"))
-                time.sleep(SLEEP_BETWEEN_RETRIES_SECONDS)
-                break    
-            else :
-                logging.debug((f"{get_time()} Succeeded in copying {full_file_path} to {local_path}"))
-            
-            if index == len(remote_files_list) - 1 :
-                is_finished = True
-
-    if num_of_retries == 0:
-        raise Exception(f"{get_time()} Failure copying {remote_files_list} to {local_path}")
+    logging.debug(f"{get_time()} copy_files_from_dut_to_local")
+
+    NUM_OF_RETRIES = 5
+    BACKOFF_SECONDS = 15
+    MAX_BACKOFF_SECONDS = 60
+
+    transfers = [(os.path.join(local_path, file), posixpath.join(remote_dir, file)) for file in remote_files_list]
+    client = ssh_client if ssh_client is not None else _open_dut_ssh_client(dut_num, NUM_OF_RETRIES, BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+    try :
+        return transfer_files(client, TRANSFER_GET, transfers,
+                              num_of_retries = NUM_OF_RETRIES, backoff_seconds = BACKOFF_SECONDS, max_backoff_seconds = MAX_BACKOFF_SECONDS)
+    finally :
+        if ssh_client is None :
+            client.close()
+
+# ***************************************************************************************
+# BCM diag shell channel
+# ***************************************************************************************
+class BcmDiagChannel(object):
+    """
+    One SSH channel to a persistent diag shell in the DUT - tx_into_bcm.py --serve.
+    Frames are transmitted without forking screen per frame, and each Tx returns once the diag prompt is back.
+    The channel is reopened by tx() if it was closed. Owned by the bcm_diag_channel fixture, which closes it.
+    Input : ssh_client - 
+            workdir - Directory of tx_into_bcm.py in the DUT
+            timeout - Seconds to wait for a reply
+    """
+    def __init__(self, ssh_client: "paramiko.SSHClient", workdir: str, timeout: float = 60):
+        self.ssh_client = ssh_client
+        self.workdir = workdir
+        self.timeout = timeout
+        self.open()
+
+    def open(self):
+        from cli_control import get_time
+
+        command = f"cd {self.workdir};python -u tx_into_bcm.py --serve"
+        logging.info(f"{get_time()} Opening diag shell channel: \"{command}\"")
+        self.channel = self.ssh_client.get_transport().open_session()
+        self.channel.settimeout(self.timeout)
+        self.channel.exec_command(command)
+        self.stdin  = self.channel.makefile('wb')
+        self.stdout = self.channel.makefile('r')
+        self.num_of_requests = 0
+
+        reply = self._read_reply()
+        if reply != "READY" :
+            self.close()
+            raise Exception(f"{get_time()} Failed opening diag shell channel. Reply: {reply}")
+
+    def _read_reply(self) -> str :
+        reply = self.stdout.readline()
+        if reply == "" :
+            raise Exception(f"Diag shell channel closed, exit status {self.channel.recv_exit_status()}")
+        return reply.strip()
+
+    def is_alive(self) -> bool :
+        return not self.channel.closed and not self.channel.exit_status_ready()
+
+    def tx(self, frame: str, num_of_tx, port) -> float :
+        """
+        Transmit a frame, and wait for the Tx to complete
+        Input : frame - Hex string of the frame
+                num_of_tx - Number of times to transmit
+                port - BCM port number
+        Return value : Seconds the Tx took in the diag shell
+        """
+        from cli_control import get_time
+
+        if not self.is_alive() :
+            self.open()
+        self.stdin.write(f"TX {frame} {num_of_tx} {port}\n")
+        self.stdin.flush()
+        self.num_of_requests += 1
+
+        reply = self._read_reply()
+        words = reply.split(None, 2)
+        if len(words) < 2 or words[0] != "DONE" or words[1] != str(self.num_of_requests) :
+            raise Exception(f"{get_time()} Tx of {num_of_tx} frames into port {port} failed. Reply: {reply}")
+        return float(words[2])
+
+    def close(self):
+        if not self.channel.closed :
+            try :
+                self.stdin.write("QUIT\n")
+                self.stdin.flush()
+            except Exception :
+                pass
+            self.channel.close()
 
 # ***************************************************************************************
 # Fixtures functions
@@ -221,6 +516,25 @@ def ssh_client__no_cpm_conn_reset():
     logging.info(f"{get_time()} ssh_client: Closing connection")
     client.close()
 
+@pytest.fixture(scope="session")
+def bcm_diag_channel(ssh_client):
+    """
+    Persistent BCM diag shell channel to the DUT (see BcmDiagChannel).
+    Opened by the first test that uses it - after test_TC00 copied tx_into_bcm.py into the workdir.
+    Closed at the end of the session, so the remote tx_into_bcm.py --serve process quits and detaches from the bcmrm screen.
+    """
+    import configparser
+    from cli_control import get_time
+
+    constants = configparser.ConfigParser()
+    constants.read('config.ini')
+    workdir = constants['DUT_ENV']['WORKDIR']
+
+    channel = BcmDiagChannel(ssh_client, workdir)
+    yield channel
+    logging.info(f"{get_time()} bcm_diag_channel: Closing diag shell channel")
+    channel.close()
+
 @pytest.fixture(scope="session")
 def netconf_client():
     """
@@ -228,6 +542,47 @@ def netconf_client():
     """
     logging.info("Fixture: netconf_client")
 
+    import netconf_comm
+    import netconf_broker
+    import configparser
+
+    # Read globals from ini file
+    constants = configparser.ConfigParser()
+    constants.read('config.ini')
+    HOST_NAME       = constants['COMM']['HOST_CPM']
+    NETCONF_PORT    = int(constants['NETCONF']['PORT'])
+    CONFIG_CACHE_TTL = constants['NETCONF'].get('CONFIG_CACHE_TTL', fallback = '')
+    BROKER_SOCKET   = constants['NETCONF'].get('BROKER_SOCKET', fallback = '')
+
+    CPM_USER                = "admin"
+    CPM_PASSWORD            = "admin"
+
+    if BROKER_SOCKET != '' and netconf_broker.is_broker_running(BROKER_SOCKET) :
+        # Warm session leased from the broker. Hello was already done by the broker.
+        dut_conn = netconf_broker.BrokeredNetconf(BROKER_SOCKET, hostname = HOST_NAME, port = NETCONF_PORT,
+                                                  username = CPM_USER, password = CPM_PASSWORD)
+        dut_conn.connect()
+    else :
+        dut_conn = netconf_comm.MyNetconf(hostname = HOST_NAME, port = NETCONF_PORT, username = CPM_USER, password = CPM_PASSWORD, 
+                                          publicKey = "", publicKeyType = "", privateKeyFile = "", privateKeyType = "") 
+        dut_conn.connect()
+        # Perform get hello from DUT first.
+        netconf_comm._cmd_hello(dut_conn)
+
+    if CONFIG_CACHE_TTL not in ['', '0'] :
+        dut_conn.config_cache = netconf_comm.ConfigCache(ttl = float(CONFIG_CACHE_TTL))
+
+    yield dut_conn
+    dut_conn.close()
+
+@pytest.fixture(scope="session")
+def netconf_notifications():
+    """
+    Dedicated Netconf session subscribed to the NETCONF notification stream.
+    Waiters block on an event, for example netconf_notifications.wait_for_commit(timeout = 30)
+    """
+    logging.info("Fixture: netconf_notifications")
+
     import netconf_comm
     import configparser
 
@@ -240,12 +595,167 @@ def netconf_client():
     CPM_USER                = "admin"
     CPM_PASSWORD            = "admin"
 
+    # Not leased from the broker - once subscribed, the session only receives notifications
     dut_conn = netconf_comm.MyNetconf(hostname = HOST_NAME, port = NETCONF_PORT, username = CPM_USER, password = CPM_PASSWORD, 
                                       publicKey = "", publicKeyType = "", privateKeyFile = "", privateKeyType = "") 
     dut_conn.connect()
-
-    # Perform get hello from DUT first.
     netconf_comm._cmd_hello(dut_conn)
 
-    yield dut_conn
-    dut_conn.close()
+    notifications = netconf_comm.NotificationStream(dut_conn)
+    notifications.subscribe()
+
+    yield notifications
+    notifications.close()
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _test_transfer_files() :
+    """
+    Transfer through a stand-in SFTP client, that copies local files, and fails chosen files on their first attempts
+    """
+    import os
+    import time
+    import shutil
+    import tempfile
+    import threading
+
+    class FakeSftp(object) :
+        num_of_active = 0
+        max_active = 0
+        num_of_opens = 0
+        num_of_closes = 0
+        attempts = {}
+        lock = threading.Lock()
+
+        def __init__(self) :
+            with FakeSftp.lock :
+                FakeSftp.num_of_opens += 1
+
+        def _copy(self, source, destination) :
+            with FakeSftp.lock :
+                FakeSftp.num_of_active += 1
+                FakeSftp.max_active = max(FakeSftp.max_active, FakeSftp.num_of_active)
+                attempt = FakeSftp.attempts[source] = FakeSftp.attempts.get(source, 0) + 1
+            try :
+                time.sleep(0.05)
+                name = os.path.basename(source)
+                if name == "always_fails" or (name == "fails_twice" and attempt <= 2) :
+                    raise IOError(f"Failure {attempt} of {name}")
+                shutil.copyfile(source, destination)
+            finally :
+                with FakeSftp.lock :
+                    FakeSftp.num_of_active -= 1
+
+        def put(self, local_path, remote_path) :
+            self._copy(local_path, remote_path)
+            return os.stat(remote_path)
+
+        def get(self, remote_path, local_path) :
+            self._copy(remote_path, local_path)
+
+        def close(self) :
+            with FakeSftp.lock :
+                FakeSftp.num_of_closes += 1
+
+    class FakeSshClient(object) :
+        def open_sftp(self) :
+            return FakeSftp()
+
+    local_dir, remote_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    names = [f"file_{index}" for index in range(8)] + ["fails_twice"]
+    for index, name in enumerate(names) :
+        with open(os.path.join(local_dir, name), "wb") as f :
+            f.write(os.urandom(1000 * (index + 1)))
+
+    transfers = [(os.path.join(local_dir, name), os.path.join(remote_dir, name)) for name in names]
+    results = transfer_files(FakeSshClient(), TRANSFER_PUT, transfers, max_parallel = 4, backoff_seconds = 0.01)
+    assert [result.is_ok for result in results] == [True] * len(names)
+    assert [result.num_of_bytes for result in results] == [1000 * (index + 1) for index in range(len(names))]
+    assert results[-1].num_of_attempts == 3 and results[0].num_of_attempts == 1
+    assert FakeSftp.max_active == 4
+    # A channel per worker, reopened after each failure, and all closed
+    assert FakeSftp.num_of_opens == 4 + 2 and FakeSftp.num_of_closes == FakeSftp.num_of_opens
+
+    # Get back, with one file that fails all its attempts
+    with open(os.path.join(remote_dir, "always_fails"), "wb") as f :
+        f.write(b"x")
+    get_dir = tempfile.mkdtemp()
+    transfers = [(os.path.join(get_dir, name), os.path.join(remote_dir, name)) for name in names + ["always_fails"]]
+    try :
+        transfer_files(FakeSshClient(), TRANSFER_GET, transfers, num_of_retries = 2, backoff_seconds = 0.01)
+        assert False
+    except Exception as error :
+        assert "Failed get of 1 files" in str(error) and "always_fails" in str(error)
+    assert FakeSftp.attempts[os.path.join(remote_dir, "always_fails")] == 3
+    for name in names :
+        with open(os.path.join(local_dir, name), "rb") as source, open(os.path.join(get_dir, name), "rb") as copy :
+            assert source.read() == copy.read()
+
+    for directory in [local_dir, remote_dir, get_dir] :
+        shutil.rmtree(directory)
+    logging.info("_test_transfer_files passed")
+
+def _test_copy_files_from_local_to_dut() :
+    """
+    Remote targets resolved like scp - into a directory, onto a file, and into a missing directory
+    """
+    import os
+    import shutil
+    import tempfile
+
+    class FakeSftp(object) :
+        def stat(self, path) :
+            return os.stat(path)
+
+        def mkdir(self, path) :
+            os.mkdir(path)
+
+        def put(self, local_path, remote_path) :
+            shutil.copyfile(local_path, remote_path)
+            return os.stat(remote_path)
+
+        def close(self) :
+            pass
+
+    class FakeSshClient(object) :
+        def open_sftp(self) :
+            return FakeSftp()
+
+    local_dir, remote_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    local_files = [os.path.join(local_dir, name) for name in ["a.py", "b.py"]]
+    for file in local_files :
+        with open(file, "w") as f :
+            f.write(os.path.basename(file))
+
+    # Into an existing directory
+    results = copy_files_from_local_to_dut("3010", local_files, remote_dir, FakeSshClient())
+    assert [result.remote_path for result in results] == [os.path.join(remote_dir, "a.py"), os.path.join(remote_dir, "b.py")]
+
+    # A single file, onto a target file - new, then existing
+    for _ in range(2) :
+        results = copy_files_from_local_to_dut("3010", local_files[1:], os.path.join(remote_dir, "renamed.py"), FakeSshClient())
+        assert results[0].remote_path == os.path.join(remote_dir, "renamed.py")
+        with open(os.path.join(remote_dir, "renamed.py")) as f :
+            assert f.read() == "b.py"
+
+    # Several files onto a file
+    try :
+        copy_files_from_local_to_dut("3010", local_files, os.path.join(remote_dir, "renamed.py"), FakeSshClient())
+        assert False
+    except Exception as error :
+        assert "is not a directory" in str(error)
+
+    # Into a missing directory - created for several files, or for a path that ends with "/"
+    copy_files_from_local_to_dut("3010", local_files, os.path.join(remote_dir, "new_dir"), FakeSshClient())
+    copy_files_from_local_to_dut("3010", local_files[:1], os.path.join(remote_dir, "other_dir") + "/", FakeSshClient())
+    assert sorted(os.listdir(os.path.join(remote_dir, "new_dir"))) == ["a.py", "b.py"]
+    assert os.listdir(os.path.join(remote_dir, "other_dir")) == ["a.py"]
+
+    for directory in [local_dir, remote_dir] :
+        shutil.rmtree(directory)
+    logging.info("_test_copy_files_from_local_to_dut passed")
+
+if __name__ == "__main__" :
+    _test_transfer_files()
+    # _test_copy_files_from_local_to_dut()
@@ -0,0 +1,315 @@
+"""
+Bulk frame generation with NumPy, for scale tests - many source IPs hitting an ACL, DHCP clients across VLANs.
+Frames of one shape are built as rows of an (N, frame_len) uint8 matrix :
+    1. A base frame is packed once (struct, with the field values Scapy uses by default)
+    2. The base frame is broadcast into N rows, and the columns (src_ip, dst_ip, dst_mac, src_mac, vlan, tos, ports)
+       are written into their byte offsets, for all the rows at once
+    3. The IPv4 header and UDP checksums are computed over the matrix columns
+The matrix is then emitted as hex strings (tx_into_bcm.py input) or as a pcap file, without per frame Python objects.
+Columns are either a scalar (same value in all the frames), or a sequence of N values - Strings such as '10.0.0.1' and
+'1e:94:a0:04:17:06', or integer arrays.
+NumPy is imported on use - importing this module does not require it.
+"""
+import socket
+import struct
+import logging
+
+L4_NONE = "none"
+L4_ICMP = "icmp"
+L4_UDP  = "udp"
+
+ETH_HEADER_LEN  = 14
+VLAN_TAG_LEN    = 4
+IP_HEADER_LEN   = 20
+UDP_HEADER_LEN  = 8
+ETH_TYPE_IPV4   = 0x0800
+ETH_TYPE_VLAN   = 0x8100
+IP_PROTO_ICMP   = 1
+IP_PROTO_UDP    = 17
+DEFAULT_SRC_MAC = "00:15:5d:00:00:01"
+
+# pcap file format
+PCAP_GLOBAL_HEADER = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+PCAP_RECORD_HEADER_LEN = 16
+
+def _get_num_of_frames(columns) -> int :
+    """
+    Return value : The number of values of the sequence columns, which must be equal. 1 if all are scalars.
+    """
+    lengths = {len(column) for column in columns if hasattr(column, "__len__") and not isinstance(column, (str, bytes))}
+    if len(lengths) > 1 :
+        raise Exception (f"Columns of different lengths: {sorted(lengths)}")
+    return lengths.pop() if len(lengths) == 1 else 1
+
+def _ip_column(values, num_of_frames: int) :
+    """
+    Return value : uint32 array of IPv4 addresses
+    """
+    import numpy as np
+
+    if isinstance(values, str) :
+        values = [values]
+    if isinstance(values, np.ndarray) and values.dtype.kind in "ui" :
+        column = values.astype(np.uint32)
+    else :
+        column = np.frombuffer(b"".join(map(socket.inet_aton, values)), dtype = ">u4").astype(np.uint32)
+    return np.broadcast_to(column, (num_of_frames,))
+
+def _mac_column(values, num_of_frames: int) :
+    """
+    Return value : (N, 6) uint8 array of MAC addresses
+    """
+    import numpy as np
+
+    if isinstance(values, str) :
+        values = [values]
+    if isinstance(values, np.ndarray) and values.dtype.kind in "ui" :
+        column = values.astype(">u8").view(np.uint8).reshape(-1, 8)[:, 2:]
+    else :
+        column = np.frombuffer(bytes.fromhex("".join(values).replace(":", "")), dtype = np.uint8).reshape(-1, 6)
+    return np.broadcast_to(column, (num_of_frames, 6))
+
+def _int_column(values, num_of_frames: int, dtype) :
+    import numpy as np
+
+    return np.broadcast_to(np.asarray(values, dtype = dtype), (num_of_frames,))
+
+def _write_column(matrix, offset: int, column, num_of_bytes: int) :
+    """
+    Write an integer column, big endian, into num_of_bytes columns of the matrix
+    """
+    import numpy as np
+
+    matrix[:, offset : offset + num_of_bytes] = column.astype(f">u{num_of_bytes}")[:, None].view(np.uint8)
+
+def _checksum(matrix, start: int, end: int, initial = 0) :
+    """
+    Return value : uint16 array of the Internet checksums of matrix[:, start : end], per row.
+                   initial - Sum to add, such as the UDP pseudo header
+    """
+    import numpy as np
+
+    words = matrix[:, start : end].astype(np.uint32)
+    if (end - start) % 2 == 1 :
+        words = np.concatenate([words, np.zeros((len(matrix), 1), dtype = np.uint32)], axis = 1)
+    total = (words[:, 0::2] << 8 | words[:, 1::2]).sum(axis = 1, dtype = np.uint64) + initial
+    for _ in range(3) :
+        total = (total & 0xffff) + (total >> 16)
+    return (~total & 0xffff).astype(np.uint16)
+
+def internet_checksum(data: bytes) -> int :
+    """
+    Return value : The Internet checksum of one frame's data. See _checksum() for the checksums of a matrix.
+    """
+    if len(data) % 2 == 1 :
+        data = bytes(data) + b"\x00"
+    checksum = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while checksum > 0xffff :
+        checksum = (checksum & 0xffff) + (checksum >> 16)
+    return ~checksum & 0xffff
+
+def create_base_frame(is_vlan: bool, l4: str, payload: bytes) -> bytes :
+    """
+    Ether [/ Dot1Q] / IP [/ ICMP echo request | / UDP] / payload, packed with struct. Also the frame of
+    packet_creator.build_frame_struct(), which writes the field values into it.
+    Return value : Frame with zero addresses, tos, VLAN id, ports and checksums. IP fields as Scapy defaults (id 1, ttl 64)
+    """
+    if l4 == L4_ICMP :
+        # Echo request, identifier and sequence 0
+        l4_header = struct.pack("!BBHHH", 8, 0, 0, 0, 0)
+        proto = IP_PROTO_ICMP
+    elif l4 == L4_UDP :
+        l4_header = struct.pack("!HHHH", 0, 0, UDP_HEADER_LEN + len(payload), 0)
+        proto = IP_PROTO_UDP
+    elif l4 == L4_NONE :
+        l4_header = b""
+        proto = 0
+    else :
+        raise Exception (f"Unrecognized L4: {l4}")
+
+    ip_header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, IP_HEADER_LEN + len(l4_header) + len(payload), 1, 0, 64, proto, 0,
+                            bytes(4), bytes(4))
+    eth_header = bytes(12)
+    if is_vlan :
+        eth_header += struct.pack("!HH", ETH_TYPE_VLAN, 0)
+    eth_header += struct.pack("!H", ETH_TYPE_IPV4)
+    return eth_header + ip_header + l4_header + payload
+
+def create_frame_matrix(src_ip, dst_ip, dst_mac,
+                        src_mac = DEFAULT_SRC_MAC,
+                        vlan = None,
+                        tos = 0,
+                        l4 = L4_ICMP,
+                        src_port = 68,
+                        dst_port = 67,
+                        payload: bytes = b"") :
+    """
+    Create N frames of one shape : Ether [/ Dot1Q] / IP [/ ICMP echo request | / UDP] / payload
+    Input : src_ip, dst_ip - Column of IPv4 addresses
+            dst_mac, src_mac - Column of MAC addresses
+            vlan - None for untagged frames, otherwise column of VLAN ids
+            tos - Column of IP TOS bytes
+            l4 - L4_ICMP, L4_UDP or L4_NONE
+            src_port, dst_port - Column of UDP ports. Used with L4_UDP.
+            payload - Bytes following the L4 header, same in all the frames
+    Return value : (N, frame_len) uint8 numpy array
+    """
+    import numpy as np
+
+    columns = [src_ip, dst_ip, dst_mac, src_mac, tos] + ([vlan] if vlan is not None else []) + \
+              ([src_port, dst_port] if l4 == L4_UDP else [])
+    num_of_frames = _get_num_of_frames(columns)
+
+    base_frame = create_base_frame(vlan is not None, l4, payload)
+    matrix = np.empty((num_of_frames, len(base_frame)), dtype = np.uint8)
+    matrix[:] = np.frombuffer(base_frame, dtype = np.uint8)
+
+    ip_offset = ETH_HEADER_LEN + (VLAN_TAG_LEN if vlan is not None else 0)
+    l4_offset = ip_offset + IP_HEADER_LEN
+
+    src_ips = _ip_column(src_ip, num_of_frames)
+    dst_ips = _ip_column(dst_ip, num_of_frames)
+    matrix[:, 0 : 6]  = _mac_column(dst_mac, num_of_frames)
+    matrix[:, 6 : 12] = _mac_column(src_mac, num_of_frames)
+    if vlan is not None :
+        _write_column(matrix, 14, _int_column(vlan, num_of_frames, np.uint16) & 0x0fff, 2)
+    matrix[:, ip_offset + 1] = _int_column(tos, num_of_frames, np.uint8)
+    _write_column(matrix, ip_offset + 12, src_ips, 4)
+    _write_column(matrix, ip_offset + 16, dst_ips, 4)
+    _write_column(matrix, ip_offset + 10, _checksum(matrix, ip_offset, l4_offset), 2)
+
+    if l4 == L4_ICMP :
+        _write_column(matrix, l4_offset + 2, _checksum(matrix, l4_offset, matrix.shape[1]), 2)
+    elif l4 == L4_UDP :
+        _write_column(matrix, l4_offset,     _int_column(src_port, num_of_frames, np.uint16), 2)
+        _write_column(matrix, l4_offset + 2, _int_column(dst_port, num_of_frames, np.uint16), 2)
+        udp_len = matrix.shape[1] - l4_offset
+        pseudo_header = (src_ips >> 16).astype(np.uint64) + (src_ips & 0xffff) + (dst_ips >> 16) + (dst_ips & 0xffff) + \
+                        IP_PROTO_UDP + udp_len
+        udp_checksum = _checksum(matrix, l4_offset, matrix.shape[1], pseudo_header)
+        # A computed 0 is sent as 0xffff - 0 means no checksum
+        udp_checksum[udp_checksum == 0] = 0xffff
+        _write_column(matrix, l4_offset + 6, udp_checksum, 2)
+
+    return matrix
+
+def frame_matrix_to_hex(matrix) -> list :
+    """
+    Return value : List of the String representations of the hex frame values, such as passed to tx_into_bcm.py
+    """
+    frame_len = matrix.shape[1] * 2
+    hex_frames = matrix.tobytes().hex()
+    return [hex_frames[index : index + frame_len] for index in range(0, len(hex_frames), frame_len)]
+
+def write_pcap(matrix, path: str, frames_per_second: int = 1000) :
+    """
+    Write the frames into a pcap file, in one write
+    Input : frames_per_second - Timestamps spacing of the frames
+    """
+    import numpy as np
+
+    num_of_frames, frame_len = matrix.shape
+    records = np.empty((num_of_frames, PCAP_RECORD_HEADER_LEN + frame_len), dtype = np.uint8)
+    timestamps_usec = np.arange(num_of_frames, dtype = np.uint64) * 1000000 // frames_per_second
+    record_headers = np.empty((num_of_frames, 4), dtype = "<u4")
+    record_headers[:, 0] = timestamps_usec // 1000000
+    record_headers[:, 1] = timestamps_usec % 1000000
+    record_headers[:, 2] = frame_len
+    record_headers[:, 3] = frame_len
+    records[:, : PCAP_RECORD_HEADER_LEN] = record_headers.view(np.uint8)
+    records[:, PCAP_RECORD_HEADER_LEN :] = matrix
+
+    with open(path, "wb") as f :
+        f.write(PCAP_GLOBAL_HEADER)
+        f.write(records.tobytes())
+    logging.info(f"Wrote {num_of_frames} frames of {frame_len} bytes into {path}")
+
+def ip_range(start_ip: str, num_of_ips: int) :
+    """
+    Return value : uint32 array of num_of_ips consecutive IPv4 addresses, starting at start_ip
+    """
+    import numpy as np
+
+    start = struct.unpack("!I", socket.inet_aton(start_ip))[0]
+    return np.arange(start, start + num_of_ips, dtype = np.uint64).astype(np.uint32)
+
+def mac_range(start_mac: str, num_of_macs: int) :
+    """
+    Return value : uint64 array of num_of_macs consecutive MAC addresses, starting at start_mac
+    """
+    import numpy as np
+
+    start = int(start_mac.replace(":", ""), 16)
+    return np.arange(start, start + num_of_macs, dtype = np.uint64)
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _test_frame_matrix() :
+    import os
+    import tempfile
+    import numpy as np
+
+    # Frames of packet_creator docstrings, built by Scapy
+    matrix = create_frame_matrix('1.2.3.4', '1.2.3.3', '1e:94:a0:04:17:06', src_mac = '00:15:5d:cd:ff:07')
+    assert frame_matrix_to_hex(matrix) == ['1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000']
+    matrix = create_frame_matrix('54.46.1.2', '54.47.1.2', '90:3c:b3:04:60:31', src_mac = '00:15:5d:e2:7a:69', tos = 0x88, l4 = L4_NONE)
+    assert frame_matrix_to_hex(matrix) == ['903cb304603100155de27a690800458800140001000040000c01362e0102362f0102']
+
+    # Columns
+    src_ips = ip_range('10.0.0.250', 10)
+    matrix = create_frame_matrix(src_ips, ['20.0.0.1'] * 10, '1e:94:a0:04:17:06', tos = np.arange(10), vlan = np.arange(100, 110))
+    assert matrix.shape == (10, 46)
+    assert socket.inet_ntoa(matrix[9, 30 : 34].tobytes()) == '10.0.1.3'
+    assert matrix[3, 12 : 16].tobytes().hex() == '81000067' and matrix[3, 19] == 3
+
+    # UDP checksum, against a checksum of each frame
+    macs = mac_range('02:00:00:00:00:fe', 1000)
+    matrix = create_frame_matrix('0.0.0.0', '255.255.255.255', 'ff:ff:ff:ff:ff:ff', src_mac = macs, vlan = 7, l4 = L4_UDP,
+                                 src_port = np.arange(1000, 2000), payload = b"\x01\x01\x06\x00" + bytes(13))
+    assert matrix[2, 6 : 12].tobytes().hex() == '020000000100'
+    for frame in matrix[::97] :
+        frame = frame.tobytes()
+        udp = frame[38:]
+        pseudo_header = frame[30 : 38] + struct.pack("!HH", IP_PROTO_UDP, len(udp))
+        data = pseudo_header + udp[:6] + b"\x00\x00" + udp[8:] + b"\x00"
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data[: len(data) // 2 * 2]))
+        while total > 0xffff :
+            total = (total & 0xffff) + (total >> 16)
+        assert struct.unpack("!H", udp[6:8])[0] == (~total & 0xffff or 0xffff)
+
+    path = os.path.join(tempfile.mkdtemp(), "frames.pcap")
+    write_pcap(matrix, path)
+    with open(path, "rb") as f :
+        data = f.read()
+    assert len(data) == len(PCAP_GLOBAL_HEADER) + 1000 * (PCAP_RECORD_HEADER_LEN + matrix.shape[1])
+    assert data[len(PCAP_GLOBAL_HEADER) + PCAP_RECORD_HEADER_LEN :][: matrix.shape[1]] == matrix[0].tobytes()
+    os.remove(path)
+
+    try :
+        create_frame_matrix(['1.1.1.1', '2.2.2.2'], ['1.1.1.1'] * 3, '1e:94:a0:04:17:06')
+        assert False
+    except Exception as error :
+        assert "different lengths" in str(error)
+
+    logging.info("_test_frame_matrix passed")
+
+def _benchmark_frame_matrix(num_of_frames = 100000) :
+    import time
+
+    start = time.perf_counter()
+    matrix = create_frame_matrix(ip_range('10.0.0.1', num_of_frames), '20.0.0.1', '1e:94:a0:04:17:06')
+    matrix_time = time.perf_counter() - start
+    start = time.perf_counter()
+    frame_matrix_to_hex(matrix)
+    hex_time = time.perf_counter() - start
+    logging.info(f"{num_of_frames} ICMP frames : matrix {matrix_time * 1000:.1f} ms, hex strings {hex_time * 1000:.1f} ms")
+
+if __name__ == "__main__" :
+    # Logging is configured by the entry point - Importing this module (through packet_creator) does not configure it
+    logging.basicConfig(
+                        format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                        level=logging.INFO,
+                        datefmt='%H:%M:%S')
+    # _test_frame_matrix()
+    # _benchmark_frame_matrix()
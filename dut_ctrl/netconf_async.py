@@ -0,0 +1,248 @@
+"""
+Asyncio Netconf client, for configuring several DUTs concurrently.
+Each AsyncNetconf wraps a blocking MyNetconf session, and runs its calls in an executor thread,
+so a coroutine can drive many DUTs at once. The netconf_comm cmd_set_* / cmd_get_* commands are available
+as coroutine methods, without the dut_conn argument :
+
+    async def configure_lab(hosts) :
+        connections = await connect_all(hosts, port = 2022, username = "admin", password = "admin")
+        dut_conns = [connection for connection in connections if isinstance(connection, AsyncNetconf)]
+        results = await fan_out(dut_conns, "cmd_set_acl_policy__r1_deny_default_permit__src_ip",
+                                "pol_ipv4", "10.6.6.3", "operation=\\"replace\\"", max_parallel = 4)
+        await close_all(dut_conns)
+
+    asyncio.run(configure_lab(["10.3.4.1", "10.3.10.1", "10.3.54.1", "10.3.62.1"]))
+"""
+import asyncio
+import functools
+import logging
+
+logging.basicConfig(
+                    format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                    level=logging.INFO,
+                    datefmt='%H:%M:%S')
+
+import netconf_comm
+from cli_control import get_time
+
+# Default bound of DUTs handled at the same time
+MAX_PARALLEL_DUTS = 8
+
+class AsyncNetconf(object):
+    """
+    Asyncio wrapper of a MyNetconf session.
+    Calls on the same DUT are serialized (MyNetconf is not thread safe), calls on different DUTs run concurrently.
+    Input : dut_conn - MyNetconf connection, after hello
+            executor - concurrent.futures executor to run the blocking calls in. None for the loop default executor.
+    """
+    def __init__(self, dut_conn, executor=None):
+        self.dut_conn = dut_conn
+        self.executor = executor
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, hostname, port, username, password, executor=None):
+        """
+        Open a Netconf session to a DUT, and perform hello
+        Return value : AsyncNetconf connection. Raises ConnectionError if the session could not be opened.
+        """
+        def connect_session() :
+            dut_conn = netconf_comm.MyNetconf(hostname = hostname, port = port, username = username, password = password,
+                                              publicKey = "", publicKeyType = "", privateKeyFile = "", privateKeyType = "")
+            try :
+                dut_conn.connect()
+                netconf_comm._cmd_hello(dut_conn)
+            except SystemExit :
+                # netconf_comm helpers exit on some failures - Do not let one DUT stop the interpreter and the other DUTs
+                raise ConnectionError(f"Failed to open a Netconf session to {hostname}/{port}")
+            return dut_conn
+
+        loop = asyncio.get_running_loop()
+        dut_conn = await loop.run_in_executor(executor, connect_session)
+        return cls(dut_conn, executor)
+
+    @property
+    def hostname(self):
+        return self.dut_conn.hostname
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(dut_conn, *args, **kwargs) in the executor
+        Return value : Return value of func
+        """
+        loop = asyncio.get_running_loop()
+        async with self.lock :
+            return await loop.run_in_executor(self.executor, functools.partial(func, self.dut_conn, *args, **kwargs))
+
+    def __getattr__(self, name):
+        # netconf_comm commands, as coroutine methods. For example await async_conn.cmd_get_ctrl_plane_acl_name("egress")
+        if not name.startswith("cmd_") or not hasattr(netconf_comm, name) :
+            raise AttributeError(name)
+        return functools.partial(self.run, getattr(netconf_comm, name))
+
+    async def close(self):
+        await self.run(netconf_comm.MyNetconf.close)
+
+# ***************************************************************************************
+# Multi DUT functions
+# ***************************************************************************************
+async def connect_all(hostnames, port, username, password, max_parallel=MAX_PARALLEL_DUTS, executor=None) :
+    """
+    Connect to several DUTs concurrently
+    Input : hostnames - List of DUT host names (CPM addresses, such as "10.3.4.1")
+            max_parallel - Maximal number of connections opened at the same time
+    Return value : List of AsyncNetconf, in the order of hostnames.
+                   A DUT that failed to connect has its exception in the list, so one unreachable DUT does not stop the others.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def connect(hostname) :
+        async with semaphore :
+            logging.info(f"{get_time()} Connecting to {hostname}")
+            try :
+                return await AsyncNetconf.connect(hostname, port, username, password, executor)
+            except Exception as error :
+                logging.error(f"{get_time()} Failed to connect to {hostname}: {error}")
+                return error
+
+    return await asyncio.gather(*[connect(hostname) for hostname in hostnames])
+
+async def fan_out(async_conns, command, *args, max_parallel=MAX_PARALLEL_DUTS, **kwargs) :
+    """
+    Run the same command on several DUTs concurrently, at most max_parallel DUTs at a time.
+    Input : async_conns - List of AsyncNetconf
+            command - Name of a netconf_comm command (such as "cmd_set_ctrl_plane_acl"),
+                      or a function called as command(dut_conn, *args, **kwargs) in the executor
+    Return value : List of the command return values, in the order of async_conns.
+                   A command that raised has its exception in the list, so one failing DUT does not stop the others.
+    """
+    if isinstance(command, str) :
+        command = getattr(netconf_comm, command)
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def run_command(async_conn) :
+        async with semaphore :
+            try :
+                return await async_conn.run(command, *args, **kwargs)
+            except Exception as error :
+                logging.error(f"{get_time()} {command.__name__} failed on {async_conn.hostname}: {error}")
+                return error
+
+    return await asyncio.gather(*[run_command(async_conn) for async_conn in async_conns])
+
+async def close_all(async_conns) :
+    """
+    Input : async_conns - List of AsyncNetconf. connect_all failures (exceptions) in the list are skipped.
+    """
+    await asyncio.gather(*[async_conn.close() for async_conn in async_conns if isinstance(async_conn, AsyncNetconf)],
+                         return_exceptions=True)
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _test_fan_out(num_of_duts=10, max_parallel=4, latency=0.05) :
+    """
+    Configure stand-in DUTs concurrently. Verify the results, the parallelism bound,
+    and the speedup over configuring the DUTs one after the other.
+    """
+    import re
+    import time
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    state = {"in_flight" : 0, "max_in_flight" : 0}
+    state_lock = threading.Lock()
+
+    def leave() :
+        with state_lock :
+            state["in_flight"] -= 1
+
+    def reply_handler(rpc) :
+        with state_lock :
+            state["in_flight"] += 1
+            state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        # The reply is sent latency seconds later - Count the rpc as in flight until then
+        threading.Timer(latency, leave).start()
+        message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+        if b"get-config" in rpc :
+            return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}">
+                <data><ctrl-plane xmlns="http://compass-eos.com/ns/compass_yang"><policy><acl><egress>my</egress></acl></policy></ctrl-plane></data>
+                </rpc-reply>"""
+        return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}"><ok/></rpc-reply>"""
+
+    def create_duts() :
+        dut_conns = []
+        for index in range(num_of_duts) :
+            dut_conn = netconf_comm._NetconfStandIn(['1.0', '1.1'], reply_handler, latency=latency).create_client()
+            dut_conn.hostname = f"dut_{index}"
+            netconf_comm._cmd_hello(dut_conn)
+            dut_conn.ssh = dut_conn.chan
+            dut_conns.append(dut_conn)
+        return dut_conns
+
+    # Serial - edit-config and commit per DUT
+    start = time.perf_counter()
+    for dut_conn in create_duts() :
+        assert netconf_comm.cmd_set_ctrl_plane_acl(dut_conn, "egress", "", "pol_ipv4") == True
+        dut_conn.close()
+    serial_time = time.perf_counter() - start
+
+    async def configure() :
+        async_conns = [AsyncNetconf(dut_conn, executor) for dut_conn in create_duts()]
+        results = await fan_out(async_conns, "cmd_set_ctrl_plane_acl", "egress", "", "pol_ipv4", max_parallel=max_parallel)
+        names = await asyncio.gather(*[async_conn.cmd_get_ctrl_plane_acl_name("egress") for async_conn in async_conns])
+        await close_all(async_conns)
+        return results, names
+
+    executor = ThreadPoolExecutor(max_workers=max_parallel)
+    state["max_in_flight"] = 0
+    start = time.perf_counter()
+    results, names = asyncio.run(configure())
+    parallel_time = time.perf_counter() - start
+    executor.shutdown()
+
+    assert results == [True] * num_of_duts
+    assert names == ["my"] * num_of_duts
+    assert state["max_in_flight"] <= max_parallel
+    assert parallel_time < serial_time
+    logging.info(f"{get_time()} _test_fan_out passed. {num_of_duts} DUTs, {latency * 1000:.0f} ms RTT: "
+                 f"serial {serial_time * 1000:.0f} ms, fan out of {max_parallel} {parallel_time * 1000:.0f} ms")
+
+def _test_connect_all() :
+    """
+    Connect to a reachable DUT, an unreachable DUT, and a DUT whose connection exits.
+    Verify the failures are returned per host, and do not stop the interpreter or the reachable DUT.
+    """
+    import sys
+
+    def reply_handler(rpc) :
+        return "<rpc-reply/>"
+
+    def connect(dut_conn) :
+        if dut_conn.hostname == "exit" :
+            sys.exit(1)
+        if dut_conn.hostname == "unreachable" :
+            raise ConnectionError(f"Failed to connect to {dut_conn.hostname}/{dut_conn.port}")
+        dut_conn.chan = netconf_comm._NetconfStandIn(['1.0', '1.1'], reply_handler).client_chan
+        dut_conn.ssh = dut_conn.chan
+
+    async def connect_duts() :
+        connections = await connect_all(["reachable", "unreachable", "exit"], port=2022, username="admin", password="admin")
+        await close_all(connections)
+        return connections
+
+    original_connect = netconf_comm.MyNetconf.connect
+    netconf_comm.MyNetconf.connect = connect
+    try :
+        connections = asyncio.run(connect_duts())
+    finally :
+        netconf_comm.MyNetconf.connect = original_connect
+
+    assert isinstance(connections[0], AsyncNetconf) and connections[0].hostname == "reachable"
+    assert isinstance(connections[1], ConnectionError)
+    assert isinstance(connections[2], ConnectionError)
+    logging.info(f"{get_time()} _test_connect_all passed")
+
+if __name__ == "__main__" :
+    _test_fan_out()
+    _test_connect_all()
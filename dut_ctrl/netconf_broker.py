@@ -0,0 +1,582 @@
+"""
+Local broker of warm Netconf sessions to DUTs.
+The broker keeps Netconf sessions open (SSH handshake and hello done once), and leases them to
+test processes over a Unix socket, so a test stage does not open its own session per DUT.
+
+Run the broker on the test machine (it is left running between Jenkins stages) :
+    python netconf_broker.py [socket_path]
+Test processes connect through BrokeredNetconf. fixtures.netconf_client uses it when
+BROKER_SOCKET in config.ini [NETCONF] points to a running broker.
+
+Lease protocol, over the Unix socket :
+    client -> broker : Lease request JSON line {"hostname", "port", "username", "password"}
+    broker -> client : Lease reply JSON line {"status" : "ok", "capabilities" : [...]} or {"status" : "error", "error" : ...}
+    Then Netconf rpcs and rpc-replies, in chunked framing (RFC 6242), until the client closes the socket.
+A lease is exclusive - each concurrent client gets a session of its own.
+The broker counts rpcs and rpc-replies, so notifications (create-subscription) are not supported over a lease.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import socket
+import threading
+import configparser
+import logging
+
+logging.basicConfig(
+                    format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                    level=logging.INFO,
+                    datefmt='%H:%M:%S')
+
+import netconf_comm
+from cli_control import get_time
+
+DEFAULT_SOCKET_PATH = "/tmp/netconf_broker.sock"
+# Idle sessions are closed after this time, so a DUT gets a fresh session once a day
+SESSION_IDLE_TIMEOUT = 24 * 3600
+MAX_SESSIONS_PER_DUT = 4
+# SSH keepalive of idle sessions, in seconds
+SESSION_KEEPALIVE = 60
+# Time to wait for the rpc-replies of a client that left in the middle of an rpc
+RELEASE_REPLY_TIMEOUT = 60
+# Time to wait for the reply of the rpc that checks an idle session before it is leased
+SESSION_PROBE_TIMEOUT = 10
+
+# ***************************************************************************************
+# Broker
+# ***************************************************************************************
+def connect_session(hostname, port, username, password) :
+    """
+    Open a Netconf session to a DUT, and perform hello.
+    Return value : MyNetconf connection
+    """
+    dut_conn = netconf_comm.MyNetconf(hostname = hostname, port = port, username = username, password = password,
+                                      publicKey = "", publicKeyType = "", privateKeyFile = "", privateKeyType = "")
+    dut_conn.connect()
+    dut_conn.ssh.set_keepalive(SESSION_KEEPALIVE)
+    netconf_comm._cmd_hello(dut_conn)
+    return dut_conn
+
+class NetconfBroker(object):
+    """
+    Keep warm Netconf sessions, by DUT and credentials (see _get_session_key()), and lease them to clients over a Unix socket.
+    Input : socket_path - Path of the Unix socket to listen on
+            session_factory - Function (hostname, port, username, password) returning a connected MyNetconf
+                              after hello. connect_session() by default.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, session_factory=connect_session,
+                 idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions_per_dut=MAX_SESSIONS_PER_DUT, probe_timeout=SESSION_PROBE_TIMEOUT):
+        self.socket_path = socket_path
+        self.session_factory = session_factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions_per_dut = max_sessions_per_dut
+        self.probe_timeout = probe_timeout
+        # DUT key -> List of [idle since, MyNetconf]
+        self.idle_sessions = {}
+        # DUT key -> Number of open sessions, idle or leased
+        self.num_of_sessions = {}
+        self.sessions_changed = threading.Condition()
+        self.server_sock = None
+        self.is_running = False
+
+    def serve_forever(self):
+        """
+        Accept lease requests until shutdown(). Each client is served by a thread of its own.
+        """
+        if os.path.exists(self.socket_path) :
+            # Left by a previous broker
+            os.unlink(self.socket_path)
+        self.server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.server_sock.listen()
+        self.is_running = True
+        logging.info(f"{get_time()} Netconf broker listening on {self.socket_path}")
+
+        threading.Thread(target=self._expire_idle_sessions, daemon=True).start()
+        while self.is_running :
+            try :
+                client_sock, _ = self.server_sock.accept()
+            except OSError :
+                # Closed by shutdown()
+                break
+            threading.Thread(target=self._serve_client, args=(client_sock,), daemon=True).start()
+
+    def shutdown(self):
+        """
+        Stop accepting leases, and close the idle sessions
+        """
+        self.is_running = False
+        if self.server_sock != None :
+            self.server_sock.close()
+            os.unlink(self.socket_path)
+        with self.sessions_changed :
+            closed_sessions = [(key, dut_conn) for key, sessions in self.idle_sessions.items() for _, dut_conn in sessions]
+            for key, _ in closed_sessions :
+                self._remove_session(key)
+            self.idle_sessions.clear()
+        for key, dut_conn in closed_sessions :
+            self._close_session(key, dut_conn)
+
+    def _serve_client(self, client_sock):
+        client = netconf_comm.MyNetconf(hostname = "localhost", port = 0, username = "", password = "", publicKey = "", publicKeyType = "")
+        client.chan = netconf_comm.SocketChannel(client_sock)
+        client.framing = netconf_comm.FRAMING_1_1
+
+        try :
+            line = _recv_line(client_sock)
+        except Exception :
+            # Connected without a lease request, such as is_broker_running()
+            client.chan.close()
+            return
+
+        try :
+            request = json.loads(line)
+            key = _get_session_key(request["hostname"], request["port"], request["username"], request["password"])
+            dut_conn = self._acquire(key, request["password"])
+        except Exception as error :
+            logging.error(f"{get_time()} Lease request failed: {error}")
+            try :
+                _send_line(client_sock, {"status" : "error", "error" : str(error)})
+            except socket.error :
+                pass
+            client.chan.close()
+            return
+
+        logging.info(f"{get_time()} Leasing session to {key[:3]}")
+        _send_line(client_sock, {"status" : "ok", "capabilities" : dut_conn.capabilities})
+        is_healthy = self._relay(client, dut_conn)
+        self._release(key, dut_conn, is_healthy)
+        # Closing the socket tells the client that the session is released
+        client.chan.close()
+
+    def _acquire(self, key, password):
+        """
+        Return value : An idle session to the DUT, or a new one. Waits while the DUT has max_sessions_per_dut leased.
+                       An idle session is checked first - one broken meanwhile (such as by a DUT reboot) is closed, not leased.
+        """
+        while True :
+            dut_conn = None
+            with self.sessions_changed :
+                while True :
+                    if len(self.idle_sessions.get(key, [])) > 0 :
+                        _, dut_conn = self.idle_sessions[key].pop()
+                        break
+                    if self.num_of_sessions.get(key, 0) < self.max_sessions_per_dut :
+                        self.num_of_sessions[key] = self.num_of_sessions.get(key, 0) + 1
+                        break
+                    self.sessions_changed.wait()
+            if dut_conn == None :
+                break
+            if _is_session_alive(dut_conn, self.probe_timeout) :
+                return dut_conn
+            logging.warning(f"{get_time()} Idle Netconf session to {key[:3]} is broken, closing it")
+            with self.sessions_changed :
+                self._remove_session(key)
+                self.sessions_changed.notify()
+            self._close_session(key, dut_conn)
+
+        logging.info(f"{get_time()} Opening Netconf session to {key[:3]}")
+        dut_conn = None
+        try :
+            dut_conn = self.session_factory(key[0], key[1], key[2], password)
+            return dut_conn
+        finally :
+            if dut_conn == None :
+                # Connect failed - The session slot is given back
+                with self.sessions_changed :
+                    self.num_of_sessions[key] -= 1
+                    self.sessions_changed.notify()
+
+    def _release(self, key, dut_conn, is_healthy):
+        """
+        Return a leased session to the idle sessions. Uncommitted candidate changes of the client are discarded first.
+        Broken sessions are closed.
+        """
+        if is_healthy :
+            try :
+                is_healthy = _discard_changes(dut_conn, RELEASE_REPLY_TIMEOUT)
+            except Exception as error :
+                logging.error(f"{get_time()} Failed discarding changes of {key[:3]}: {error}")
+                is_healthy = False
+
+        with self.sessions_changed :
+            is_kept = is_healthy and self.is_running
+            if is_kept :
+                self.idle_sessions.setdefault(key, []).append([time.monotonic(), dut_conn])
+            else :
+                self._remove_session(key)
+            self.sessions_changed.notify()
+        if not is_kept :
+            self._close_session(key, dut_conn)
+
+    def _remove_session(self, key):
+        """
+        Remove a session from the count of open sessions, before it is closed. Called with sessions_changed held.
+        """
+        self.num_of_sessions[key] -= 1
+
+    def _close_session(self, key, dut_conn):
+        """
+        Close a session, after _remove_session(). Called without sessions_changed held - An SSH teardown may be slow,
+        and must not block the leases and releases of other sessions.
+        """
+        logging.info(f"{get_time()} Closing Netconf session to {key[:3]}")
+        try :
+            dut_conn.close()
+        except Exception as error :
+            logging.error(f"{get_time()} Failed closing session to {key[:3]}: {error}")
+
+    def _expire_idle_sessions(self):
+        while self.is_running :
+            time.sleep(min(60, self.idle_timeout))
+            now = time.monotonic()
+            closed_sessions = []
+            with self.sessions_changed :
+                for key, sessions in self.idle_sessions.items() :
+                    for session in [session for session in sessions if now - session[0] > self.idle_timeout] :
+                        sessions.remove(session)
+                        self._remove_session(key)
+                        closed_sessions.append((key, session[1]))
+                self.sessions_changed.notify_all()
+            for key, dut_conn in closed_sessions :
+                self._close_session(key, dut_conn)
+
+    def _relay(self, client, dut_conn):
+        """
+        Relay rpcs from the client to the DUT, and rpc-replies back, until the client closes the socket.
+        Replies are read by a thread of their own, so pipelined rpcs (NetconfPipeline) are relayed as is.
+        Return value : False if the DUT session is broken, True otherwise
+        """
+        state = {"outstanding" : 0, "client_closed" : False, "dut_closed" : False}
+        state_changed = threading.Condition()
+
+        def relay_replies() :
+            while True :
+                with state_changed :
+                    while state["outstanding"] == 0 and not state["client_closed"] :
+                        state_changed.wait()
+                    if state["outstanding"] == 0 :
+                        return
+                try :
+                    reply = _recv_complete_msg(dut_conn, RELEASE_REPLY_TIMEOUT if state["client_closed"] else None)
+                except socket.timeout :
+                    reply = None
+                if reply == None :
+                    with state_changed :
+                        state["dut_closed"] = True
+                    # Closing the client socket wakes up the main loop, and the client gets EOF instead of waiting for a reply
+                    client.chan.close()
+                    return
+                try :
+                    client.send_msg(reply.decode('utf-8'))
+                except socket.error :
+                    # The client left - The remaining replies are still read, keeping the session in sync
+                    pass
+                with state_changed :
+                    state["outstanding"] -= 1
+
+        reply_thread = threading.Thread(target=relay_replies, daemon=True)
+        reply_thread.start()
+
+        while True :
+            try :
+                rpc = _recv_complete_msg(client)
+            except socket.error :
+                rpc = None
+            if rpc == None :
+                # Client closed the socket. A partial rpc (its framing is not complete) is dropped.
+                break
+            with state_changed :
+                if state["dut_closed"] :
+                    break
+                state["outstanding"] += 1
+                state_changed.notify()
+            try :
+                dut_conn.send_msg(rpc.decode('utf-8'))
+            except Exception as error :
+                logging.error(f"{get_time()} Failed relaying rpc to the DUT: {error}")
+                with state_changed :
+                    state["dut_closed"] = True
+                client.chan.close()
+                break
+
+        with state_changed :
+            state["client_closed"] = True
+            state_changed.notify()
+        reply_thread.join()
+        return not state["dut_closed"] and state["outstanding"] == 0
+
+# ***************************************************************************************
+# Broker client
+# ***************************************************************************************
+class BrokeredNetconf(netconf_comm.MyNetconf):
+    """
+    Netconf connection leased from a NetconfBroker. Used like MyNetconf, except that hello was already
+    done by the broker - do not call netconf_comm._cmd_hello().
+    close() returns the session to the broker, and waits until the broker released it.
+    """
+    def __init__(self, socket_path, hostname, port, username, password):
+        super().__init__(hostname = hostname, port = port, username = username, password = password,
+                         publicKey = "", publicKeyType = "")
+        self.socket_path = socket_path
+
+    def connect(self):
+        logging.info(f"{get_time()} Leasing session to {self.hostname}/{self.port} from broker {self.socket_path}")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        _send_line(sock, {"hostname" : self.hostname, "port" : self.port,
+                          "username" : self.username, "password" : self.password})
+        reply = json.loads(_recv_line(sock))
+        if reply["status"] != "ok" :
+            sock.close()
+            raise Exception (f"Netconf broker failed leasing session: {reply['error']}")
+
+        self.chan = netconf_comm.SocketChannel(sock)
+        self.framing = netconf_comm.FRAMING_1_1
+        self.capabilities = reply["capabilities"]
+
+    def close(self):
+        logging.info("Returning Netconf session to broker")
+        sock = self.chan.sock
+        try :
+            sock.shutdown(socket.SHUT_WR)
+            # Skip replies of rpcs left unanswered, until the broker closes the socket
+            sock.settimeout(RELEASE_REPLY_TIMEOUT + 10)
+            while sock.recv(netconf_comm.bufsiz) != b"" :
+                pass
+        except socket.error as error :
+            logging.error(f"{get_time()} Failed waiting for broker release: {error}")
+        sock.close()
+        return True
+
+def is_broker_running(socket_path) :
+    """
+    Return value : True if a broker accepts connections on socket_path
+    """
+    if not os.path.exists(socket_path) :
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try :
+        sock.connect(socket_path)
+        return True
+    except socket.error :
+        return False
+    finally :
+        sock.close()
+
+def _get_session_key(hostname, port, username, password) :
+    """
+    Return value : Key of the sessions of a DUT and credentials - A session is leased only with the credentials it was opened with.
+                   Only a digest of the password is kept.
+    """
+    return (hostname, int(port), username, hashlib.sha256(password.encode('utf-8')).hexdigest())
+
+def _send_line(sock, message) :
+    sock.sendall(json.dumps(message).encode('utf-8') + b"\n")
+
+def _recv_line(sock) :
+    """
+    Read a JSON line. Read byte by byte, so no Netconf data after the line is consumed.
+    """
+    line = bytearray()
+    while True :
+        byte = sock.recv(1)
+        if byte == b"" :
+            raise Exception ("Netconf broker socket closed")
+        if byte == b"\n" :
+            return line.decode('utf-8')
+        line += byte
+
+def _recv_complete_msg(conn, timeout=None) :
+    """
+    Receive a Netconf message, chunk by chunk, by its framing
+    Return value : Message bytes. None on socket EOF or framing error, including a message cut in the middle.
+    """
+    chunks = []
+    while True :
+        code, chunk = conn.recv_chunk(timeout)
+        if code == 0 :
+            return b"".join(chunks)
+        if code < 0 :
+            return None
+        chunks.append(chunk)
+
+def _discard_changes(dut_conn, timeout=None) :
+    """
+    Discard uncommitted candidate changes left by a client
+    Input : timeout - Seconds to wait for the rpc-reply, None to wait forever
+    Return value : True on Success, False otherwise.
+    """
+    import parse_xml
+
+    dut_conn.send_msg(netconf_comm.set_message_id(netconf_comm.discard_changes_msg(), dut_conn.next_message_id()))
+    xml_resp = dut_conn.recv_msg(timeout)
+    if xml_resp == b"" :
+        return False
+    return parse_xml.get_instance_by_tag(xml_resp, netconf_comm.RPC_REPLY_TAG_NAME, netconf_comm.OK_TAG_NAME) != None
+
+def _is_session_alive(dut_conn, timeout=SESSION_PROBE_TIMEOUT) :
+    """
+    Check an idle session - its SSH transport is active, and it answers a discard-changes rpc within timeout seconds
+    Return value : True if the session works
+    """
+    if not dut_conn.ssh.is_active() :
+        return False
+    try :
+        return _discard_changes(dut_conn, timeout)
+    except Exception as error :
+        logging.warning(f"{get_time()} Idle session probe failed: {error}")
+        return False
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _test_broker() :
+    """
+    Verify that sessions are opened once and reused by following leases, concurrent leases get sessions of their own,
+    a client leaving in the middle of an rpc does not break the session, and broken or failed DUT sessions are not leased
+    """
+    import tempfile
+
+    ctrl_plane_reply = """<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}">
+        <data><ctrl-plane xmlns="http://compass-eos.com/ns/compass_yang"><policy><acl><egress>my</egress></acl></policy></ctrl-plane></data>
+    </rpc-reply>"""
+
+    def reply_handler(rpc) :
+        import re
+        message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+        if b"discard-changes" in rpc :
+            return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}"><ok/></rpc-reply>"""
+        return ctrl_plane_reply.format(message_id = message_id)
+
+    opened_sessions = []
+    stand_ins = []
+
+    def session_factory(hostname, port, username, password) :
+        if hostname == "unreachable" :
+            raise ConnectionError(f"Failed to connect to {hostname}/{port}")
+        stand_in = netconf_comm._NetconfStandIn(['1.0', '1.1'], reply_handler, latency=0.02)
+        stand_ins.append(stand_in)
+        dut_conn = stand_in.create_client()
+        netconf_comm._cmd_hello(dut_conn)
+        # Closed like the SSH transport
+        dut_conn.ssh = dut_conn.chan
+        opened_sessions.append(dut_conn)
+        return dut_conn
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+    broker = NetconfBroker(socket_path, session_factory)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    while not is_broker_running(socket_path) :
+        time.sleep(0.01)
+
+    def lease(hostname = "dut", password = "admin") :
+        dut_conn = BrokeredNetconf(socket_path, hostname, 2022, "admin", password)
+        dut_conn.connect()
+        return dut_conn
+
+    for _ in range(3) :
+        dut_conn = lease()
+        assert netconf_comm.base_1_1 in dut_conn.capabilities
+        assert netconf_comm.cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+        dut_conn.close()
+    assert len(opened_sessions) == 1
+
+    # Concurrent leases, with pipelined rpcs
+    dut_conns = [lease() for _ in range(2)]
+    assert len(opened_sessions) == 2
+    for dut_conn in dut_conns :
+        pipeline = netconf_comm.NetconfPipeline(dut_conn)
+        futures = [pipeline.get_config(["ctrl-plane", "policy", "acl"]) for _ in range(5)]
+        assert all(b"<egress>my</egress>" in future.result() for future in futures)
+        # Closes dut_conn
+        pipeline.close()
+
+    # Client leaving before the reply arrives
+    dut_conn = lease()
+    dut_conn.send_msg(netconf_comm.set_message_id(netconf_comm.get_config_by_xpath_msg(["ctrl-plane"]), "1"))
+    dut_conn.close()
+    dut_conn = lease()
+    assert netconf_comm.cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    dut_conn.close()
+    assert len(opened_sessions) == 2
+
+    # Client leaving in the middle of an rpc - The partial rpc is not relayed, and the session is kept
+    dut_conn = lease()
+    dut_conn.chan.sendall(b"\n#200\n<rpc message-id=\"1\" xmlns=\"urn:ietf:params:xml:ns:netconf:base:1.0\"><get-config>")
+    dut_conn.close()
+    dut_conn = lease()
+    assert netconf_comm.cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    dut_conn.close()
+    assert len(opened_sessions) == 2
+
+    # The DUT ends of the idle sessions are closed, such as by a DUT reboot - They are replaced, not leased
+    for stand_in in stand_ins :
+        stand_in.server.chan.close()
+    dut_conn = lease()
+    assert netconf_comm.cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    dut_conn.close()
+    assert len(opened_sessions) == 3 and broker.num_of_sessions[_get_session_key("dut", 2022, "admin", "admin")] == 1
+
+    # The DUT end is closed while leased - The client gets EOF, instead of waiting for its reply
+    dut_conn = lease()
+    stand_ins[-1].server.chan.close()
+    dut_conn.send_msg(netconf_comm.set_message_id(netconf_comm.get_config_by_xpath_msg(["ctrl-plane"]), "1"))
+    assert dut_conn.recv_msg(5) == b""
+    dut_conn.close()
+    dut_conn = lease()
+    assert netconf_comm.cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    dut_conn.close()
+    assert len(opened_sessions) == 4 and broker.num_of_sessions[_get_session_key("dut", 2022, "admin", "admin")] == 1
+
+    # A lease with other credentials does not get the idle session opened with "admin"
+    dut_conn = lease(password = "other")
+    dut_conn.close()
+    assert len(opened_sessions) == 5
+
+    # A slow close of a broken session does not block the leases of other sessions
+    idle_conn = broker.idle_sessions[_get_session_key("dut", 2022, "admin", "admin")][-1][1]
+    closing = threading.Event()
+    close = idle_conn.close
+
+    def slow_close() :
+        closing.set()
+        time.sleep(1)
+        close()
+
+    idle_conn.close = slow_close
+    stand_ins[opened_sessions.index(idle_conn)].server.chan.close()
+    lease_thread = threading.Thread(target=lambda : lease().close())
+    lease_thread.start()
+    assert closing.wait(5)
+    start = time.monotonic()
+    lease(password = "other").close()
+    assert time.monotonic() - start < 0.5
+    lease_thread.join()
+    assert len(opened_sessions) == 6
+
+    # Failed connects give their session slot back - More failures than MAX_SESSIONS_PER_DUT do not block leases
+    for _ in range(MAX_SESSIONS_PER_DUT + 1) :
+        try :
+            lease("unreachable")
+            assert False
+        except Exception as error :
+            assert "Failed to connect" in str(error)
+    assert broker.num_of_sessions[_get_session_key("unreachable", 2022, "admin", "admin")] == 0
+
+    broker.shutdown()
+    logging.info(f"{get_time()} _test_broker passed")
+
+if __name__ == "__main__" :
+    # _test_broker()
+    socket_path = DEFAULT_SOCKET_PATH
+    if len(sys.argv) > 1 :
+        socket_path = sys.argv[1]
+    else :
+        constants = configparser.ConfigParser()
+        constants.read('config.ini')
+        socket_path = constants['NETCONF'].get('BROKER_SOCKET', fallback = '') or DEFAULT_SOCKET_PATH
+    NetconfBroker(socket_path).serve_forever()
@@ -3,9 +3,15 @@ Implement Netconf communication (get and set configuration) for DUT
 """
 
 import sys
+import re
+import time
+import itertools
+import threading
+import queue
 import paramiko
 import base64
 import socket
+from concurrent.futures import Future
 from xml.dom import Node
 import logging
 
@@ -28,12 +34,73 @@ FRAMING_1_0 = 0
 # the new framing in 4742bis
 FRAMING_1_1 = 1
 
+# End of message marker of FRAMING_1_0
+EOM_1_0 = b"]]>]]>"
+
+# Consumed bytes at the head of the receive buffer are dropped once they pass this size
+RECV_BUF_COMPACT_SIZE = 4 * bufsiz
+
+class RecvBuffer(object):
+    """
+    Reusable receive buffer for the Netconf framing layer.
+    Received data is appended at the tail and consumed from a read offset at the head, so framing
+    markers are searched in place, and each message is copied out of the buffer only once.
+    The consumed head is dropped lazily, so the same bytearray is reused from message to message.
+    """
+    def __init__(self):
+        self.data  = bytearray()
+        self.start = 0
+
+    def __len__(self):
+        return len(self.data) - self.start
+
+    def feed(self, data):
+        """Append received data at the tail of the buffer"""
+        self.data += data
+
+    def find(self, marker, offset=0):
+        """
+        Search marker from offset, without consuming.
+        Return value : Index of marker relative to the head of the buffer, -1 if not found
+        """
+        idx = self.data.find(marker, self.start + offset)
+        if idx > -1:
+            idx -= self.start
+        return idx
+
+    def peek(self, n):
+        """Return the first n bytes, without consuming them"""
+        return bytes(self.data[self.start:self.start + n])
+
+    def take(self, n):
+        """Consume n bytes, and return them as a single bytes object"""
+        with memoryview(self.data) as view:
+            out = bytes(view[self.start:self.start + n])
+        self.skip(n)
+        return out
+
+    def take_into(self, dest, n):
+        """Consume n bytes, appending them to the bytearray dest"""
+        with memoryview(self.data) as view:
+            dest += view[self.start:self.start + n]
+        self.skip(n)
+
+    def skip(self, n):
+        """Consume n bytes"""
+        self.start += n
+        if self.start == len(self.data):
+            del self.data[:]
+            self.start = 0
+        elif self.start >= RECV_BUF_COMPACT_SIZE:
+            del self.data[:self.start]
+            self.start = 0
+
 
 class MyNetconf(object):
     def __init__(self, hostname, port, username, password,
                  publicKey, publicKeyType,
                  privateKeyFile='', privateKeyType=''):
-        self.buf = b""
+        self.buf = RecvBuffer()
         self.framing = FRAMING_1_0
         self.eom_found = False
         self.trace = False
@@ -46,6 +113,11 @@ class MyNetconf(object):
         self.password  = password
         self.username = username
         self.saved = ""
+        self.capabilities = []
+        self.message_ids = itertools.count(1)
+        self.pipeline = None
+        # None - No caching. Set to a ConfigCache to serve repeated get-config replies from memory.
+        self.config_cache = None
 
     def connect(self):
         logging.info(f"{get_time()} Connecting to {self.hostname}/{self.port}")
@@ -135,7 +207,8 @@ class MyNetconf(object):
 
     def send(self, request):
         if self.framing == FRAMING_1_1:
-            self._send('\n#%d\n' % len(request) + request)
+            # The chunk size counts octets, not characters
+            self._send('\n#%d\n' % len(request.encode('utf-8')) + request)
         else:
             self._send(request)
 
@@ -154,6 +227,64 @@ class MyNetconf(object):
         else:
             return ''
 
+    def _fill(self, size=bufsiz):
+        """
+        Read the next block from the channel into the receive buffer.
+        Input : size - Number of bytes still missing. Reads are at least bufsiz long.
+        Return value : False on socket EOF, True otherwise
+        """
+        x = self._recv(max(size, bufsiz))
+        if x == b"":
+            return False
+        self.buf.feed(x)
+        return True
+
+    def _recv_chunk_header(self):
+        """
+        Parse a chunk header "\n#<chunk-size>\n", or the end of chunks marker "\n##\n",
+        at the head of the receive buffer (RFC 6242 chunked framing).
+        ret: (-2, 0) on framing error
+             (-1, 0) on socket EOF
+             (0, 0) on EOM
+             (1, chunk-size) on chunk header
+        """
+        # make sure we have at least 4 bytes; LF HASH INT/HASH LF
+        while len(self.buf) < 4:
+            if not self._fill():
+                return (-1, 0)
+        # check the first two bytes
+        if self.buf.peek(2) != b"\n#":
+            # framing error
+            return (-2, 0)
+        # find the terminating LF
+        idx = self.buf.find(b"\n", 2)
+        while idx == -1:
+            if len(self.buf) > 12:
+                # framing error - too large integer or not correct
+                # chunk size specification
+                return (-2, 0)
+            if not self._fill():
+                return (-1, 0)
+            idx = self.buf.find(b"\n", 2)
+        if idx > 12:
+            return (-2, 0)
+        size_field = self.buf.peek(idx)[2:]
+        if size_field == b"#":
+            # EOM
+            self.buf.skip(idx + 1)
+            return (0, 0)
+        try:
+            sz = int(size_field)
+        except ValueError:
+            # framing error - not an integer, and not EOM
+            return (-2, 0)
+        if sz < 1 or sz > 4294967295:
+            # framing error - range error
+            return (-2, 0)
+        # skip the chunk size
+        self.buf.skip(idx + 1)
+        return (1, sz)
+
     def recv_chunk(self, timeout=None):
         """
         ret: (-2, bytes) on framing error
@@ -166,101 +297,511 @@ class MyNetconf(object):
             if self.eom_found:
                 self.eom_found = False
                 return (0, b"")
-            bytes = self.buf
-            self.buf = b""
-            while len(bytes) < 6:
-                x = self._recv(bufsiz)
-                if x == b"":
-                    return (-1, bytes)
-                bytes += x
-            idx = bytes.find(b"]]>]]>")
+            while len(self.buf) < len(EOM_1_0):
+                if not self._fill():
+                    return (-1, self.buf.take(len(self.buf)))
+            idx = self.buf.find(EOM_1_0)
             if idx > -1:
-                # eom marker found; store rest in buf
+                # eom marker found; leave rest in buf
                 self.eom_found = True
-                self.buf = bytes[idx+6:]
-                return (1, bytes[:idx])
+                chunk = self.buf.take(idx)
+                self.buf.skip(len(EOM_1_0))
+                return (1, chunk)
             else:
                 # no eom marker found, keep the last 5 bytes
                 # (might contain parts of the eom marker)
-                self.buf = bytes[-5:]
-                return (1, bytes[:-5])
+                return (1, self.buf.take(len(self.buf) - (len(EOM_1_0) - 1)))
         else:
             # new framing
-            bytes = self.buf
-            self.buf = b""
-            # make sure we have at least 4 bytes; LF HASH INT/HASH LF
-            while len(bytes) < 4:
-                x = self._recv(bufsiz)
-                if x == b"":
-                    # error, return what we have
-                    return (-1, bytes)
-                bytes += x
-            # check the first two bytes
-            if bytes[0:2] != b"\n#":
-                # framing error
-                return (-2, bytes)
-            # read the chunk size
-            sz = -1
-            while sz == -1:
-                # find the terminating LF
-                idx = bytes.find(b"\n", 2)
-                if idx > 12:
-                    # framing error - too large integer or not correct
-                    # chunk size specification
-                    return (-2, bytes)
-                if idx > -1:
-                    # newline found, scan for number of bytes to read
-                    try:
-                        sz = int(bytes[2:idx])
-                        if sz < 1 or sz > 4294967295:
-                            # framing error - range error
-                            return (-2, bytes)
-                    except:
-                        if bytes[2:idx] == b"#":
-                            # EOM
-                            self.buf = bytes[idx+1:]
-                            return (0, b"")
-                        # framing error - not an integer, and not EOM
-                        return (-2, bytes)
-                    # skip the chunk size.  the while loop is now done
-                    bytes = bytes[idx+1:]
-                else:
-                    # terminating LF not found, read more
-                    x = self._recv(bufsiz)
-                    if x == b"":
-                        # error, return what we have
-                        return (-1, bytes)
-                    bytes += x
+            code, sz = self._recv_chunk_header()
+            if code == 0:
+                return (0, b"")
+            elif code < 0:
+                return (code, self.buf.take(len(self.buf)))
             # read the chunk data
-            while len(bytes) < sz:
-                x = self._recv(bufsiz)
-                if x == b"":
-                    return (-1, bytes)
-                bytes += x
-            # save rest of data
-            self.buf = bytes[sz:]
-            return (1, bytes[:sz])
+            while len(self.buf) < sz:
+                if not self._fill(sz - len(self.buf)):
+                    return (-1, self.buf.take(len(self.buf)))
+            return (1, self.buf.take(sz))
 
     def recv_msg(self, timeout=None):
-        msg = b""
+        """
+        Receive a complete Netconf message.
+        The framing markers are located in place inside the receive buffer, and the message
+        is copied out of it once, so the receive time is linear in the reply size.
+        ret: Message bytes. On socket EOF or framing error, the bytes received so far.
+        """
+        self._set_timeout(timeout)
+        if self.framing == FRAMING_1_0:
+            return self._recv_msg_1_0()
+        else:
+            return self._recv_msg_1_1()
+
+    def recv_msg_chunks(self, timeout=None):
+        """
+        Generator of the data chunks of the next message, as they arrive from recv_chunk(),
+        so a reply can be parsed while it is still being received.
+        If the generator is closed before the end of message, the rest of the message is skipped,
+        keeping the framing in sync for the next message.
+        """
+        is_complete = False
+        try:
+            while True:
+                (code, bytes) = self.recv_chunk(timeout)
+                if code == 1:
+                    yield bytes
+                else:
+                    is_complete = True
+                    if code < 0 and bytes:
+                        # error, return what we have
+                        yield bytes
+                    return
+        finally:
+            if not is_complete:
+                while self.recv_chunk(timeout)[0] == 1:
+                    pass
+
+    def _recv_msg_1_0(self):
+        """
+        Receive a message terminated by the "]]>]]>" end of message marker (RFC 4742)
+        """
+        if self.eom_found:
+            # recv_chunk() already consumed the message up to its eom marker
+            self.eom_found = False
+            return b""
+        scan_from = 0
         while True:
-            (code, bytes) = self.recv_chunk(timeout)
-            if code == 1:
-                msg += bytes
-            elif code == 0:
+            idx = self.buf.find(EOM_1_0, scan_from)
+            if idx > -1:
+                msg = self.buf.take(idx)
+                self.buf.skip(len(EOM_1_0))
                 return msg
-            else:
-                # error
-                return msg + bytes
+            # Only the last 5 bytes might hold the beginning of the eom marker,
+            # so the next search does not rescan the rest of the message
+            scan_from = max(0, len(self.buf) - (len(EOM_1_0) - 1))
+            if not self._fill():
+                # error, return what we have
+                return self.buf.take(len(self.buf))
+
+    def _recv_msg_1_1(self):
+        """
+        Receive a message in chunked framing (RFC 6242).
+        Chunk data is never scanned - each chunk is read according to its length prefix,
+        so the framing work is per chunk and not per byte.
+        """
+        first_chunk = None
+        msg = None
+        while True:
+            code, sz = self._recv_chunk_header()
+            if code == 0:
+                break
+            elif code < 0:
+                # error, return what we have
+                first_chunk, msg = self._append_chunk(first_chunk, msg, len(self.buf))
+                break
+            while len(self.buf) < sz:
+                if not self._fill(sz - len(self.buf)):
+                    sz = len(self.buf)
+                    break
+            first_chunk, msg = self._append_chunk(first_chunk, msg, sz)
+
+        if msg != None:
+            return bytes(msg)
+        elif first_chunk != None:
+            return first_chunk
+        return b""
+
+    def _append_chunk(self, first_chunk, msg, sz):
+        """
+        Consume sz bytes of chunk data from the receive buffer.
+        A single chunk message is returned as is, so it is copied out of the buffer only once.
+        The bytearray msg is created only when a second chunk arrives.
+        Return value : Updated (first_chunk, msg)
+        """
+        if first_chunk == None:
+            first_chunk = self.buf.take(sz)
+        else:
+            if msg == None:
+                msg = bytearray(first_chunk)
+            self.buf.take_into(msg, sz)
+        return first_chunk, msg
     
+    def next_message_id(self):
+        """Return a message-id String, unique in this session"""
+        return str(next(self.message_ids))
+
     def close(self):
         logging.info("Closing Netconf client")
         self.ssh.close()
         return True
 
+class NetconfPipeline(object):
+    """
+    Pipelined rpcs over a single MyNetconf session.
+    Each submitted rpc gets a unique message-id, and is sent without waiting for the replies of
+    the previous rpcs. A reader thread receives the rpc-replies and resolves the matching futures
+    by message-id, so a batch of rpcs costs about one round trip instead of one round trip per rpc.
+    The pipeline stays attached until the session is closed. Meanwhile, _rpc() sends all the
+    helper functions rpcs through it.
+    """
+    def __init__(self, dut_conn):
+        self.dut_conn = dut_conn
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_replies, 
+                                       name=f"netconf-reader-{dut_conn.hostname}", 
+                                       daemon=True)
+        dut_conn.pipeline = self
+        self.reader.start()
+
+    def submit(self, rpc):
+        """
+        Send rpc with a new message-id.
+        Input : rpc - rpc message String. Its message-id attribute is replaced.
+        Return value : concurrent.futures.Future, resolved with the rpc-reply bytes
+        """
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise Exception("Netconf session is closed")
+            message_id = self.dut_conn.next_message_id()
+            self.pending[message_id] = future
+            self.dut_conn.send_msg(set_message_id(rpc, message_id))
+        return future
+
+    def get_config(self, xml_path_list):
+        """
+        Submit get-config of the running configuration.
+        Input : xml_path_list - String list of XML path.
+        Return value : Future, resolved with the XML tree Configuration
+        """
+        return self.submit(get_config_by_xpath_msg(xml_path_list))
+
+    def _read_replies(self):
+        """
+        Reader thread - demultiplex the rpc-replies by message-id, until the session is closed
+        """
+        while True:
+            try:
+                reply = self.dut_conn.recv_msg()
+            except (socket.error, EOFError) as x:
+                logging.error(f"{get_time()} Netconf reader error: {str(x)}")
+                break
+            if reply == b"":
+                break
+            message_id = get_reply_message_id(reply)
+            with self.lock:
+                future = self.pending.pop(message_id, None)
+            if future == None:
+                logging.warning(f"{get_time()} Dropping reply with unknown message-id {message_id}")
+                continue
+            future.set_result(reply)
+
+        # Session is closed - fail the rpcs still waiting for a reply
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(Exception("Netconf session closed before rpc-reply"))
+
+    def close(self, timeout=None):
+        """
+        Wait for the rpcs in flight, then close the session (which ends the reader thread)
+        """
+        import concurrent.futures
+
+        with self.lock:
+            pending = list(self.pending.values())
+        concurrent.futures.wait(pending, timeout)
+        self.dut_conn.close()
+        self.reader.join(timeout)
+        self.dut_conn.pipeline = None
+
+class NotificationEvent(object):
+    """
+    Received notification.
+    name - Tag name of the event (such as "netconf-config-change"), event_time - eventTime String,
+    element - xml element of the event, xml - The notification message bytes
+    """
+    def __init__(self, event_time, element, xml):
+        import parse_xml
+
+        self.event_time = event_time
+        self.element = element
+        self.name = parse_xml._local_name(element.tag)
+        self.xml = xml
+
+    def get_text(self, xml_path_list):
+        """
+        Input : xml_path_list - String list of xml tag names under the event element. Each tag is searched
+                                among the descendants of the previous one, and the first match is taken.
+        Return value : Text of the attribute, None if not found (optional attributes are common in events)
+        """
+        import parse_xml
+
+        node = self.element
+        for tag_name in xml_path_list:
+            node = next((child for child in node.iter() if child is not node and parse_xml._local_name(child.tag) == tag_name), None)
+            if node == None:
+                return None
+        return (node.text or "").strip()
+
+    def __repr__(self):
+        return f"NotificationEvent({self.name}, {self.event_time})"
+
+class NotificationStream(object):
+    """
+    Consumer of Netconf notifications (RFC 5277), on a dedicated session.
+    After subscribe(), a reader thread receives the notifications and queues them as NotificationEvent,
+    so a waiter blocks on the next event (with a timeout) instead of polling.
+    The session should not be used for other rpcs - once subscribed, it only receives notifications.
+    Input : dut_conn - MyNetconf connection, after hello
+            stream - Notification stream name
+            xpath - Filter of the events. Empty for all the stream events.
+    """
+    def __init__(self, dut_conn, stream="NETCONF", xpath=""):
+        self.dut_conn = dut_conn
+        self.stream = stream
+        self.xpath = xpath
+        self.events_queue = queue.Queue()
+        self.reader = None
+
+    def subscribe(self):
+        """
+        Send create-subscription, and start receiving notifications.
+        Raises Exception if the DUT rejects the subscription.
+        """
+        import parse_xml
+
+        logging.info(f"{get_time()} Subscribing to notification stream {self.stream}")
+        xml_resp = _rpc(self.dut_conn, create_subscription_msg(self.stream, self.xpath))
+        if parse_xml.get_instance_by_tag(xml_resp, RPC_REPLY_TAG_NAME, OK_TAG_NAME) == None :
+            raise Exception (f"Failed subscribing to notification stream {self.stream}:\n{xml_resp}")
+
+        self.reader = threading.Thread(target=self._read_notifications,
+                                       name=f"netconf-notifications-{self.dut_conn.hostname}",
+                                       daemon=True)
+        self.reader.start()
+
+    def _read_notifications(self):
+        """
+        Reader thread - queue the received notifications until the session is closed.
+        None is queued at the end of the stream.
+        """
+        import parse_xml
+
+        while True:
+            try:
+                msg = self.dut_conn.recv_msg()
+            except (socket.error, EOFError) as x:
+                logging.error(f"{get_time()} Netconf notification reader error: {str(x)}")
+                break
+            if msg == b"":
+                break
+            try:
+                notification = parse_xml.get_notification_event(msg)
+            except Exception as x:
+                logging.error(f"{get_time()} Failed parsing notification: {str(x)}\n{msg}")
+                continue
+            if notification == None:
+                logging.warning(f"{get_time()} Dropping message that is not a notification:\n{msg}")
+                continue
+            event_time, element = notification
+            self.events_queue.put(NotificationEvent(event_time, element, msg))
+        self.events_queue.put(None)
+
+    def get_event(self, timeout=None):
+        """
+        Wait for the next notification.
+        Return value : NotificationEvent, None on timeout or at the end of the stream
+        """
+        try:
+            event = self.events_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if event == None:
+            # Keep the end of stream for the next callers
+            self.events_queue.put(None)
+        return event
+
+    def events(self, timeout=None):
+        """
+        Generator of the notifications, until the end of the stream, or until no notification
+        arrived for timeout seconds
+        """
+        while True:
+            event = self.get_event(timeout)
+            if event == None:
+                return
+            yield event
+
+    async def async_events(self, timeout=None):
+        """
+        Asynchronous generator of the notifications - Like events(), for asyncio code
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self.get_event, timeout)
+            if event == None:
+                return
+            yield event
+
+    def wait_for(self, event_name, predicate=None, timeout=None):
+        """
+        Wait for a notification. Other notifications received meanwhile are skipped.
+        Input : event_name - Tag name of the event, such as "netconf-config-change"
+                predicate - Function (NotificationEvent) returning True for the expected event. None accepts any event_name event.
+                timeout - Seconds to wait. None waits forever.
+        Return value : The NotificationEvent, None on timeout
+        """
+        deadline = None if timeout == None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline == None else max(0, deadline - time.monotonic())
+            event = self.get_event(remaining)
+            if event == None:
+                logging.info(f"{get_time()} No {event_name} notification within {timeout} seconds")
+                return None
+            if event.name == event_name and (predicate == None or predicate(event)):
+                logging.info(f"{get_time()} Received notification {event}")
+                return event
+            logging.debug(f"{get_time()} Skipping notification {event}")
+
+    def wait_for_commit(self, timeout=None):
+        """
+        Wait for a commit to the running configuration, by any session (RFC 6470 netconf-config-change)
+        Return value : The NotificationEvent, None on timeout
+        """
+        return self.wait_for(CONFIG_CHANGE_EVENT_NAME,
+                             lambda event : event.get_text([CONFIG_CHANGE_DATASTORE_TAG_NAME]) in (None, "running"),
+                             timeout)
+
+    def close(self):
+        self.dut_conn.close()
+        if self.reader != None:
+            self.reader.join()
+
+class ConfigCache(object):
+    """
+    Session level cache of the running configuration replies, keyed by xpath.
+    An entry stays valid until a commit changes an overlapping subtree, or, if ttl (seconds) is set,
+    until it is older than ttl. Set ttl when the configuration may also change outside this session.
+    Paths of edits that reached the candidate are kept as pending, and invalidated on the next successful commit,
+    so an edit committed later by another command is invalidated as well.
+    Caching is opt-in : MyNetconf.config_cache is None unless set to a ConfigCache.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        # xpath -> [time stamp, reply, parse_xml.ParsedReply or None]
+        self.entries = {}
+        self.pending_xpaths = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, xpath):
+        """
+        Return value : Cached reply of xpath, None if not cached or expired
+        """
+        entry = self._get_entry(xpath)
+        if entry == None :
+            return None
+        return entry[1]
+
+    def get_parsed(self, xpath):
+        """
+        Return value : Cached reply of xpath as parse_xml.ParsedReply (parsed once, on first request), None if not cached
+        """
+        import parse_xml
+
+        entry = self._get_entry(xpath)
+        if entry == None :
+            return None
+        if entry[2] == None :
+            entry[2] = parse_xml.ParsedReply(entry[1])
+        return entry[2]
+
+    def put(self, xpath, reply):
+        with self.lock :
+            self.entries[xpath] = [time.monotonic(), reply, None]
+
+    def _get_entry(self, xpath):
+        with self.lock :
+            entry = self.entries.get(xpath)
+            if entry != None and self.ttl != None and time.monotonic() - entry[0] > self.ttl :
+                del self.entries[xpath]
+                entry = None
+            if entry == None :
+                self.misses += 1
+            else :
+                self.hits += 1
+            return entry
+
+    def add_pending(self, xpaths):
+        """
+        Record the xpaths of an edit that reached the candidate configuration
+        """
+        with self.lock :
+            self.pending_xpaths.update(xpaths)
+
+    def commit_done(self):
+        """
+        Invalidate the entries that overlap the pending xpaths, after a successful commit
+        """
+        with self.lock :
+            for xpath in list(self.entries) :
+                if any(_is_xpath_overlap(xpath, pending_xpath) for pending_xpath in self.pending_xpaths) :
+                    logging.debug(f"Invalidating cached configuration {xpath}")
+                    del self.entries[xpath]
+            self.pending_xpaths.clear()
+
+    def discard_done(self):
+        """
+        Forget the pending xpaths, after the candidate changes were discarded
+        """
+        with self.lock :
+            self.pending_xpaths.clear()
+
+    def clear(self):
+        with self.lock :
+            self.entries.clear()
+
 # ***************************************************************************************
 # Netconf Helper functions
 # ***************************************************************************************
+class SocketChannel(object):
+    """
+    Channel over a plain socket (such as a Unix socket, or a socket pair), with the paramiko channel
+    methods used by MyNetconf
+    """
+    def __init__(self, sock):
+        self.sock = sock
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def sendall(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.sock.sendall(data)
+
+    def recv(self, n):
+        return self.sock.recv(n)
+
+    def is_active(self):
+        """Like paramiko.Transport.is_active() - False once closed"""
+        return self.sock.fileno() != -1
+
+    def close(self):
+        # Like closing the SSH transport, wake up a thread blocked in recv()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
 def create_connection(host, port):
     """
     sort-of socket.create_connection() (new in 2.6)
@@ -285,10 +826,49 @@ def create_connection(host, port):
             continue
         break
     if sock is None:
-        print("Failed to connect to %s: %s" % (host, msg))
-        sys.exit(1)
+        logging.error(f"{get_time()} Failed to connect to {host}/{port}: {msg}")
+        raise ConnectionError(f"Failed to connect to {host}/{port}: {msg}")
     return sock
 
+# message-id attribute of the rpc element, which is the first one in the message
+MESSAGE_ID_PATTERN = re.compile(r'''message-id=(["'])[^"']*\1''')
+# The rpc-reply start tag is at the head of the reply; no need to scan the whole reply for it
+REPLY_MESSAGE_ID_PATTERN = re.compile(rb'''<(?:[\w.-]+:)?rpc-reply\b[^>]*?\smessage-id=["']([^"']*)["']''')
+REPLY_HEAD_SIZE = 4096
+
+def set_message_id(rpc, message_id):
+    """
+    Input : rpc - rpc message String
+            message_id - String
+    Return value : rpc with message_id as the message-id of the rpc element
+    """
+    return MESSAGE_ID_PATTERN.sub(f'message-id="{message_id}"', rpc, count=1)
+
+def get_reply_message_id(reply):
+    """
+    Input : reply - rpc-reply bytes
+    Return value : message-id String of the rpc-reply, None if not an rpc-reply (e.g., notification)
+    """
+    match = REPLY_MESSAGE_ID_PATTERN.search(reply, 0, REPLY_HEAD_SIZE)
+    if match == None:
+        return None
+    return match.group(1).decode()
+
+def _is_xpath_overlap(xpath_a, xpath_b):
+    """
+    Return value : True if one xpath is inside the subtree of the other (or they are equal)
+    """
+    return xpath_a == xpath_b or xpath_a.startswith(xpath_b + '/') or xpath_b.startswith(xpath_a + '/')
+
+def get_config_xpaths(xml_command):
+    """
+    Input : xml_command - edit-config <config> content
+    Return value : List of the xpaths of the top level subtrees that xml_command changes. For example ["/interface"]
+    """
+    import parse_xml
+
+    return ['/' + tag_name for tag_name in parse_xml.get_top_level_tag_names(xml_command)]
+
 def write_fd(fd,data):
   try:
     fd.write(data)
@@ -479,6 +1059,9 @@ def strip(node):
 # Constants
 RPC_REPLY_TAG_NAME = "rpc-reply"
 OK_TAG_NAME        = "ok"
+# RFC 6470 event of a configuration change. Its datastore attribute is "running" when omitted.
+CONFIG_CHANGE_EVENT_NAME         = "netconf-config-change"
+CONFIG_CHANGE_DATASTORE_TAG_NAME = "datastore"
 
 XML_REQ_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
                         <rpc xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">
@@ -575,18 +1158,61 @@ ACL_POLICY_R1_PERMIT_DEFAULT_DENY__SRC_IP_XML_CMD = """<policy xmlns="http://com
 # Canary Helper functions
 # ***************************************************************************************
 def _cmd_hello(dut_conn):
-    """Perform get hello from DUT first"""
+    """
+    Perform get hello from DUT first.
+    Both base:1.0 and base:1.1 are advertised. If the DUT supports base:1.1 too, the connection
+    switches to chunked framing (RFC 6242) once the hello messages are exchanged.
+    Return value : List of the DUT capabilities
+    """
+    import parse_xml
+
     logging.info("Sending Hello message")
-    versions = ['1.0']
+    versions = ['1.0', '1.1']
     dut_conn.send_msg(hello_msg(versions))
     hello_reply = dut_conn.recv_msg()
 
+    dut_conn.capabilities = parse_xml.get_text_attribute_list(hello_reply, "capability")
+    if base_1_1 in dut_conn.capabilities :
+        logging.info("DUT supports base:1.1. Using chunked framing")
+        dut_conn.framing = FRAMING_1_1
+    else :
+        logging.info("DUT supports base:1.0 only. Using end of message framing")
+        dut_conn.framing = FRAMING_1_0
 
-def _get_config_by_xpath(connection, xml_path_list) :
+    return dut_conn.capabilities
+
+
+def _rpc(dut_conn, rpc) :
     """
-    Input : connection  - Netconf connection object 
-            xml_path_list - String list of XML path.
-    Return value : XML tree Configuration string
+    Send an rpc with a unique message-id, and wait for its rpc-reply.
+    If a NetconfPipeline is attached to the connection, the rpc is submitted through it.
+    Input : dut_conn - DUT Connection
+            rpc - rpc message String
+    Return value : rpc-reply bytes
+    """
+    if dut_conn.pipeline != None :
+        return dut_conn.pipeline.submit(rpc).result()
+
+    dut_conn.send_msg(set_message_id(rpc, dut_conn.next_message_id()))
+    return dut_conn.recv_msg()
+
+def _rpc_stream(dut_conn, rpc) :
+    """
+    Same as _rpc(), but the rpc-reply is returned as a generator of bytes chunks, as they arrive
+    (see MyNetconf.recv_msg_chunks()), for parsing it while it is received.
+    The generator must be consumed or closed before the next rpc. The parse_xml functions always close it.
+    If a NetconfPipeline is attached to the connection, the whole rpc-reply is returned as a single chunk.
+    """
+    if dut_conn.pipeline != None :
+        return iter([_rpc(dut_conn, rpc)])
+
+    dut_conn.send_msg(set_message_id(rpc, dut_conn.next_message_id()))
+    return dut_conn.recv_msg_chunks()
+
+def get_config_by_xpath_msg(xml_path_list) :
+    """
+    Input : xml_path_list - String list of XML path.
+    Return value : get-config rpc of the running configuration, filtered by xml_path_list
     """
     cmd = "get-config"
     db = "running"
@@ -595,11 +1221,75 @@ def _get_config_by_xpath(connection, xml_path_list) :
 
     xpath = '/' + '/'.join(xml_path_list)
 
-    msg = get_msg(cmd, db, xpath, wdefaults, winactive)
-    connection.send_msg(msg)
-    dut_reply = connection.recv_msg()
+    return get_msg(cmd, db, xpath, wdefaults, winactive)
+
+def _get_config_by_xpath(connection, xml_path_list) :
+    """
+    Input : connection  - Netconf connection object 
+            xml_path_list - String list of XML path.
+    Return value : XML tree Configuration string. Served from the connection config_cache when possible.
+    """
+    xpath = '/' + '/'.join(xml_path_list)
+    config_cache = connection.config_cache
+
+    if config_cache != None :
+        dut_reply = config_cache.get(xpath)
+        if dut_reply != None :
+            logging.info(f"Configuration {xpath} served from cache")
+            return dut_reply
+
+    dut_reply = _rpc(connection, get_config_by_xpath_msg(xml_path_list))
+    if config_cache != None :
+        config_cache.put(xpath, dut_reply)
     return dut_reply
 
+def _get_parsed_config(dut_conn, xml_path_list) :
+    """
+    Get configuration, parsed once for repeated queries
+    Input : dut_conn - DUT Connection
+            xml_path_list - String list of XML path.
+    Return value : parse_xml.ParsedReply of the configuration
+    """
+    import parse_xml
+
+    xml_tree = _get_config_by_xpath(dut_conn, xml_path_list)
+    if dut_conn.config_cache != None :
+        # The entry was just filled by _get_config_by_xpath(); its parsed reply is kept with it
+        parsed_config = dut_conn.config_cache.get_parsed('/' + '/'.join(xml_path_list))
+        if parsed_config != None :
+            return parsed_config
+    return parse_xml.ParsedReply(xml_tree)
+
+def _stream_into_cache(config_cache, xpath, chunks) :
+    """
+    Generator of the reply chunks as they arrive, which puts the whole reply in config_cache once it was received.
+    If the generator is closed early (the lookup was found), the rest of the reply is received and cached as well.
+    """
+    received = []
+    try :
+        for chunk in chunks :
+            received.append(chunk)
+            yield chunk
+    finally :
+        received.extend(chunks)
+        config_cache.put(xpath, b"".join(received))
+
+def _get_config_source(dut_conn, xml_path_list) :
+    """
+    Get configuration for a single lookup.
+    Return value : The cached reply, if config_cache has it. Otherwise, the reply chunks as they arrive (see _rpc_stream()).
+    """
+    config_cache = dut_conn.config_cache
+    if config_cache == None :
+        return _rpc_stream(dut_conn, get_config_by_xpath_msg(xml_path_list))
+
+    xpath = '/' + '/'.join(xml_path_list)
+    dut_reply = config_cache.get(xpath)
+    if dut_reply != None :
+        logging.info(f"Configuration {xpath} served from cache")
+        return dut_reply
+    return _stream_into_cache(config_cache, xpath, _rpc_stream(dut_conn, get_config_by_xpath_msg(xml_path_list)))
+
 def _get_attribute(dut_conn, attribute_path, unique_tag_name) :
     """
     Get attribute of an XML path
@@ -613,8 +1303,8 @@ def _get_attribute(dut_conn, attribute_path, unique_tag_name) :
     logging.info(f"Get attribute: {attribute_path}, unique_tag_name: {unique_tag_name}")
     attr_val = None 
 
-    conf_xml_subtree = _get_config_by_xpath(dut_conn, attribute_path)
-    attr_val = parse_xml.get_text_attribute (conf_xml_subtree, unique_tag_name)
+    xml_source = _get_config_source(dut_conn, attribute_path)
+    attr_val = parse_xml.get_text_attribute (xml_source, unique_tag_name)
     if attr_val != None :
         logging.info(f"Received attribute value: {attr_val}")
     else :
@@ -640,17 +1330,14 @@ def _get_instance_attribute(dut_conn, instance_tag_name, instance_value, instanc
     logging.info(f"Get attribute {attribute_path} for instance {instance_path}")
     attr_val = None 
 
-    conf_xml_subtree = _get_config_by_xpath(dut_conn, instance_path)
-
-    if conf_xml_subtree is not None:        
-        instance_node = parse_xml.get_instance_by_string(conf_xml_subtree, instance_tag_name, instance_value)
-        attr_val = parse_xml.get_instance_text_attribute (instance_node, attribute_path)
-        if attr_val != None :
-            logging.info(f"Received attribute value: {attr_val}")
-        else :
-            logging.info("No attribute value found")
+    # Parsing stops once the instance is found
+    xml_source = _get_config_source(dut_conn, instance_path)
+    instance_node = parse_xml.get_instance_by_string(xml_source, instance_tag_name, instance_value)
+    attr_val = parse_xml.get_instance_text_attribute (instance_node, attribute_path)
+    if attr_val != None :
+        logging.info(f"Received attribute value: {attr_val}")
     else :
-        raise Exception (f"No configuration for {instance_path}")
+        logging.info("No attribute value found")
     
     return attr_val
 
@@ -666,27 +1353,107 @@ def _configure_and_commit(dut_conn, xml_command):
 
     logging.debug(f"Configure xml_command :\n{xml_command}")
 
-    dut_conn.send_msg(XML_REQ_TEMPLATE.format(xml_command = xml_command))
-    xml_resp = dut_conn.recv_msg()
+    xml_resp = _rpc(dut_conn, XML_REQ_TEMPLATE.format(xml_command = xml_command))
     return_val = parse_xml.get_instance_by_tag(xml_resp, RPC_REPLY_TAG_NAME, OK_TAG_NAME)
     if return_val != None :
         logging.info ("Successfull in sending xml command.")
+        if dut_conn.config_cache != None :
+            dut_conn.config_cache.add_pending(get_config_xpaths(xml_command))
     else :
         logging.error (f"Failed in sending command:\n{xml_command}\nResponse:\n{xml_resp}")
         return False
 
     xml_req = commit_msg()
-    dut_conn.send_msg(xml_req)
-    xml_resp = dut_conn.recv_msg()
+    xml_resp = _rpc(dut_conn, xml_req)
     return_val = parse_xml.get_instance_by_tag(xml_resp, RPC_REPLY_TAG_NAME, OK_TAG_NAME)
     if return_val != None :
         logging.info ("Successfull in sending commit.")
+        if dut_conn.config_cache != None :
+            dut_conn.config_cache.commit_done()
     else :
         logging.error (f"Failed in sending commit:\n{xml_req}\nResponse:\n{xml_resp}")
         return False
 
     return True
 
+class NetconfTransaction(object):
+    """
+    Batch several configuration commands (such as ACL_*_XML_CMD fragments) into one <config> payload,
+    that is sent in a single edit-config, validated once and committed once.
+    Commands that must not fail when their object is absent should use operation="remove"
+    rather than operation="delete", since a single failing command fails the whole transaction.
+    """
+    def __init__(self, dut_conn):
+        self.dut_conn = dut_conn
+        self.xml_commands = []
+
+    def add(self, xml_command):
+        """
+        Add xml_command to the transaction. Nothing is sent until commit()
+        """
+        logging.debug(f"Transaction add xml_command :\n{xml_command}")
+        self.xml_commands.append(xml_command)
+
+    def commit(self):
+        """
+        Send all the commands in one edit-config, validate the candidate and commit.
+        On failure, the candidate changes are discarded.
+        Return Value : True on Success, False otherwise.
+        """
+        import parse_xml
+
+        if len(self.xml_commands) == 0 :
+            logging.info("Empty transaction. Nothing to commit")
+            return True
+
+        logging.info(f"Committing transaction of {len(self.xml_commands)} commands")
+        xml_command = "\n".join(self.xml_commands)
+        self.xml_commands = []
+
+        steps = [("edit-config",  XML_REQ_TEMPLATE.format(xml_command = xml_command)),
+                 ("validate",     validate_msg("candidate")),
+                 ("commit",       commit_msg())]
+        config_cache = self.dut_conn.config_cache
+        for step_name, xml_req in steps :
+            xml_resp = _rpc(self.dut_conn, xml_req)
+            return_val = parse_xml.get_instance_by_tag(xml_resp, RPC_REPLY_TAG_NAME, OK_TAG_NAME)
+            if return_val != None :
+                logging.info (f"Successfull in sending {step_name}.")
+            else :
+                logging.error (f"Failed in sending {step_name}:\n{xml_req}\nResponse:\n{xml_resp}")
+                self._discard()
+                return False
+            if config_cache != None and step_name == "edit-config" :
+                config_cache.add_pending(get_config_xpaths(xml_command))
+
+        if config_cache != None :
+            config_cache.commit_done()
+        return True
+
+    def _discard(self):
+        """
+        Discard the uncommitted changes in the candidate
+        """
+        import parse_xml
+
+        xml_resp = _rpc(self.dut_conn, discard_changes_msg())
+        if parse_xml.get_instance_by_tag(xml_resp, RPC_REPLY_TAG_NAME, OK_TAG_NAME) != None :
+            logging.info ("Discarded candidate changes.")
+            if self.dut_conn.config_cache != None :
+                self.dut_conn.config_cache.discard_done()
+        else :
+            logging.error (f"Failed in sending discard-changes. Response:\n{xml_resp}")
+
+def _configure(dut_conn, xml_command, transaction):
+    """
+    Add xml_command to transaction if given, otherwise configure and commit it at once.
+    Return Value : True on Success, False otherwise.
+    """
+    if transaction != None :
+        transaction.add(xml_command)
+        return True
+    return _configure_and_commit(dut_conn, xml_command)
+
 # ***************************************************************************************
 # GET Commands functions
 # ***************************************************************************************
@@ -719,6 +1486,22 @@ def cmd_get_ctrl_plane_acl_name(dut_conn, ctrl_plane_acl_type) :
 
     return ctrl_plane_acl_name
 
+def cmd_get_ctrl_plane_acl_names(dut_conn, ctrl_plane_acl_types) :
+    """Get several ctrl-plane acl names, with a single get-config
+    Input : dut_conn  - DUT connection
+            ctrl_plane_acl_types - List of control plane types. Values can be "egress" or "nni-ingress" 
+    Return value : Dictionary of ctrl-plane type -> ACL name (None if not configured)
+    """
+    CTRL_PLANE_ACL_PATH_LIST   = ["ctrl-plane", "policy", "acl"]
+
+    parsed_config = _get_parsed_config(dut_conn, CTRL_PLANE_ACL_PATH_LIST)
+    ctrl_plane_acl_names = {}
+    for ctrl_plane_acl_type in ctrl_plane_acl_types :
+        ctrl_plane_acl_names[ctrl_plane_acl_type] = parsed_config.get_path_text_attribute(CTRL_PLANE_ACL_PATH_LIST + [ctrl_plane_acl_type])
+        logging.info(f"Control plane acl type {ctrl_plane_acl_type}: {ctrl_plane_acl_names[ctrl_plane_acl_type]}")
+
+    return ctrl_plane_acl_names
+
 def cmd_get_acl_policy(dut_conn) :
     """Get acl policy
     Input : dut_conn  - DUT connection
@@ -733,50 +1516,481 @@ def cmd_get_acl_policy(dut_conn) :
 # ***************************************************************************************
 # SET Commands functions
 # ***************************************************************************************
-def cmd_set_attach_policy_acl_in_x_eth(dut_conn, x_eth_interface, attribute_value, operation):
+def cmd_set_attach_policy_acl_in_x_eth(dut_conn, x_eth_interface, attribute_value, operation, transaction=None):
     """
-    Configure x-eth 0/0/x_eth_interface attribute
+    Configure x-eth 0/0/x_eth_interface attribute.
+    If transaction (NetconfTransaction) is given, the command is only added to it.
     """
     xml_cmd_template = ACL_IN_XML_CMD
     xml_command = xml_cmd_template.format(x_eth_interface   = x_eth_interface, 
                                           operation         = operation,
                                           attribute_value   = attribute_value)
     logging.info(f"x_eth_interface: {x_eth_interface}, operation: {operation}, attribute_value: {attribute_value}")
-    return _configure_and_commit(dut_conn, xml_command)
+    return _configure(dut_conn, xml_command, transaction)
 
-def cmd_set_ctrl_plane_acl(dut_conn, acl_ctrl_plane_type, operation, attribute_value):
+def cmd_set_ctrl_plane_acl(dut_conn, acl_ctrl_plane_type, operation, attribute_value, transaction=None):
     """
-    Configure acl control plane attribute
+    Configure acl control plane attribute.
+    If transaction (NetconfTransaction) is given, the command is only added to it.
     """
     xml_command = ACL_CTRL_PLANE_XML_CMD.format(acl_ctrl_plane_type   = acl_ctrl_plane_type, 
                                                 operation             = operation,
                                                 attribute_value       = attribute_value)
     logging.info(f"acl_ctrl_plane_type: {acl_ctrl_plane_type}, operation: {operation}, attribute_value: {attribute_value}")
-    return _configure_and_commit(dut_conn, xml_command)
+    return _configure(dut_conn, xml_command, transaction)
 
-def cmd_set_acl_policy__r1_deny_default_permit__src_ip (dut_conn, policy_name, src_ip_to_deny, operation) :
+def cmd_set_acl_policy__r1_deny_default_permit__src_ip (dut_conn, policy_name, src_ip_to_deny, operation, transaction=None) :
     """
-    Configure acl policy with r1 rule and deny operation, default rule with permit operation, for a certain source IP
+    Configure acl policy with r1 rule and deny operation, default rule with permit operation, for a certain source IP.
+    If transaction (NetconfTransaction) is given, the command is only added to it.
     """
     xml_command = ACL_POLICY_R1_DENY_DEFAULT_PERMIT__SRC_IP_XML_CMD.format(policy_name    = policy_name,
                                                                            operation      = operation,
                                                                            src_ip_to_deny = src_ip_to_deny)
     logging.info(f"policy_name: {policy_name}, operation: {operation}, src_ip_to_deny: {src_ip_to_deny}")
-    return _configure_and_commit(dut_conn, xml_command)
+    return _configure(dut_conn, xml_command, transaction)
 
-def cmd_set_acl_policy__r1_permit_default_deny__src_ip (dut_conn, policy_name, src_ip_to_permit, operation) :
+def cmd_set_acl_policy__r1_permit_default_deny__src_ip (dut_conn, policy_name, src_ip_to_permit, operation, transaction=None) :
     """
-    Configure acl policy with r1 rule and permit operation, default rule with deny operation, for a certain source IP
+    Configure acl policy with r1 rule and permit operation, default rule with deny operation, for a certain source IP.
+    If transaction (NetconfTransaction) is given, the command is only added to it.
     """
     xml_command = ACL_POLICY_R1_PERMIT_DEFAULT_DENY__SRC_IP_XML_CMD.format(policy_name    = policy_name,
                                                                            operation      = operation,
                                                                            src_ip_to_permit = src_ip_to_permit)
     logging.info(f"policy_name: {policy_name}, operation: {operation}, src_ip_to_permit: {src_ip_to_permit}")
-    return _configure_and_commit(dut_conn, xml_command)
+    return _configure(dut_conn, xml_command, transaction)
 
 # ***************************************************************************************
 # UT
 # ***************************************************************************************
+class _ReplayChannel(object):
+    """
+    Stand-in for the paramiko channel, replaying a captured byte stream
+    """
+    def __init__(self, data, block_size=bufsiz):
+        self.data = data
+        self.pos = 0
+        self.block_size = block_size
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, n):
+        n = min(n, self.block_size)
+        block = self.data[self.pos:self.pos + n]
+        self.pos += len(block)
+        return block
+
+def _legacy_recv_msg(chan):
+    """
+    The receive path of FRAMING_1_0 before RecvBuffer, kept for benchmarking only
+    """
+    buf = b""
+    msg = b""
+    while True:
+        bytes = buf
+        buf = b""
+        while len(bytes) < 6:
+            x = chan.recv(bufsiz)
+            if x == b"":
+                return msg + bytes
+            bytes += x
+        idx = bytes.find(b"]]>]]>")
+        if idx > -1:
+            return msg + bytes[:idx]
+        buf = bytes[-5:]
+        msg += bytes[:-5]
+
+class _NetconfStandIn(object):
+    """
+    In process Netconf server, for testing the client without a DUT.
+    Runs over one end of a socket pair, in a thread, and uses MyNetconf for its own framing.
+    Each received rpc is answered with reply_handler(rpc), sent in chunks of chunk_size bytes,
+    latency seconds after the rpc arrived (replies to pipelined rpcs are delayed concurrently).
+    """
+    def __init__(self, versions, reply_handler, chunk_size=bufsiz, latency=0):
+        self.versions = versions
+        self.reply_handler = reply_handler
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.send_lock = threading.Lock()
+        self.client_hello = None
+        self.server = None
+        self.server_ready = threading.Event()
+        client_sock, self.server_sock = socket.socketpair()
+        self.client_chan = SocketChannel(client_sock)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        import parse_xml
+
+        server = MyNetconf(hostname = "localhost", port = 0, username = "", password = "", publicKey = "", publicKeyType = "")
+        server.chan = SocketChannel(self.server_sock)
+        server.send_msg(hello_msg(self.versions))
+        self.client_hello = server.recv_msg()
+        client_capabilities = parse_xml.get_text_attribute_list(self.client_hello, "capability")
+        if '1.1' in self.versions and base_1_1 in client_capabilities :
+            server.framing = FRAMING_1_1
+        self.server = server
+        self.server_ready.set()
+
+        timers = []
+        while True :
+            rpc = server.recv_msg()
+            if rpc == b"" :
+                break
+            reply = self.reply_handler(rpc)
+            if self.latency > 0 :
+                timer = threading.Timer(self.latency, self._send_reply, (server, reply))
+                timer.start()
+                timers.append(timer)
+            else :
+                self._send_reply(server, reply)
+        for timer in timers :
+            timer.join()
+        server.chan.close()
+
+    def _send_reply(self, server, reply):
+        with self.send_lock :
+            for offset in range(0, len(reply), self.chunk_size) :
+                server.send(reply[offset:offset + self.chunk_size])
+            server.send_eom()
+
+    def send_notification(self, event_xml, event_time="2021-06-01T10:00:00Z"):
+        """Push a notification with the event_xml event to the client, after hello"""
+        self.server_ready.wait()
+        self._send_reply(self.server, f"""<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">
+            <eventTime>{event_time}</eventTime>{event_xml}</notification>""")
+
+    def create_client(self):
+        """Return a MyNetconf client connected to the stand-in, before hello"""
+        dut_conn = MyNetconf(hostname = "localhost", port = 0, username = "", password = "", publicKey = "", publicKeyType = "")
+        dut_conn.chan = self.client_chan
+        return dut_conn
+
+def _test_framing_negotiation() :
+    """
+    Verify base:1.1 negotiation, and chunked framing of large multi chunk replies, against _NetconfStandIn
+    """
+    import parse_xml
+
+    config_reply = parse_xml.create_x_eth_config_reply(2000).decode()
+
+    # DUT supporting base:1.1 - Switch to chunked framing
+    stand_in = _NetconfStandIn(['1.0', '1.1'], lambda rpc : config_reply, chunk_size=4000)
+    dut_conn = stand_in.create_client()
+    capabilities = _cmd_hello(dut_conn)
+    assert base_1_1 in capabilities
+    assert dut_conn.framing == FRAMING_1_1
+    for _ in range(3) :
+        reply = _get_config_by_xpath(dut_conn, ["interface", "x-eth"])
+        assert reply.decode() == config_reply
+    dut_conn.chan.close()
+
+    # DUT supporting base:1.0 only - Keep end of message framing
+    stand_in = _NetconfStandIn(['1.0'], lambda rpc : config_reply)
+    dut_conn = stand_in.create_client()
+    capabilities = _cmd_hello(dut_conn)
+    assert base_1_1 not in capabilities
+    assert dut_conn.framing == FRAMING_1_0
+    reply = _get_config_by_xpath(dut_conn, ["interface", "x-eth"])
+    assert reply.decode() == config_reply
+    dut_conn.chan.close()
+
+    # Non ASCII content - chunk sizes are counted in octets
+    stand_in = _NetconfStandIn(['1.0', '1.1'], lambda rpc : rpc.decode())
+    dut_conn = stand_in.create_client()
+    _cmd_hello(dut_conn)
+    rpc = '<rpc message-id="1"><description>\u05e7\u05e0\u05e8\u05d9</description></rpc>'
+    dut_conn.send_msg(rpc)
+    assert dut_conn.recv_msg().decode() == rpc
+    dut_conn.chan.close()
+
+    logging.info(f"{get_time()} _test_framing_negotiation passed")
+
+def _stand_in_get_config_reply(rpc) :
+    """
+    _NetconfStandIn reply handler - rpc-reply with the rpc message-id, echoing the xpath filter
+    """
+    message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+    xpath = re.search(rb'''select=(["'])(.*?)\1''', rpc).group(2).decode()
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+    <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}">
+        <data><xpath>{xpath}</xpath></data>
+    </rpc-reply>"""
+
+def _test_pipelined_rpcs(num_of_rpcs=40, latency=0.05) :
+    """
+    Verify that pipelined rpcs get unique message-ids and are matched with their own replies,
+    and compare to sequential rpcs over a link with latency seconds round trip time
+    """
+    import time
+
+    xml_path_lists = [["interface", f"x-eth[instance='0/0/{index}']"] for index in range(num_of_rpcs)]
+
+    # Sequential
+    stand_in = _NetconfStandIn(['1.0', '1.1'], _stand_in_get_config_reply, latency=latency)
+    dut_conn = stand_in.create_client()
+    _cmd_hello(dut_conn)
+    start = time.perf_counter()
+    for xml_path_list in xml_path_lists :
+        reply = _get_config_by_xpath(dut_conn, xml_path_list)
+        assert '/'.join(xml_path_list).encode() in reply
+    sequential_time = time.perf_counter() - start
+    dut_conn.chan.close()
+
+    # Pipelined
+    stand_in = _NetconfStandIn(['1.0', '1.1'], _stand_in_get_config_reply, latency=latency)
+    dut_conn = stand_in.create_client()
+    _cmd_hello(dut_conn)
+    pipeline = NetconfPipeline(dut_conn)
+    start = time.perf_counter()
+    futures = [pipeline.get_config(xml_path_list) for xml_path_list in xml_path_lists]
+    replies = [future.result(timeout=10) for future in futures]
+    pipelined_time = time.perf_counter() - start
+
+    message_ids = set()
+    for xml_path_list, reply in zip(xml_path_lists, replies) :
+        assert '/'.join(xml_path_list).encode() in reply
+        message_ids.add(get_reply_message_id(reply))
+    assert len(message_ids) == num_of_rpcs
+
+    # Helper functions go through the attached pipeline
+    reply = _get_config_by_xpath(dut_conn, ["ctrl-plane"])
+    assert b"/ctrl-plane" in reply
+
+    dut_conn.chan.close()
+    pipeline.reader.join(10)
+    assert pipeline.closed
+
+    logging.info(f"{get_time()} _test_pipelined_rpcs passed. {num_of_rpcs} rpcs, {latency * 1000:.0f} ms RTT: " + 
+                 f"sequential {sequential_time * 1000:.0f} ms, pipelined {pipelined_time * 1000:.0f} ms")
+
+def _test_transaction() :
+    """
+    Verify that a transaction is sent as one edit-config, one validate and one commit,
+    and that a failing transaction discards the candidate changes
+    """
+    received_ops = []
+    fail_ops = []
+
+    def reply_handler(rpc) :
+        op = re.search(rb'<(edit-config|validate|commit|discard-changes)\b', rpc).group(1).decode()
+        received_ops.append(op)
+        message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+        result = "<rpc-error><error-tag>invalid-value</error-tag></rpc-error>" if op in fail_ops else "<ok/>"
+        return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}">{result}</rpc-reply>"""
+
+    stand_in = _NetconfStandIn(['1.0', '1.1'], reply_handler)
+    dut_conn = stand_in.create_client()
+    _cmd_hello(dut_conn)
+
+    transaction = NetconfTransaction(dut_conn)
+    cmd_set_attach_policy_acl_in_x_eth(dut_conn, "0/0/1", "pol_ipv4", operation="operation=\"delete\"", transaction=transaction)
+    cmd_set_ctrl_plane_acl(dut_conn, "egress", " operation=\"delete\"", "pol_ipv4", transaction=transaction)
+    cmd_set_acl_policy__r1_deny_default_permit__src_ip(dut_conn, "pol_ipv4", "1.2.3.4", "operation=\"replace\"", transaction=transaction)
+    assert received_ops == []
+    assert transaction.commit() == True
+    assert received_ops == ["edit-config", "validate", "commit"]
+
+    received_ops.clear()
+    fail_ops.append("validate")
+    cmd_set_acl_policy__r1_deny_default_permit__src_ip(dut_conn, "pol_ipv4", "1.2.3.4", "operation=\"replace\"", transaction=transaction)
+    assert transaction.commit() == False
+    assert received_ops == ["edit-config", "validate", "discard-changes"]
+    dut_conn.chan.close()
+
+    logging.info(f"{get_time()} _test_transaction passed")
+
+def _test_streaming_parse() :
+    """
+    Verify attribute lookups parsed while the reply arrives, including early stop in the middle of
+    a multi chunk reply, followed by another rpc on the same session
+    """
+    import parse_xml
+
+    config_reply = parse_xml.create_x_eth_config_reply(3000).decode()
+    ctrl_plane_reply = """<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">
+        <data><ctrl-plane xmlns="http://compass-eos.com/ns/compass_yang"><policy><acl><egress>my</egress></acl></policy></ctrl-plane></data>
+    </rpc-reply>"""
+
+    def reply_handler(rpc) :
+        return ctrl_plane_reply if b"ctrl-plane" in rpc else config_reply
+
+    for versions in [['1.0'], ['1.0', '1.1']] :
+        stand_in = _NetconfStandIn(versions, reply_handler, chunk_size=8000)
+        dut_conn = stand_in.create_client()
+        # Without cache (the default), lookups are parsed from the chunks as they arrive
+        _cmd_hello(dut_conn)
+        assert cmd_get_policy_acl_in_name(dut_conn, "0/0/7") == "pol_ipv4_7"
+        assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+        assert cmd_get_policy_acl_in_name(dut_conn, "0/2/951") == "pol_ipv4_2999"
+        assert cmd_get_policy_acl_in_name(dut_conn, "0/7/0") == None
+        assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+        assert cmd_get_ctrl_plane_acl_names(dut_conn, ["egress", "nni-ingress"]) == {"egress" : "my", "nni-ingress" : None}
+        dut_conn.chan.close()
+
+    logging.info(f"{get_time()} _test_streaming_parse passed")
+
+def _test_config_cache() :
+    """
+    Verify that repeated lookups are served from the config cache without rpcs,
+    and that a commit (directly, or through a transaction) invalidates only the overlapping subtrees
+    """
+    import parse_xml
+
+    config_reply = parse_xml.create_x_eth_config_reply(100).decode()
+    ctrl_plane_reply = """<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">
+        <data><ctrl-plane xmlns="http://compass-eos.com/ns/compass_yang"><policy><acl><egress>my</egress></acl></policy></ctrl-plane></data>
+    </rpc-reply>"""
+    received_ops = []
+
+    def reply_handler(rpc) :
+        op = re.search(rb'<(get-config|edit-config|validate|commit)\b', rpc).group(1).decode()
+        if op != "get-config" :
+            received_ops.append(op)
+            message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+            return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}"><ok/></rpc-reply>"""
+        received_ops.append(re.search(rb'select=(["\'])(.*?)\1', rpc).group(2).decode())
+        return ctrl_plane_reply if b"ctrl-plane" in rpc else config_reply
+
+    stand_in = _NetconfStandIn(['1.0', '1.1'], reply_handler)
+    dut_conn = stand_in.create_client()
+    dut_conn.config_cache = ConfigCache()
+    _cmd_hello(dut_conn)
+
+    # Cache misses are parsed from the chunks as they arrive, not received in full first
+    recv_msg = dut_conn.recv_msg
+    dut_conn.recv_msg = None
+    for _ in range(3) :
+        assert cmd_get_policy_acl_in_name(dut_conn, "0/0/7") == "pol_ipv4_7"
+        assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    dut_conn.recv_msg = recv_msg
+    assert received_ops == ["/interface/x-eth", "/ctrl-plane/policy/acl"]
+    assert dut_conn.config_cache.hits == 4
+    # The lookup stopped early, and the whole reply was cached
+    assert dut_conn.config_cache.entries["/interface/x-eth"][1] == config_reply.encode()
+
+    # Committing an interface change drops the interface entry only
+    received_ops.clear()
+    assert cmd_set_attach_policy_acl_in_x_eth(dut_conn, "0/0/7", "pol_ipv4", operation="operation=\"delete\"") == True
+    assert cmd_get_policy_acl_in_name(dut_conn, "0/0/7") == "pol_ipv4_7"
+    assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    assert received_ops == ["edit-config", "commit", "/interface/x-eth"]
+
+    received_ops.clear()
+    transaction = NetconfTransaction(dut_conn)
+    cmd_set_ctrl_plane_acl(dut_conn, "egress", " operation=\"delete\"", "pol_ipv4", transaction=transaction)
+    assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    assert transaction.commit() == True
+    assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    assert cmd_get_policy_acl_in_name(dut_conn, "0/0/7") == "pol_ipv4_7"
+    assert received_ops == ["edit-config", "validate", "commit", "/ctrl-plane/policy/acl"]
+
+    # With a TTL, expired entries are fetched again
+    received_ops.clear()
+    dut_conn.config_cache.ttl = 0
+    time.sleep(0.01)
+    assert cmd_get_ctrl_plane_acl_name(dut_conn, "egress") == "my"
+    assert received_ops == ["/ctrl-plane/policy/acl"]
+    dut_conn.chan.close()
+
+    logging.info(f"{get_time()} _test_config_cache passed")
+
+def _test_notifications() :
+    """
+    Verify notification subscription, waiting for an event among other events, timeout,
+    and the asynchronous generator
+    """
+    import asyncio
+
+    def reply_handler(rpc) :
+        message_id = re.search(rb'message-id="([^"]*)"', rpc).group(1).decode()
+        assert b"create-subscription" in rpc
+        return f"""<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{message_id}"><ok/></rpc-reply>"""
+
+    def config_change_event(datastore) :
+        return f"""<netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications">
+            <changed-by><username>admin</username><session-id>5</session-id></changed-by>
+            <datastore>{datastore}</datastore></netconf-config-change>"""
+
+    stand_in = _NetconfStandIn(['1.0', '1.1'], reply_handler)
+    dut_conn = stand_in.create_client()
+    _cmd_hello(dut_conn)
+    # Closed like the SSH transport
+    dut_conn.ssh = dut_conn.chan
+    notifications = NotificationStream(dut_conn)
+    notifications.subscribe()
+
+    # Nothing received yet
+    start = time.monotonic()
+    assert notifications.wait_for_commit(timeout=0.1) == None
+    assert time.monotonic() - start < 1
+
+    def push_events() :
+        time.sleep(0.05)
+        stand_in.send_notification("""<card-state-change xmlns="http://compass-eos.com/ns/compass_yang"><card>LC-0-0</card><state>Card-Ready</state></card-state-change>""")
+        stand_in.send_notification(config_change_event("candidate"))
+        stand_in.send_notification(config_change_event("running"))
+    threading.Thread(target=push_events).start()
+
+    event = notifications.wait_for_commit(timeout=5)
+    assert event.name == "netconf-config-change"
+    assert event.get_text(["datastore"]) == "running"
+    assert event.get_text(["changed-by", "username"]) == "admin"
+    assert event.event_time == "2021-06-01T10:00:00Z"
+
+    async def consume() :
+        stand_in.send_notification("""<card-state-change xmlns="http://compass-eos.com/ns/compass_yang"><card>CPM-0-0</card><state>Card-Ready</state></card-state-change>""")
+        async for event in notifications.async_events(timeout=5) :
+            return event
+    event = asyncio.run(consume())
+    assert event.name == "card-state-change" and event.get_text(["card"]) == "CPM-0-0"
+
+    notifications.close()
+    assert notifications.get_event(timeout=1) == None
+
+    logging.info(f"{get_time()} _test_notifications passed")
+
+def _benchmark_recv_msg(reply_file=None, num_of_interfaces=20000, num_of_runs=3) :
+    """
+    Replay a multi-megabyte get-config reply through the legacy and the RecvBuffer receive paths.
+    Input : reply_file - File holding a captured reply (without framing). 
+                         If None, a reply with num_of_interfaces x-eth instances is generated.
+            num_of_interfaces - 
+            num_of_runs - 
+    """
+    import time
+    import parse_xml
+
+    if reply_file != None :
+        with open(reply_file, 'rb') as f :
+            reply = f.read()
+    else :
+        reply = parse_xml.create_x_eth_config_reply(num_of_interfaces)
+    stream = reply + EOM_1_0
+
+    logging.info(f"{get_time()} Replaying reply of {len(reply) / 1e6:.1f} MB, {num_of_runs} runs")
+
+    start = time.perf_counter()
+    for _ in range(num_of_runs) :
+        msg = _legacy_recv_msg(_ReplayChannel(stream))
+    legacy_time = (time.perf_counter() - start) / num_of_runs
+    assert msg == reply
+
+    dut_conn = MyNetconf(hostname = "localhost", port = 0, username = "", password = "", publicKey = "", publicKeyType = "")
+    start = time.perf_counter()
+    for _ in range(num_of_runs) :
+        dut_conn.chan = _ReplayChannel(stream)
+        msg = dut_conn.recv_msg()
+    new_time = (time.perf_counter() - start) / num_of_runs
+    assert msg == reply
+
+    logging.info(f"{get_time()} Legacy recv_msg: {legacy_time * 1000:.1f} ms, RecvBuffer recv_msg: {new_time * 1000:.1f} ms")
+    return legacy_time, new_time
+
 def my_main() :
     """
     My Main - ACL test case example
@@ -833,4 +2047,11 @@ def my_main() :
         cmd_set_ctrl_plane_acl(dut_conn=dut_conn, acl_ctrl_plane_type="nni_ingress", attribute_value=ctrl_plane_nni_ingress, operation="operation=\"delete\"")
 
 if __name__ == "__main__" :
+    # _benchmark_recv_msg()
+    # _test_framing_negotiation()
+    # _test_pipelined_rpcs()
+    # _test_transaction()
+    # _test_streaming_parse()
+    # _test_config_cache()
+    # _test_notifications()
     my_main()
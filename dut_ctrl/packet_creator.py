@@ -1,7 +1,196 @@
 """
-Create a packet or a frame using Scapy according to user parameters
+Create a packet or a frame using Scapy according to user parameters.
+Frames of a FrameType are built once, into a FrameTemplate - by Scapy, or by struct when Scapy is not installed.
+Following frames are stamped into a copy of its bytes : the destination MAC, IP addresses and TOS are written at their
+offsets, and the IPv4 header checksum is updated incrementally (RFC 1624), without building Scapy layers.
+Scapy is imported on first use only - importing this module stays fast.
 """
-from scapy.all import Ether, IP, ICMP
+import socket
+import struct
+from common_enums import FrameType
+from frame_bulk import L4_NONE, L4_ICMP, L4_UDP, IP_PROTO_UDP, DEFAULT_SRC_MAC, create_base_frame, internet_checksum
+
+# Offsets in an Ethernet II frame of IPv4, with no VLAN tag and no IP options
+ETH_DST_OFFSET     = 0
+ETH_SRC_OFFSET     = 6
+IP_OFFSET          = 14
+IP_TOS_OFFSET      = 15
+IP_CHECKSUM_OFFSET = 24
+IP_SRC_OFFSET      = 26
+IP_DST_OFFSET      = 30
+L4_OFFSET          = 34
+ETH_TYPE_IPV4      = b"\x08\x00"
+
+# ***************************************************************************************
+# Frame building backends
+# Scapy is imported only when a frame is built by it, since its import takes seconds.
+# Frames of the common shapes - Ether / IP [/ ICMP | / UDP] - are packed by struct when Scapy is not installed.
+# ***************************************************************************************
+FRAME_BACKEND_SCAPY  = "scapy"
+FRAME_BACKEND_STRUCT = "struct"
+# None - FRAME_BACKEND_SCAPY if Scapy is installed, otherwise FRAME_BACKEND_STRUCT
+FRAME_BACKEND = None
+
+# Scapy default
+UDP_PORT = 53
+
+def get_frame_backend() -> str :
+    """
+    Return value : FRAME_BACKEND_SCAPY or FRAME_BACKEND_STRUCT. Scapy is looked up, not imported.
+    """
+    import importlib.util
+
+    if FRAME_BACKEND != None :
+        return FRAME_BACKEND
+    return FRAME_BACKEND_SCAPY if importlib.util.find_spec("scapy") != None else FRAME_BACKEND_STRUCT
+
+def build_frame_struct(src_ip: str, dst_ip: str, dst_mac: str, tos: int = 0, l4: str = L4_NONE,
+                       src_port: int = UDP_PORT, dst_port: int = UDP_PORT, payload: bytes = b"", src_mac: str = DEFAULT_SRC_MAC) -> bytes :
+    """
+    Write the field values into the frame_bulk base frame - Ether / IP [/ ICMP echo request | / UDP] / payload,
+    with the field values that Scapy uses by default
+    Input : src_mac - Fixed, locally administered by default. Scapy takes the MAC of the interface that routes to dst_ip.
+    Return value : The frame bytes
+    """
+    frame = bytearray(create_base_frame(False, l4, payload))
+    frame[ETH_DST_OFFSET : ETH_DST_OFFSET + 12] = bytes.fromhex((dst_mac + src_mac).replace(":", ""))
+    frame[IP_TOS_OFFSET] = tos
+    frame[IP_SRC_OFFSET : IP_SRC_OFFSET + 4] = socket.inet_aton(src_ip)
+    frame[IP_DST_OFFSET : IP_DST_OFFSET + 4] = socket.inet_aton(dst_ip)
+    struct.pack_into("!H", frame, IP_CHECKSUM_OFFSET, internet_checksum(frame[IP_OFFSET : L4_OFFSET]))
+
+    if l4 == L4_ICMP :
+        struct.pack_into("!H", frame, L4_OFFSET + 2, internet_checksum(frame[L4_OFFSET :]))
+    elif l4 == L4_UDP :
+        struct.pack_into("!HH", frame, L4_OFFSET, src_port, dst_port)
+        pseudo_header = frame[IP_SRC_OFFSET : L4_OFFSET] + struct.pack("!HH", IP_PROTO_UDP, len(frame) - L4_OFFSET)
+        # A computed 0 is sent as 0xffff - 0 means no checksum
+        struct.pack_into("!H", frame, L4_OFFSET + 6, internet_checksum(pseudo_header + frame[L4_OFFSET :]) or 0xffff)
+    return bytes(frame)
+
+def _build_frame_scapy(src_ip: str, dst_ip: str, dst_mac: str, tos: int = 0, l4: str = L4_NONE,
+                       src_port: int = UDP_PORT, dst_port: int = UDP_PORT, payload: bytes = b"", src_mac: str = DEFAULT_SRC_MAC) -> bytes :
+    from scapy.all import Ether, IP, ICMP, UDP, Raw
+
+    frame = Ether(dst = dst_mac, src = src_mac) / IP(src = src_ip, dst = dst_ip, tos = tos)
+    if l4 == L4_ICMP :
+        frame = frame / ICMP()
+    elif l4 == L4_UDP :
+        frame = frame / UDP(sport = src_port, dport = dst_port)
+    elif l4 != L4_NONE :
+        raise Exception (f"Unrecognized L4: {l4}")
+    if len(payload) > 0 :
+        frame = frame / Raw(payload)
+    return bytes(frame)
+
+def build_frame(src_ip: str, dst_ip: str, dst_mac: str, tos: int = 0, l4: str = L4_NONE,
+                src_port: int = UDP_PORT, dst_port: int = UDP_PORT, payload: bytes = b"", src_mac: str = DEFAULT_SRC_MAC) -> bytes :
+    """
+    Build a frame by the backend of get_frame_backend(). See build_frame_struct()
+    Return value : The frame bytes. The same with both backends.
+    """
+    if get_frame_backend() == FRAME_BACKEND_SCAPY :
+        return _build_frame_scapy(src_ip, dst_ip, dst_mac, tos, l4, src_port, dst_port, payload, src_mac)
+    return build_frame_struct(src_ip, dst_ip, dst_mac, tos, l4, src_port, dst_port, payload, src_mac)
+
+# ***************************************************************************************
+# Frame templates
+# ***************************************************************************************
+class FrameTemplate(object):
+    """
+    A frame shape, built once by Scapy, and stamped with new field values
+    Input : name - Template name, such as "icmp"
+            build - Function (src_ip, dst_ip, dst_mac, tos) -> Scapy packet (or bytes) of the frame shape.
+                    Called once, with the values of the first frame. Its L4 checksum must not cover IP addresses,
+                    such as ICMP, or no L4 at all.
+    The source MAC of the stamped frames is the one of the built frame, unless stamp() is given src_mac.
+    FRAME_TEMPLATES are built with DEFAULT_SRC_MAC - Not the MAC that Scapy picks by the route to the first dst_ip.
+    """
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self.frame = None
+        # Sum of the complemented checksum and the complemented words of the stamped fields - RFC 1624 HC' = ~(~HC + ~m + m')
+        self.checksum_base = None
+        # MAC address String -> bytes
+        self.mac_bytes = {}
+
+    def _create(self, src_ip, dst_ip, dst_mac, tos):
+        frame = bytes(self.build(src_ip, dst_ip, dst_mac, tos))
+        if frame[12:14] != ETH_TYPE_IPV4 or frame[IP_OFFSET] != 0x45 :
+            raise Exception (f"Frame template {self.name} is not Ethernet II / IPv4 with no options: {frame.hex()}")
+
+        def word(offset) :
+            return int.from_bytes(frame[offset : offset + 2], "big")
+
+        checksum_base = ~word(IP_CHECKSUM_OFFSET) & 0xffff
+        for offset in [IP_OFFSET, IP_SRC_OFFSET, IP_SRC_OFFSET + 2, IP_DST_OFFSET, IP_DST_OFFSET + 2] :
+            checksum_base += ~word(offset) & 0xffff
+        self.frame = frame
+        self.checksum_base = checksum_base
+
+        # The template must reproduce the frame it was built from - With its TOS, since build may ignore tos
+        if bytes(self.stamp(src_ip, dst_ip, dst_mac, frame[IP_TOS_OFFSET])) != frame :
+            raise Exception (f"Frame template {self.name} does not reproduce its frame: {frame.hex()}")
+
+    def _get_mac_bytes(self, mac: str) -> bytes :
+        mac_bytes = self.mac_bytes.get(mac)
+        if mac_bytes == None :
+            mac_bytes = self.mac_bytes[mac] = bytes.fromhex(mac.replace(":", ""))
+        return mac_bytes
+
+    def stamp(self, src_ip: str, dst_ip: str, dst_mac: str, tos: int = None, src_mac: str = None) -> bytearray :
+        """
+        Input : src_ip, dst_ip - Such as '1.2.3.4'
+                dst_mac - Such as '1e:94:a0:04:17:06'
+                tos - IP TOS byte. None keeps the TOS of the template.
+                src_mac - None keeps the source MAC of the template
+        Return value : The frame bytes
+        """
+        if self.frame == None :
+            self._create(src_ip, dst_ip, dst_mac, tos)
+
+        frame = bytearray(self.frame)
+        frame[ETH_DST_OFFSET : ETH_DST_OFFSET + 6] = self._get_mac_bytes(dst_mac)
+        if src_mac != None :
+            frame[ETH_SRC_OFFSET : ETH_SRC_OFFSET + 6] = self._get_mac_bytes(src_mac)
+        if tos != None :
+            frame[IP_TOS_OFFSET] = tos
+        src_bytes = socket.inet_aton(src_ip)
+        dst_bytes = socket.inet_aton(dst_ip)
+        frame[IP_SRC_OFFSET : IP_SRC_OFFSET + 4] = src_bytes
+        frame[IP_DST_OFFSET : IP_DST_OFFSET + 4] = dst_bytes
+        src = int.from_bytes(src_bytes, "big")
+        dst = int.from_bytes(dst_bytes, "big")
+
+        checksum = self.checksum_base + (frame[IP_OFFSET] << 8 | frame[IP_TOS_OFFSET]) + \
+                   (src >> 16) + (src & 0xffff) + (dst >> 16) + (dst & 0xffff)
+        checksum = (checksum & 0xffff) + (checksum >> 16)
+        checksum = (checksum & 0xffff) + (checksum >> 16)
+        frame[IP_CHECKSUM_OFFSET : IP_CHECKSUM_OFFSET + 2] = (~checksum & 0xffff).to_bytes(2, "big")
+        return frame
+
+    def stamp_hex(self, src_ip: str, dst_ip: str, dst_mac: str, tos: int = None, src_mac: str = None) -> str :
+        """
+        Return value : String representation of the hex frame value
+        """
+        return self.stamp(src_ip, dst_ip, dst_mac, tos, src_mac).hex()
+
+FRAME_TEMPLATES = {
+    FrameType.L2_L3_FRAME   : FrameTemplate("l2_l3",   lambda src_ip, dst_ip, dst_mac, tos : build_frame(src_ip, dst_ip, dst_mac)),
+    FrameType.ICMP_FRAME    : FrameTemplate("icmp",    lambda src_ip, dst_ip, dst_mac, tos : build_frame(src_ip, dst_ip, dst_mac, l4 = L4_ICMP)),
+    FrameType.L3_DSCP_FRAME : FrameTemplate("l3_dscp", lambda src_ip, dst_ip, dst_mac, tos : build_frame(src_ip, dst_ip, dst_mac, tos)),
+}
+
+def create_frames(frame_type: FrameType, variants) -> list :
+    """
+    Create many frames of one shape
+    Input : frame_type - FrameType
+            variants - Iterable of (src_ip, dst_ip, dst_mac), (src_ip, dst_ip, dst_mac, tos) or (src_ip, dst_ip, dst_mac, tos, src_mac)
+    Return value : List of the String representations of the hex frame values
+    """
+    stamp_hex = FRAME_TEMPLATES[frame_type].stamp_hex
+    return [stamp_hex(*variant) for variant in variants]
 
 def create_l2_l3_frame(src_ip, dst_ip, dst_mac) :
     """
@@ -16,8 +205,7 @@ def create_l2_l3_frame(src_ip, dst_ip, dst_mac) :
         <Ether  dst=31:65:3a:39:34:3a src=61:30:3a:30:34:3a type=0x3137 |
         <Raw  load=':06E\x00\x00\x14\x00\x01\x00\x00@\x00r\\xdf\x01\x02\x03\x04\x01\x02\x03\x03' |>>
     """
-    frame = Ether(dst = dst_mac) / IP(src = src_ip, dst = dst_ip)
-    return bytes(frame).hex()
+    return FRAME_TEMPLATES[FrameType.L2_L3_FRAME].stamp_hex(src_ip, dst_ip, dst_mac)
     
 def create_icmp_frame(src_ip, dst_ip, dst_mac) :
     """
@@ -32,8 +220,7 @@ def create_icmp_frame(src_ip, dst_ip, dst_mac) :
         <Ether  dst=31:65:3a:39:34:3a src=61:30:3a:30:34:3a type=0x3137 |
         <Raw  load=':06E\x00\x00\x14\x00\x01\x00\x00@\x00r\\xdf\x01\x02\x03\x04\x01\x02\x03\x03' |>>
     """
-    frame = Ether(dst = dst_mac) / IP(src = src_ip, dst = dst_ip) / ICMP()
-    return bytes(frame).hex()
+    return FRAME_TEMPLATES[FrameType.ICMP_FRAME].stamp_hex(src_ip, dst_ip, dst_mac)
 
 def create_l3_dscp_frame(src_ip: str, dst_ip: str, dst_mac: str , tos: int) -> bytes :
     """
@@ -58,14 +245,11 @@ def create_l3_dscp_frame(src_ip: str, dst_ip: str, dst_mac: str , tos: int) -> b
     #                                    af41 is TOS 0x88 goes to queue af3
     # TX from BCMRM : tx 10 PSRC=47 DATA=903cb304603100155de27a690800458800140001000040000c01362e0102362f0102
     
-    frame = Ether(dst = dst_mac) / IP(src = src_ip, dst = dst_ip, tos = tos)
-    return bytes(frame).hex()
-
-
-from scapy.all import *
+    return FRAME_TEMPLATES[FrameType.L3_DSCP_FRAME].stamp_hex(src_ip, dst_ip, dst_mac, tos)
 
 def create_dhcp_discover_packet(vlan_id):
     """Creates a DHCP discover packet with the specified VLAN ID."""
+    from scapy.all import Ether, Dot1Q, IP, UDP, DHCP
 
     ethernet_frame = Ether(dst="ff:ff:ff:ff:ff:ff") / Dot1Q(vlan=vlan_id) / Ether()
     ip_packet = IP(src="0.0.0.0", dst="255.255.255.255")
@@ -76,7 +260,137 @@ def create_dhcp_discover_packet(vlan_id):
 
     return packet
 
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _ip_header_checksum(frame) -> int :
+    """
+    Return value : The IPv4 header checksum of frame, computed in full
+    """
+    header = bytes(frame[IP_OFFSET : IP_CHECKSUM_OFFSET]) + b"\x00\x00" + bytes(frame[IP_CHECKSUM_OFFSET + 2 : IP_OFFSET + 20])
+    return internet_checksum(header)
+
+def _test_frame_template() :
+    import random
+
+    # Built from the frame of create_icmp_frame() docstring, instead of Scapy
+    icmp_frame = bytes.fromhex('1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000')
+    template = FrameTemplate("icmp", lambda src_ip, dst_ip, dst_mac, tos : icmp_frame)
+    assert template.stamp_hex('1.2.3.4', '1.2.3.3', '1e:94:a0:04:17:06') == icmp_frame.hex()
+
+    frame = template.stamp('10.0.0.1', '20.0.0.1', '90:3c:b3:04:60:31', tos = 0x88)
+    assert frame[:6].hex() == '903cb3046031' and frame[6:12] == icmp_frame[6:12] and frame[IP_TOS_OFFSET] == 0x88
+    assert socket.inet_ntoa(bytes(frame[IP_SRC_OFFSET : IP_SRC_OFFSET + 4])) == '10.0.0.1'
+    assert frame[34:] == icmp_frame[34:]
+    frame = template.stamp('10.0.0.1', '20.0.0.1', '90:3c:b3:04:60:31', src_mac = '02:00:00:00:00:07')
+    assert frame[6:12].hex(":") == '02:00:00:00:00:07' and _ip_header_checksum(frame) == int.from_bytes(frame[24:26], "big")
+
+    random.seed(1)
+    for _ in range(10000) :
+        src_ip, dst_ip = [socket.inet_ntoa(random.getrandbits(32).to_bytes(4, "big")) for _ in range(2)]
+        frame = template.stamp(src_ip, dst_ip, '1e:94:a0:04:17:06', random.choice([None, 0, 0x88, 0xff]))
+        assert int.from_bytes(frame[IP_CHECKSUM_OFFSET : IP_CHECKSUM_OFFSET + 2], "big") == _ip_header_checksum(frame)
+
+    # Built from the frame of create_l3_dscp_frame() docstring
+    dscp_frame = bytes.fromhex('903cb304603100155de27a690800458800140001000040000c01362e0102362f0102')
+    template = FrameTemplate("l3_dscp", lambda src_ip, dst_ip, dst_mac, tos : dscp_frame)
+    assert template.stamp_hex('54.46.1.2', '54.47.1.2', '90:3c:b3:04:60:31', 0x88) == dscp_frame.hex()
+    assert template.stamp_hex('54.46.1.2', '54.47.1.2', '90:3c:b3:04:60:31', 0) == \
+           '903cb304603100155de27a690800450000140001000040000c89362e0102362f0102'
+
+    # Not a frame that can be stamped - IP options
+    try :
+        FrameTemplate("options", lambda src_ip, dst_ip, dst_mac, tos : dscp_frame[:14] + b"\x46" + dscp_frame[15:]).stamp('1.1.1.1', '2.2.2.2', '00:00:00:00:00:01')
+        assert False
+    except Exception as error :
+        assert "no options" in str(error)
+
+    print("_test_frame_template passed")
+
+def _test_build_frame_struct() :
+    # Frames of the create_*_frame() docstrings, built by Scapy
+    assert build_frame_struct('1.2.3.4', '1.2.3.3', '1e:94:a0:04:17:06', src_mac = '00:15:5d:94:1a:a6').hex() == \
+           '1e94a004170600155d941aa608004500001400010000400072df0102030401020303'
+    assert build_frame_struct('1.2.3.4', '1.2.3.3', '1e:94:a0:04:17:06', l4 = L4_ICMP, src_mac = '00:15:5d:cd:ff:07').hex() == \
+           '1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000'
+    assert build_frame_struct('54.46.1.2', '54.47.1.2', '90:3c:b3:04:60:31', tos = 0x88, src_mac = '00:15:5d:e2:7a:69').hex() == \
+           '903cb304603100155de27a690800458800140001000040000c01362e0102362f0102'
+
+    # UDP - The checksum over the pseudo header and the datagram is 0
+    frame = build_frame_struct('10.0.0.1', '20.0.0.1', '1e:94:a0:04:17:06', l4 = L4_UDP, src_port = 1000, dst_port = 2000, payload = b"abc")
+    assert struct.unpack("!HHH", frame[34:40]) == (1000, 2000, 11) and frame[-3:] == b"abc"
+    assert internet_checksum(frame[26:34] + struct.pack("!HH", 17, 11) + frame[34:]) == 0
+    assert _ip_header_checksum(frame) == struct.unpack("!H", frame[24:26])[0]
+    assert frame[6:12].hex(":") == DEFAULT_SRC_MAC
+
+    # The templates build by the backend that is available
+    assert len(create_icmp_frame('1.2.3.4', '1.2.3.3', '1e:94:a0:04:17:06')) == 42 * 2
+    assert create_icmp_frame('54.46.1.2', '8.8.8.8', '1e:94:a0:04:17:06')[12:24] == DEFAULT_SRC_MAC.replace(":", "")
+
+    # A fresh template, whose build ignores tos, is first stamped with a TOS - The TOS is stamped, not built
+    template = FrameTemplate("icmp", lambda src_ip, dst_ip, dst_mac, tos : build_frame(src_ip, dst_ip, dst_mac, l4 = L4_ICMP))
+    frame = template.stamp('1.1.1.1', '2.2.2.2', '1e:94:a0:04:17:06', 0x88)
+    assert frame[IP_TOS_OFFSET] == 0x88 and _ip_header_checksum(frame) == int.from_bytes(frame[24:26], "big")
+    assert template.stamp('1.1.1.1', '2.2.2.2', '1e:94:a0:04:17:06')[IP_TOS_OFFSET] == 0
+    print(f"_test_build_frame_struct passed. Backend: {get_frame_backend()}")
+
+def _benchmark_create_frames(num_of_frames = 100000) :
+    """
+    Stamp num_of_frames ICMP frames, compared with building each by Scapy
+    """
+    import time
+
+    variants = [(f"10.{i >> 16 & 0xff}.{i >> 8 & 0xff}.{i & 0xff}", "20.0.0.1", "1e:94:a0:04:17:06") for i in range(num_of_frames)]
+
+    start = time.perf_counter()
+    frames = create_frames(FrameType.ICMP_FRAME, variants)
+    template_time = time.perf_counter() - start
+
+    if get_frame_backend() != FRAME_BACKEND_SCAPY :
+        print(f"{num_of_frames} frames : template {template_time * 1000:.0f} ms")
+        return
+
+    num_of_scapy_frames = min(num_of_frames, 1000)
+    start = time.perf_counter()
+    for index, (src_ip, dst_ip, dst_mac) in enumerate(variants[:num_of_scapy_frames]) :
+        assert _build_frame_scapy(src_ip, dst_ip, dst_mac, l4 = L4_ICMP).hex() == frames[index]
+    scapy_time = (time.perf_counter() - start) / num_of_scapy_frames * num_of_frames
+
+    print(f"{num_of_frames} frames : template {template_time * 1000:.0f} ms, Scapy (estimated) {scapy_time * 1000:.0f} ms")
+
+def _benchmark_import_time(modules = ("common_enums", "cli_table", "alias_index", "fsm", "packet_creator", "frame_bulk",
+                                      "cli_control", "fixtures", "test_suite_acl", "test_init"),
+                           max_import_ms = 200) :
+    """
+    Import time of each module, in a new interpreter (python -X importtime), without the interpreter startup.
+    Modules slower than max_import_ms, or that could not be imported, are reported.
+    Return value : Dictionary {module : import milliseconds, None if not imported}
+    """
+    import os
+    import re
+    import sys
+    import subprocess
+
+    import_times = {}
+    for module in modules :
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        match = re.search(rf"^import time:\s+\d+ \|\s+(\d+) \| {module}$", result.stderr, re.MULTILINE)
+        if result.returncode != 0 or match == None :
+            import_times[module] = None
+            print(f"{module:<16} : failed - {result.stderr.strip().splitlines()[-1:]}")
+            continue
+        import_times[module] = int(match.group(1)) / 1000
+        print(f"{module:<16} : {import_times[module]:7.1f} ms{'  SLOW' if import_times[module] > max_import_ms else ''}")
+    return import_times
+
 if __name__ == "__main__":
+    # _test_frame_template()
+    # _test_build_frame_struct()
+    # _benchmark_create_frames()
+    # _benchmark_import_time()
+    from scapy.all import Ether
+
     packet = create_dhcp_discover_packet(1)
     print(packet.summary())
     frame_bytes = bytes(packet).hex()
@@ -6,7 +6,7 @@ logging.basicConfig(
                     format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',                       
                     level=logging.INFO,
                     datefmt='%H:%M:%S')
-import xml.dom.minidom
+import xml.etree.ElementTree as ElementTree
 
 # Module Exception class 
 class ErrorConf(Exception):
@@ -15,58 +15,43 @@ class ErrorConf(Exception):
     """
     pass
 
+# In memory XML is fed to the parser in slices of this size, so that parsing can stop early
+FEED_SIZE = 65536
+
 # *************************************
 # INTERNAL MODULE FUNCTIONS
 # *************************************
 
-def _get_node_text_value (node):
+def _local_name (tag) :
     """
-    Parse xml minidom element for text value
-    Input  : node - xml minidom element
-    Output : String - Node's text 
+    Return the tag name without its namespace. For example "{http://compass-eos.com/ns/compass_yang}x-eth" -> "x-eth"
     """
-    rv = None       
-    child_node = node.childNodes
+    return tag.rpartition('}')[2]
 
-    # Assumptions verify
-    if   len(child_node) != 1 :
-        raise ErrorConf("Error in number of child node. found " + str(len(child_node)) + " instances")
-    elif child_node[0].nodeType != child_node[0].TEXT_NODE :
-        raise ErrorConf("Error in child node.type. Expecting text type, got instead " + str(child_node[0].nodeType) + " type")
-    
-    rv = child_node[0].data 
-
-    return rv
- 
-def _get_node_tag_value (node):
+def _get_node_text_value (node):
     """
-    Parse xml minidom element for node tag value
-    Input  : node - xml minidom element
-    Output : String - Node's tag 
+    Parse xml element for text value
+    Input  : node - xml element
+    Output : String - Node's text 
     """
-    rv = None       
-    child_node = node.childNodes
-
     # Assumptions verify
-    if   len(child_node) != 1 :
-        raise ErrorConf("Error in number of child node. found " + str(len(child_node)) + " instances")
-    elif child_node[0].nodeType != child_node[0].TEXT_NODE :
-        raise ErrorConf("Error in child node.type. Expecting text type, got instead " + str(child_node[0].nodeType) + " type")
-    
-    rv = child_node[0].data 
-
-    return rv
+    if   len(node) != 0 :
+        raise ErrorConf("Error in child node.type. Expecting text type, got instead " + str(len(node)) + " element nodes")
+    elif node.text == None :
+        raise ErrorConf("Error in number of child node. found 0 instances")
 
-def _get_unique_node (xml_tree_dom, tag_name) :
+    return node.text
+ 
+def _get_unique_node (xml_node, tag_name) :
     """
-    Get a node that appears only once in the xml_tree_dom object
-    Input  : xml_tree_dom
-             tag_name - Tag name to search inside the xml_tree_dom xml.minidom object
-    Output : xml minidom element if exits single tag_name node, otherwise None 
+    Get a node that appears only once under xml_node
+    Input  : xml_node - xml element
+             tag_name - Tag name to search under xml_node
+    Output : xml element if exits single tag_name node, otherwise None 
     """
     rv = None
 
-    instance_nodes = xml_tree_dom.getElementsByTagName(tag_name)
+    instance_nodes = [node for node in xml_node.iter() if node is not xml_node and _local_name(node.tag) == tag_name]
     if len(instance_nodes) != 1 :
         logging.error("Searched for unique xml tag " + tag_name + ", found instead " + str(len(instance_nodes)) + " instances")
     else :
@@ -74,6 +59,59 @@ def _get_unique_node (xml_tree_dom, tag_name) :
 
     return rv
 
+def _iter_data (xml_source) :
+    """
+    Generator of the data pieces to feed to the parser.
+    Input : xml_source - XML bytes or String, or an iterable of bytes chunks as they arrive (such as MyNetconf.recv_msg_chunks())
+    """
+    if isinstance(xml_source, (bytes, bytearray, str)) :
+        for offset in range(0, len(xml_source), FEED_SIZE) :
+            yield xml_source[offset:offset + FEED_SIZE]
+    else :
+        yield from xml_source
+
+def _iter_elements (xml_source, tag_name) :
+    """
+    Incremental, iterparse style, extraction of the tag_name elements from an XML stream.
+    Only the subtrees of tag_name elements are kept. Any other element is dropped as soon as it ends,
+    so the document tree is never built. Parsing goes on only as long as the caller asks for the next element.
+    Input : xml_source - See _iter_data()
+            tag_name - Tag name, without namespace
+    Return value : Generator of the tag_name elements, each with its full subtree, in document order
+    """
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    # Open elements, from the root down
+    stack = []
+    # Depth inside a tag_name element, 0 when outside of one
+    match_depth = 0
+
+    try :
+        for data in _iter_data(xml_source) :
+            parser.feed(data)
+            for event, elem in parser.read_events() :
+                if event == "start" :
+                    stack.append(elem)
+                    if match_depth > 0 or _local_name(elem.tag) == tag_name :
+                        match_depth += 1
+                    continue
+
+                stack.pop()
+                if match_depth > 0 :
+                    match_depth -= 1
+                    if match_depth > 0 :
+                        # Inside a tag_name subtree - keep it
+                        continue
+                    yield elem
+                # Drop the element that ended from its parent
+                if len(stack) > 0 :
+                    stack[-1].remove(elem)
+    finally :
+        # Stopped early or done. Either way, the rest of xml_source is not parsed.
+        # Closing an iterable source (such as a message chunks generator) lets it skip its remaining data.
+        close = getattr(xml_source, "close", None)
+        if close != None :
+            close()
+
 # *************************************
 # EXTERNAL MODULE FUNCTIONS
 # *************************************
@@ -81,49 +119,45 @@ def _get_unique_node (xml_tree_dom, tag_name) :
 def get_instance_by_string (xml_tree, filter_name, instance_string_name) :
     """
     Find instance_string_name by parsing XML received xml_tree from DUT, according to the xml_path.
-    Input : xml_tree - XML string 
+    Parsing stops as soon as the instance is found.
+    Input : xml_tree - XML string, or an iterable of XML bytes chunks (see _iter_data())
             filter_name - tag name to filter xml tree.
             instance_string_name -  
-    Return value : xml node of required instance_string_name under the given xml_path
+    Return value : xml element of required instance_string_name under the given xml_path
     """
-    
-    dom = xml.dom.minidom.parseString(xml_tree)
-
     ret_node = None
 
-    instance_list = dom.getElementsByTagName(filter_name)
-
-    for dom_elem in instance_list :
-        instance_node = _get_unique_node(dom_elem, "instance")
+    elements = _iter_elements(xml_tree, filter_name)
+    for elem in elements :
+        instance_node = _get_unique_node(elem, "instance")
         node_text = _get_node_text_value(instance_node)
         
         if node_text == instance_string_name :
-            ret_node = dom_elem
+            ret_node = elem
             break
+    elements.close()
 
     return ret_node
 
 def get_instance_by_tag (xml_tree, filter_name, instance_tag) :
     """
     Find instance_tag by parsing XML received xml_tree from DUT, according to the xml_path.
-    Input : xml_tree - XML string 
+    Parsing stops as soon as the instance is found.
+    Input : xml_tree - XML string, or an iterable of XML bytes chunks (see _iter_data())
             filter_name - tag name to filter xml tree.
             instance_tag -  
-    Return value : xml node of required instance_tag under the given xml_path
+    Return value : instance_tag if found under filter_name, None otherwise
     """
-    
-    dom = xml.dom.minidom.parseString(xml_tree)
-
     ret_node = None
 
-    instance_list = dom.getElementsByTagName(filter_name)
-
-    for dom_elem in instance_list :
-        instance_node = _get_unique_node(dom_elem, instance_tag)
+    elements = _iter_elements(xml_tree, filter_name)
+    for elem in elements :
+        instance_node = _get_unique_node(elem, instance_tag)
         
-        if instance_node != None and instance_node.tagName == instance_tag :
+        if instance_node != None and _local_name(instance_node.tag) == instance_tag :
             ret_node = instance_tag
             break
+    elements.close()
 
     return ret_node
 
@@ -131,7 +165,7 @@ def get_instance_by_tag (xml_tree, filter_name, instance_tag) :
 def get_instance_text_attribute (instance_node, xml_path_list) :
     """
     Get an attribute of an object.
-    Input : instance_node - xml.minidom.elem object of the required object, found by function _get_unique_node().
+    Input : instance_node - xml element of the required object, found by function get_instance_by_string().
             xml_path_list - String list of xml tag names for reaching the required attribute.
                             For example : xml_path_list = ["policy", "acl", "in"] parameter for the following xml tree will 
                                           return the string value "pol_ipv4" :
@@ -148,17 +182,14 @@ def get_instance_text_attribute (instance_node, xml_path_list) :
     """
 
     attr = None
-    curr_node = _get_unique_node(instance_node, xml_path_list[0])
-
-    # Edge case - Only one tag name in xml_path_list
-    if len(xml_path_list) == 1 :
-        attr = _get_node_text_value(curr_node)
+    if instance_node == None :
         return attr
 
-    for tag_name in xml_path_list[1:] :
+    curr_node = instance_node
+    for tag_name in xml_path_list :
+        curr_node = _get_unique_node(curr_node, tag_name)
         if curr_node == None :
             break
-        curr_node = _get_unique_node(curr_node, tag_name)
 
     if curr_node != None :
         attr = _get_node_text_value(curr_node)
@@ -168,7 +199,7 @@ def get_instance_text_attribute (instance_node, xml_path_list) :
 def get_text_attribute (xml_tree, unique_tag_name) :
     """
     Same as get_instance_text_attribute, but without an instance.
-    Input : xml_tree - XML string 
+    Input : xml_tree - XML string, or an iterable of XML bytes chunks (see _iter_data())
             For example, finding the attribute value of ctrl-plane egress :
             <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">
                 <data>
@@ -185,16 +216,247 @@ def get_text_attribute (xml_tree, unique_tag_name) :
     """
     attr = None 
 
-    dom = xml.dom.minidom.parseString(xml_tree)
-    curr_node = _get_unique_node(dom, unique_tag_name)
-    if curr_node != None :
-        attr = _get_node_text_value(curr_node)
+    # The whole tree is scanned, to verify that the tag is unique
+    nodes = list(_iter_elements(xml_tree, unique_tag_name))
+    if len(nodes) != 1 :
+        logging.error("Searched for unique xml tag " + unique_tag_name + ", found instead " + str(len(nodes)) + " instances")
+    else :
+        attr = _get_node_text_value(nodes[0])
     
     return attr
 
+def get_text_attribute_list (xml_tree, tag_name) :
+    """
+    Get the text values of all the tag_name nodes.
+    Input : xml_tree - XML string, or an iterable of XML bytes chunks (see _iter_data())
+            tag_name - Tag name to search. For example, "capability" in the Netconf hello message :
+            <hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                <capabilities>
+                    <capability>urn:ietf:params:netconf:base:1.0</capability>
+                    <capability>urn:ietf:params:netconf:base:1.1</capability>
+                </capabilities>
+            </hello>
+    Return value : List of Strings, stripped of surrounding white space
+    """
+    return [_get_node_text_value(node).strip() for node in _iter_elements(xml_tree, tag_name)]
+
+def get_top_level_tag_names (xml_fragment) :
+    """
+    Get the tag names of the top level elements of an XML fragment, such as the content of an edit-config <config>
+    Input : xml_fragment - XML String, may hold several top level elements
+    Return value : List of tag names, without namespace. For example ["interface", "policy"]
+    """
+    root = ElementTree.fromstring(f"<config>{xml_fragment}</config>")
+    return [_local_name(child.tag) for child in root]
+
+def get_notification_event (xml_msg) :
+    """
+    Parse a Netconf notification (RFC 5277) :
+        <notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">
+            <eventTime>2021-06-01T10:00:00Z</eventTime>
+            <netconf-config-change>...</netconf-config-change>
+        </notification>
+    Input : xml_msg - XML bytes or String of a received message
+    Return value : (eventTime String, xml element of the event) if xml_msg is a notification, None otherwise
+    """
+    root = ElementTree.fromstring(xml_msg)
+    if _local_name(root.tag) != "notification" :
+        return None
+
+    event_time = None
+    event_element = None
+    for child in root :
+        if _local_name(child.tag) == "eventTime" :
+            event_time = (child.text or "").strip()
+        elif event_element == None :
+            event_element = child
+    if event_element == None :
+        raise ErrorConf("Notification without event element")
+    return (event_time, event_element)
+
+class ParsedReply(object):
+    """
+    A reply parsed once, with dict indexes for repeated queries :
+        Configuration path -> nodes. Paths start below <data> of an rpc-reply, 
+                             for example ("interface", "x-eth", "instance")
+        Tag name -> nodes
+        Instance key -> instance node. For example ("x-eth", "0/0/5") for the x-eth node with <instance>0/0/5</instance>
+        Instance key + path inside the instance -> nodes. For example ("x-eth", "0/0/5", ("policy", "acl", "in"))
+    After construction, every query is a dict lookup, regardless of the reply size.
+    """
+    def __init__(self, xml_tree):
+        """
+        Input : xml_tree - XML string
+        """
+        self.path_index = {}
+        self.tag_index = {}
+        self.instance_index = {}
+        self.instance_path_index = {}
+
+        root = ElementTree.fromstring(xml_tree)
+        self.root = root
+        config_root = root
+        if _local_name(root.tag) == "rpc-reply" :
+            for child in root :
+                if _local_name(child.tag) == "data" :
+                    config_root = child
+                    break
+        self._build_index(config_root)
+
+    def _build_index(self, config_root):
+        """
+        Single walk over the tree, filling all the indexes
+        """
+        for child in self.root.iter() :
+            self.tag_index.setdefault(_local_name(child.tag), []).append(child)
+
+        # (node, path from config root, enclosing instances as (tag name, instance value, path length))
+        stack = [(child, (), ()) for child in reversed(list(config_root))]
+        while len(stack) > 0 :
+            node, parent_path, instances = stack.pop()
+            tag_name = _local_name(node.tag)
+            path = parent_path + (tag_name,)
+            self.path_index.setdefault(path, []).append(node)
+            for instance_tag_name, instance_value, base_len in instances :
+                key = (instance_tag_name, instance_value, path[base_len:])
+                self.instance_path_index.setdefault(key, []).append(node)
+
+            for child in node :
+                if _local_name(child.tag) == "instance" and len(child) == 0 and child.text != None :
+                    self.instance_index.setdefault((tag_name, child.text), node)
+                    instances = instances + ((tag_name, child.text, len(path)),)
+                    break
+
+            for child in reversed(list(node)) :
+                stack.append((child, path, instances))
+
+    def get_nodes(self, xml_path_list):
+        """
+        Input : xml_path_list - Configuration path, for example ["ctrl-plane", "policy", "acl", "egress"]
+        Return value : List of the nodes on that path
+        """
+        return self.path_index.get(tuple(xml_path_list), [])
+
+    def get_instance(self, filter_name, instance_string_name):
+        """
+        Same as get_instance_by_string()
+        Return value : xml element of the instance, None if not found
+        """
+        return self.instance_index.get((filter_name, instance_string_name))
+
+    def get_instance_text_attribute(self, filter_name, instance_string_name, xml_path_list):
+        """
+        Same as get_instance_text_attribute() on the instance found by get_instance_by_string().
+        Input : xml_path_list - Path of tag names inside the instance, for example ["policy", "acl", "in"]
+        Return value : String with the required attrbiute, None othewise.
+        """
+        key = (filter_name, instance_string_name, tuple(xml_path_list))
+        return self._get_unique_text(self.instance_path_index.get(key, []), "/".join(xml_path_list))
+
+    def get_text_attribute(self, unique_tag_name):
+        """
+        Same as get_text_attribute()
+        """
+        return self._get_unique_text(self.tag_index.get(unique_tag_name, []), unique_tag_name)
+
+    def get_path_text_attribute(self, xml_path_list):
+        """
+        Text of the single node on configuration path xml_path_list, None otherwise
+        """
+        return self._get_unique_text(self.get_nodes(xml_path_list), "/".join(xml_path_list))
+
+    def _get_unique_text(self, nodes, name):
+        if len(nodes) != 1 :
+            logging.error("Searched for unique xml tag " + name + ", found instead " + str(len(nodes)) + " instances")
+            return None
+        return _get_node_text_value(nodes[0])
+
 # ===================================
 # UT
 # ===================================
+def create_x_eth_config_reply (num_of_interfaces) :
+    """
+    Create a get-config reply for the interface subtree, the way a fully configured router returns it.
+    Used for benchmarking the Netconf receive and parse paths.
+    Input : num_of_interfaces - Number of x-eth instances in the reply
+    Return value : XML bytes, without Netconf framing
+    """
+    x_eth_list = []
+    for index in range(num_of_interfaces) :
+        x_eth_list.append(f"""
+                <x-eth>
+                    <instance>0/{index // 1024}/{index % 1024}</instance>
+                    <speed>10000</speed>
+                    <admin-state>up</admin-state>
+                    <ipv4-address>10.{index // 256 % 256}.{index % 256}.1/24</ipv4-address>
+                    <policy>
+                        <acl>
+                            <in>pol_ipv4_{index}</in>
+                        </acl>
+                    </policy>
+                </x-eth>""")
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+    <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">
+        <data>
+            <interface xmlns="http://compass-eos.com/ns/compass_yang">{''.join(x_eth_list)}
+            </interface>
+        </data>
+    </rpc-reply>""".encode()
+
+def _legacy_get_instance_text_attribute (xml_tree, filter_name, instance_string_name, xml_path_list) :
+    """
+    The minidom based lookup that was used before _iter_elements(), kept for benchmarking only
+    """
+    import xml.dom.minidom
+
+    dom = xml.dom.minidom.parseString(xml_tree)
+    for dom_elem in dom.getElementsByTagName(filter_name) :
+        if dom_elem.getElementsByTagName("instance")[0].childNodes[0].data == instance_string_name :
+            curr_node = dom_elem
+            for tag_name in xml_path_list :
+                curr_node = curr_node.getElementsByTagName(tag_name)[0]
+            return curr_node.childNodes[0].data
+    return None
+
+def _benchmark_parse (num_of_interfaces=10000) :
+    """
+    Compare the minidom lookup with the streaming lookup, on a num_of_interfaces x-eth configuration,
+    for an instance at the beginning, middle and end of the reply
+    """
+    import gc
+    import time
+    import tracemalloc
+
+    xml_tree = create_x_eth_config_reply(num_of_interfaces)
+    logging.info(f"Reply of {num_of_interfaces} interfaces, {len(xml_tree) / 1e6:.1f} MB")
+
+    def _measure (lookup) :
+        # Timing run, then a separate run for the peak memory, since tracemalloc slows down the parsing
+        gc.collect()
+        start = time.perf_counter()
+        attr = lookup()
+        run_time = time.perf_counter() - start
+        tracemalloc.start()
+        lookup()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return attr, run_time, peak
+
+    for index in [0, num_of_interfaces // 2, num_of_interfaces - 1] :
+        instance = f"0/{index // 1024}/{index % 1024}"
+        expected = f"pol_ipv4_{index}"
+
+        attr, legacy_time, legacy_peak = _measure(lambda : _legacy_get_instance_text_attribute(xml_tree, "x-eth", instance, ["policy", "acl", "in"]))
+        assert attr == expected
+
+        attr, stream_time, stream_peak = _measure(lambda : get_instance_text_attribute(get_instance_by_string(xml_tree, "x-eth", instance), 
+                                                                                      ["policy", "acl", "in"]))
+        assert attr == expected
+
+        logging.info(f"Instance {instance}: minidom {legacy_time * 1000:.0f} ms, peak {legacy_peak / 1e6:.1f} MB. " +
+                     f"Streaming {stream_time * 1000:.0f} ms, peak {stream_peak / 1e6:.1f} MB")
+
 if __name__ == "__main__" :
 
     xml_conf_policy_acl_resp = """<?xml version="1.0" ?>
@@ -311,4 +573,18 @@ if __name__ == "__main__" :
     # Getting acl ctrl-plane egress
     ctrl_plane_val = get_text_attribute(xml_conf_ctrl_plane_resp, 'egress')
 
+    # Parsed reply, queried repeatedly
+    parsed_reply = ParsedReply(xml_conf_resp)
+    assert parsed_reply.get_instance_text_attribute("x-eth", "0/0/1", ["policy", "acl", "in"]) == "pol_ipv4"
+    assert parsed_reply.get_instance_text_attribute("x-eth", "0/0/0", ["policy", "acl", "in"]) == None
+    assert parsed_reply.get_instance_text_attribute("x-eth", "0/0/2", ["speed"]) == "10000"
+    assert get_instance_text_attribute(parsed_reply.get_instance("x-eth", "0/0/0"), ["admin-state"]) == "up"
+    assert len(parsed_reply.get_nodes(["interface", "x-eth"])) == 3
+    parsed_reply = ParsedReply(xml_conf_ctrl_plane_resp)
+    assert parsed_reply.get_path_text_attribute(["ctrl-plane", "policy", "acl", "egress"]) == "my"
+    assert parsed_reply.get_text_attribute("egress") == ctrl_plane_val
+    assert parsed_reply.get_text_attribute("nni-ingress") == None
+
+    # _benchmark_parse()
+
     logging.info("finish")
\ No newline at end of file
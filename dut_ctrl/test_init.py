@@ -7,7 +7,6 @@ logging.basicConfig(
                     format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',                       
                     level=logging.INFO,
                     datefmt='%H:%M:%S')
-import paramiko
 from fixtures import run_local_shell_cmd,               \
                      wait_for_onl_after_reboot,         \
                      copy_files_from_local_to_dut,      \
@@ -252,7 +251,7 @@ def test_init_TC02_verify_dut_up() :
 # ***************************************************************************************
 # Test Case #03 - 
 # ***************************************************************************************
-def test_init_TC03_update_build_mode(ssh_client__no_cpm_conn_reset: paramiko.SSHClient) :
+def test_init_TC03_update_build_mode(ssh_client__no_cpm_conn_reset: "paramiko.SSHClient") :
     """
     Update build mode from LAB to DEVELOPER. The reason is that in non-DEVELOPER mode, the screen for the bcmrm process is not created, and this disables
         the ability to connect ot the bcm diag shell and send the "Tx" commands that simulate packet ingress 
@@ -3,7 +3,7 @@ Pytest runner code
 """
 import pytest
 
-from fixtures import ssh_client, netconf_client, run_remote_shell_cmd, copy_files_from_local_to_dut
+from fixtures import ssh_client, netconf_client, run_remote_shell_cmd, copy_files_from_local_to_dut, bcm_diag_channel
 
 import logging
 from common_enums import InterfaceOp, AclCtrlPlaneType, FrameType, InterfaceType
@@ -27,33 +27,31 @@ def _remote_exists(sftp, path):
     except IOError:
         return False
 
-def _inject_frame_and_verify_counter(ssh_client, 
+def _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx, 
                                      frame_type,
                                      interface_type,
-                                     workdir, 
                                      physical_port_num,
                                      policy_name,
                                      rule_name) :
     """
     Inject a frame into BCM, and verify that the counter advanced accordingly :
         1. Create packet
-        2. Read ACL counter value 
+        2. Read all the ACL counters of the interface
            (Using CLI)
         3. Inject packet into bcm's port that will trigger a rule in ACL policy 
-           (Using BCM Diagnostic shell "TX" command)
-        4. Read ACL counter value again, and assert that it incremented by exactly the value of packets injected 
-           (Using CLI)
+           (Using BCM Diagnostic shell "TX" command, waiting for it to complete)
+        4. Read the ACL counters again, and assert that the rule counter incremented by exactly the value of packets injected 
+           (Using CLI, one read for the deltas of all the rules)
 
-        Input : ssh_client      - 
+        Input : bcm_diag_channel - BcmDiagChannel
                 cli_client      - 
                 src_ip, dst_ip, dst_mac - 
                 num_of_tx       - 
                 frame_type  - Enumeration for different frames to be transmitted. L2_L3 or ICMP frames
                 interface_type - Enumeration InterfaceType, values "CTRL_PLANE", "X_ETH"
-                workdir - 
                 physical_port_num - 
                 policy_name - 
                 rule_name - 
@@ -76,35 +74,36 @@ def _inject_frame_and_verify_counter(ssh_client,
     else :
         raise Exception (f"{get_time()} Unrecognized frame type {frame_type}")
 
-    # 2. Read the ACL counter value
-    counter_prev = int(cli_control.get_show_counter(cli_client, physical_port_num, interface_type, policy_name, rule_name))
+    # 2. Read the ACL counters
+    counters_prev = cli_control.get_acl_counter_snapshot(cli_client, interface_type, physical_port_num)
+    counter_key = cli_control.find_acl_counter_key(counters_prev, policy_name, rule_name)
+    if counter_key == None :
+        raise Exception(f"{get_time()} No counter of policy {policy_name} rule {rule_name}. Counters: {counters_prev}")
                                                                                         
-    # 3. Inject frame into BCM - Run remote command in DUT
-    command = f"cd {workdir};python tx_into_bcm.py {frame} {num_of_tx} {bcm_port_num}"
-    rv, output_str = run_remote_shell_cmd (ssh_client, command)
-
-    if rv != 0 :
-        raise Exception(f"{get_time()} Failed with rv: {rv}, output: {output_str}, when running remote command \"{command}\"")
+    # 3. Inject frame into BCM - Through the persistent diag shell channel, returns once the Tx completed
+    tx_seconds = bcm_diag_channel.tx(frame, num_of_tx, bcm_port_num)
+    logging.info(f"{get_time()} Tx of {num_of_tx} frames completed in {tx_seconds:.3f} seconds")
         
-    # 4. Reading updated ACL counter
-    counter_curr = int(cli_control.get_show_counter(cli_client, physical_port_num, interface_type, policy_name, rule_name))
-
+    # 4. Reading updated ACL counters
+    deltas = cli_control.get_acl_counter_deltas(cli_client, interface_type, physical_port_num, counters_prev)
 
     # Verify counter incremented correctly
-    delta_counter = counter_curr - counter_prev
+    counter_prev = counters_prev[counter_key]
+    delta_counter = deltas.get(counter_key)
     num_of_tx = int(num_of_tx)
-    logging.info(f"{get_time()} Previous counter: {counter_prev}, Curr counter: {counter_curr}, delta : {delta_counter}, expected delta: {num_of_tx}")
+    logging.info(f"{get_time()} Previous counter: {counter_prev}, delta : {delta_counter}, expected delta: {num_of_tx}. All deltas: {deltas}")
     
     assert  (delta_counter == num_of_tx), \
-             f"{get_time()} Error: Previous counter: {counter_prev}, Curr counter: {counter_curr}"
+             f"{get_time()} Error: Previous counter: {counter_prev}, delta: {delta_counter}, all deltas: {deltas}"
 
-def _acl_in_policy_Operation_on_interface (netconf_client, physical_port_num, acl_policy_name, interface_op) :
+def _acl_in_policy_Operation_on_interface (netconf_client, physical_port_num, acl_policy_name, interface_op, transaction = None) :
     """
     Perform attach / detach operation of an ACL ingress policy on interface physical_port_num.
     Input:  netconf_client
             physical_port_num - Integer
             acl_policy_name - String
             interface_op - Enumeration of type InterfaceOp. Activating either attach or detach from interface.
+            transaction - netconf_comm.NetconfTransaction. If given, the operation is added to it instead of committed.
     Return : True on success, False otherwise
     """
     import netconf_comm
@@ -115,20 +114,21 @@ def _acl_in_policy_Operation_on_interface (netconf_client, physical_port_num, ac
     logging.info(f"{get_time()} Operation: {interface_op.name} for policy name:{acl_policy_name} on port {x_eth_name}")
 
     if interface_op is InterfaceOp.ATTACH :
-        rv = netconf_comm.cmd_set_attach_policy_acl_in_x_eth(netconf_client, x_eth_name, acl_policy_name, operation="")
+        rv = netconf_comm.cmd_set_attach_policy_acl_in_x_eth(netconf_client, x_eth_name, acl_policy_name, operation="", transaction=transaction)
     elif interface_op is InterfaceOp.DETACH :
-        rv = netconf_comm.cmd_set_attach_policy_acl_in_x_eth(netconf_client, x_eth_name, acl_policy_name, operation="operation=\"delete\"")
+        rv = netconf_comm.cmd_set_attach_policy_acl_in_x_eth(netconf_client, x_eth_name, acl_policy_name, operation="operation=\"delete\"", transaction=transaction)
     else :
         raise Exception(f"{get_time()} Received unfamiliar operation {interface_op}")
     return rv
 
-def _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_policy_name, interface_op) :
+def _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_policy_name, interface_op, transaction = None) :
     """
     Perform attach / detach operation of an ACL policy on acl ctrl-plane.
     Input:  netconf_client
             ctrl_plane_type - String. Possible values: EGRESS or NNI_INGRESS
             acl_policy_name - String
             interface_op    - Enumeration of type InterfaceOp. Activating either attach or detach from interface.    
+            transaction     - netconf_comm.NetconfTransaction. If given, the operation is added to it instead of committed.
     Return : True on success, False otherwise
     """
     import netconf_comm
@@ -141,12 +141,14 @@ def _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_polic
         rv = netconf_comm.cmd_set_ctrl_plane_acl(dut_conn            = netconf_client, 
                                                  acl_ctrl_plane_type = ctrl_plane_type, 
                                                  operation           = "", 
-                                                 attribute_value     = acl_policy_name)
+                                                 attribute_value     = acl_policy_name,
+                                                 transaction         = transaction)
     elif interface_op is InterfaceOp.DETACH :
         rv = netconf_comm.cmd_set_ctrl_plane_acl(dut_conn            = netconf_client, 
                                                  acl_ctrl_plane_type = ctrl_plane_type, 
                                                  operation           = " operation=\"delete\"", 
-                                                 attribute_value     = acl_policy_name)
+                                                 attribute_value     = acl_policy_name,
+                                                 transaction         = transaction)
     else :
         raise Exception(f"{get_time()} Received unfamiliar operation: {interface_op.name}")
     return rv
@@ -155,7 +157,7 @@ def _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_polic
 # ***************************************************************************************
 # Fixtures functions
 # ***************************************************************************************
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="module")
 def cli_client():
     """
     Connect to DUT using pyexpect
@@ -171,9 +173,10 @@ def cli_client():
     constants.read('config.ini')
     DUT_NUMBER = constants['GENERAL']['DUT_NUM']
 
-    cli_comm = cli_control.open_cpm_session(DUT_NUMBER)
-    yield cli_comm
-    cli_control.close_cpm_session(cli_comm)
+    # Leased from the CLI session pool, which keeps it open for the next test modules. It is checked when returned,
+    # and closed if it does not respond.
+    with cli_control.lease_cpm_session(DUT_NUMBER) as cli_comm :
+        yield cli_comm
 
 # ***************************************************************************************
 # Test Case #0 - Setup Environment
@@ -183,8 +186,9 @@ def test_TC00_Setup_Environment(ssh_client, netconf_client):
     Setup configuration of policy :
         1. Read global variables from config.ini file
         2. If interface physical_port_num contains acl ingress policy, delete it
-        2. Create a new ACL policy named acl_policy_name (delete old one, create new one)
+        2. Create a new ACL policy named acl_policy_name (replace old one, if exists)
         3. Attach new policy to interface physical_port_num
+    All the configuration changes are sent in a single transaction, with a single commit.
     """
     import configparser
     import netconf_comm
@@ -212,7 +216,7 @@ def test_TC00_Setup_Environment(ssh_client, netconf_client):
         sftp.mkdir(workdir)
 
     logging.info(f"{get_time()} Copy files to remote")
-    copy_files_from_local_to_dut(dut_num, copy_file_list, workdir)
+    copy_files_from_local_to_dut(dut_num, copy_file_list, workdir, ssh_client)
 
     # Read globals from ini file
     # ----------------------------------------------------------
@@ -221,39 +225,37 @@ def test_TC00_Setup_Environment(ssh_client, netconf_client):
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
     canary_acl_policy_name__r1_permit_default_deny  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_PERMIT_DEFAULT_DENY']
 
+    transaction = netconf_comm.NetconfTransaction(netconf_client)
+
     # If there is an acl ingress policy attached to interface, delete it 
     # -------------------------------------------------------------------        
     x_eth_name         = "0/0/" + physical_port_num 
     acl_policy_name    = netconf_comm.cmd_get_policy_acl_in_name(netconf_client, x_eth_name)
     if acl_policy_name != None :
-        _acl_in_policy_Operation_on_interface (netconf_client, physical_port_num, acl_policy_name, InterfaceOp.DETACH) 
+        _acl_in_policy_Operation_on_interface (netconf_client, physical_port_num, acl_policy_name, InterfaceOp.DETACH, transaction) 
 
-    # If there is an acl egress ctrl-plane configured, delete it 
+    # If there is an acl egress / nni_ingress ctrl-plane configured, delete it 
+    # (Both read from a single ctrl-plane configuration reply)
     # ---------------------------------------------------------------        
-    ctrl_plane_type = AclCtrlPlaneType.EGRESS.name.lower()
-    acl_ctrl_plane_egress_policy_name = netconf_comm.cmd_get_ctrl_plane_acl_name(netconf_client, ctrl_plane_type)
-    if acl_ctrl_plane_egress_policy_name != None :
-        _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_ctrl_plane_egress_policy_name, InterfaceOp.DETACH) 
-
-    # If there is an acl nni_ingress ctrl-plane configured, delete it 
-    # ---------------------------------------------------------------        
-    ctrl_plane_type = AclCtrlPlaneType.NNI_INGRESS.name.lower().replace('_', '-')       # Replace function is due to EM-3647
-    acl_ctrl_plane_nni_ingress_policy_name = netconf_comm.cmd_get_ctrl_plane_acl_name(netconf_client, ctrl_plane_type)
-    if acl_ctrl_plane_nni_ingress_policy_name != None :
-        _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_ctrl_plane_nni_ingress_policy_name, InterfaceOp.DETACH) 
+    ctrl_plane_types = [AclCtrlPlaneType.EGRESS.name.lower(),
+                        AclCtrlPlaneType.NNI_INGRESS.name.lower().replace('_', '-')]      # Replace function is due to EM-3647
+    acl_ctrl_plane_policy_names = netconf_comm.cmd_get_ctrl_plane_acl_names(netconf_client, ctrl_plane_types)
+    for ctrl_plane_type in ctrl_plane_types :
+        if acl_ctrl_plane_policy_names[ctrl_plane_type] != None :
+            _acl_ctrl_plane_policy_Operation (netconf_client, ctrl_plane_type, acl_ctrl_plane_policy_names[ctrl_plane_type], InterfaceOp.DETACH, transaction) 
 
     # Create acl policies canary_acl_policy_name__r1_deny_default_permit, canary_acl_policy_name__r1_permit_default_deny
     # ---------------------------------------------------------------------------------------------------------------------    
-    # Delete operation. may return False, if the object did not exist in the first place
-    netconf_comm.cmd_set_acl_policy__r1_deny_default_permit__src_ip(netconf_client, canary_acl_policy_name__r1_deny_default_permit, physical_port_ip, operation = "operation=\"delete\"")
-    netconf_comm.cmd_set_acl_policy__r1_permit_default_deny__src_ip(netconf_client, canary_acl_policy_name__r1_permit_default_deny, physical_port_ip, operation = "operation=\"delete\"")    
-    # Create operation should always succeed.
-    rv = netconf_comm.cmd_set_acl_policy__r1_deny_default_permit__src_ip(netconf_client, canary_acl_policy_name__r1_deny_default_permit, physical_port_ip, operation = "")
-    if rv == False :
-        raise Exception ("Failed committing cmd_set_acl_policy__r1_deny_default_permit__src_ip")
-    rv = netconf_comm.cmd_set_acl_policy__r1_permit_default_deny__src_ip(netconf_client, canary_acl_policy_name__r1_permit_default_deny, physical_port_ip, operation = "")
+    # Replace operation creates the policy, or overrides an old policy with the same name, so no separate delete is needed
+    netconf_comm.cmd_set_acl_policy__r1_deny_default_permit__src_ip(netconf_client, canary_acl_policy_name__r1_deny_default_permit, physical_port_ip, 
+                                                                    operation = "operation=\"replace\"", transaction = transaction)
+    netconf_comm.cmd_set_acl_policy__r1_permit_default_deny__src_ip(netconf_client, canary_acl_policy_name__r1_permit_default_deny, physical_port_ip, 
+                                                                    operation = "operation=\"replace\"", transaction = transaction)
+
+    # Single validate and commit for all the changes. On failure, the candidate changes are discarded.
+    rv = transaction.commit()
     if rv == False :
-        raise Exception ("Failed committing cmd_set_acl_policy__r1_permit_default_deny__src_ip")
+        raise Exception ("Failed committing setup environment transaction")
     
     # Initial test TC00 should always succeed
     assert True
@@ -261,7 +263,7 @@ def test_TC00_Setup_Environment(ssh_client, netconf_client):
 # ***************************************************************************************
 # Test Case #1 - ACL in
 # ***************************************************************************************
-def test_TC01_rule_r1_deny_acl_in(ssh_client, netconf_client, cli_client) :
+def test_TC01_rule_r1_deny_acl_in(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test deny on acl rule R1 :
         1. Attach policy to interface
@@ -284,7 +286,6 @@ def test_TC01_rule_r1_deny_acl_in(ssh_client, netconf_client, cli_client) :
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
     rule_name = "r1"
-    workdir = constants['DUT_ENV']['WORKDIR']
     num_of_tx = '142'
 
     # Attach acl in policy to interface
@@ -295,13 +296,12 @@ def test_TC01_rule_r1_deny_acl_in(ssh_client, netconf_client, cli_client) :
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.L2_L3_FRAME,
                                      InterfaceType.X_ETH,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_deny_default_permit,
                                      rule_name)
@@ -312,7 +312,7 @@ def test_TC01_rule_r1_deny_acl_in(ssh_client, netconf_client, cli_client) :
     if rv == False :
         raise Exception (f"Failed detaching {canary_acl_policy_name__r1_deny_default_permit} from interface {physical_port_num}")
 
-def test_TC02_default_rule_permit_acl_in(ssh_client, netconf_client, cli_client) :
+def test_TC02_default_rule_permit_acl_in(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test permit on acl default rule
     """
@@ -330,7 +330,6 @@ def test_TC02_default_rule_permit_acl_in(ssh_client, netconf_client, cli_client)
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
     rule_name = "rule-default"
-    workdir = constants['DUT_ENV']['WORKDIR']
     num_of_tx = '143'
 
     # Attach acl in policy to interface
@@ -341,13 +340,12 @@ def test_TC02_default_rule_permit_acl_in(ssh_client, netconf_client, cli_client)
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.L2_L3_FRAME,
                                      InterfaceType.X_ETH,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_deny_default_permit,
                                      rule_name)
@@ -358,7 +356,7 @@ def test_TC02_default_rule_permit_acl_in(ssh_client, netconf_client, cli_client)
     if rv == False :
         raise Exception (f"Failed detaching {canary_acl_policy_name__r1_deny_default_permit} from interface {physical_port_num}")
 
-def test_TC03_acl_rule_r1_deny_ctrl_plane_egress(ssh_client, netconf_client, cli_client) :
+def test_TC03_acl_rule_r1_deny_ctrl_plane_egress(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test deny rule r1 on acl ctrl-plane egress
     """
@@ -378,7 +376,6 @@ def test_TC03_acl_rule_r1_deny_ctrl_plane_egress(ssh_client, netconf_client, cli
     dst_ip  = constants['TEST_SUITE_ACL']['DST_IP']
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
-    workdir = constants['DUT_ENV']['WORKDIR']    
     num_of_tx = '87'
 
     ctrl_plane_type = AclCtrlPlaneType.EGRESS.name.lower()
@@ -391,13 +388,12 @@ def test_TC03_acl_rule_r1_deny_ctrl_plane_egress(ssh_client, netconf_client, cli
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.ICMP_FRAME,
                                      InterfaceType.CTRL_PLANE,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_deny_default_permit,
                                      rule_name)
@@ -408,7 +404,7 @@ def test_TC03_acl_rule_r1_deny_ctrl_plane_egress(ssh_client, netconf_client, cli
     if rv == False :
         raise Exception (f"Failed detaching {canary_acl_policy_name__r1_deny_default_permit} from interface {physical_port_num}")
 
-def test_TC04_acl_rule_default_permit_ctrl_plane_egress(ssh_client, netconf_client, cli_client) :
+def test_TC04_acl_rule_default_permit_ctrl_plane_egress(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test deny rule default on acl ctrl-plane egress
     """
@@ -428,7 +424,6 @@ def test_TC04_acl_rule_default_permit_ctrl_plane_egress(ssh_client, netconf_clie
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
     rule_name = "rule-default"
-    workdir = constants['DUT_ENV']['WORKDIR']    
     num_of_tx = '75'
 
     ctrl_plane_type = AclCtrlPlaneType.EGRESS.name.lower()
@@ -441,13 +436,12 @@ def test_TC04_acl_rule_default_permit_ctrl_plane_egress(ssh_client, netconf_clie
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.ICMP_FRAME,
                                      InterfaceType.CTRL_PLANE,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_deny_default_permit,
                                      rule_name)
@@ -458,7 +452,7 @@ def test_TC04_acl_rule_default_permit_ctrl_plane_egress(ssh_client, netconf_clie
     if rv == False :
         raise Exception (f"Failed detaching {canary_acl_policy_name__r1_deny_default_permit} from interface {physical_port_num}")
 
-def test_TC05_acl_rule_default_deny_ctrl_plane_egress(ssh_client, netconf_client, cli_client) :
+def test_TC05_acl_rule_default_deny_ctrl_plane_egress(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test deny rule default on acl ctrl-plane egress. 
     Solves issue EM-2638, in develop build b532
@@ -479,7 +473,6 @@ def test_TC05_acl_rule_default_deny_ctrl_plane_egress(ssh_client, netconf_client
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_permit_default_deny  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_PERMIT_DEFAULT_DENY']
     rule_name = "rule-default"
-    workdir = constants['DUT_ENV']['WORKDIR']    
     num_of_tx = '32'
 
     ctrl_plane_type = AclCtrlPlaneType.EGRESS.name.lower()
@@ -492,13 +485,12 @@ def test_TC05_acl_rule_default_deny_ctrl_plane_egress(ssh_client, netconf_client
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.ICMP_FRAME,
                                      InterfaceType.CTRL_PLANE,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_permit_default_deny,
                                      rule_name)
@@ -510,7 +502,7 @@ def test_TC05_acl_rule_default_deny_ctrl_plane_egress(ssh_client, netconf_client
         raise Exception (f"Failed detaching {canary_acl_policy_name__r1_permit_default_deny} from interface {physical_port_num}")
 
 
-def test_TC06_acl_rule_r1_deny_ctrl_plane_nni_ingress(ssh_client, netconf_client, cli_client) :
+def test_TC06_acl_rule_r1_deny_ctrl_plane_nni_ingress(bcm_diag_channel, netconf_client, cli_client) :
     """
     Test deny rule r1 on acl ctrl-plane egress
     """
@@ -530,7 +522,6 @@ def test_TC06_acl_rule_r1_deny_ctrl_plane_nni_ingress(ssh_client, netconf_client
     dst_ip  = constants['TEST_SUITE_ACL']['DST_IP']
     dst_mac = constants['TEST_SUITE_ACL']['DST_MAC']
     canary_acl_policy_name__r1_deny_default_permit  = constants['TEST_SUITE_ACL']['ACL_POLICY_NAME_R1_DENY_DEFAULT_PERMIT']
-    workdir = constants['DUT_ENV']['WORKDIR']    
     num_of_tx = '123'
 
     ctrl_plane_type = AclCtrlPlaneType.NNI_INGRESS.name.lower().replace('_', '-')   # Replace function is due to EM-3647
@@ -543,13 +534,12 @@ def test_TC06_acl_rule_r1_deny_ctrl_plane_nni_ingress(ssh_client, netconf_client
 
     # Perform test
     # ---------------------------------------------------------------------------        
-    _inject_frame_and_verify_counter(ssh_client, 
+    _inject_frame_and_verify_counter(bcm_diag_channel, 
                                      cli_client,                                     
                                      src_ip, dst_ip, dst_mac, 
                                      num_of_tx,
                                      FrameType.ICMP_FRAME,
                                      InterfaceType.CTRL_PLANE,
-                                     workdir,
                                      physical_port_num,  
                                      canary_acl_policy_name__r1_deny_default_permit,
                                      rule_name)
@@ -6,10 +6,28 @@ Scapy :
 BCM Diag shell :
     tx 32 PSRC=4 DATA=0x00E01C3C17C2001F33D981608100000C080045B800800000400040111BB40A0000011400000103E807D0006CF527795681800001000200020000046D61696C0870617472696F747302696E0000010001C00C0005000100002A4B0002C011C0110001000100002A4C00044A358C99C011000200010001438C0006036E7332C011C011000200010001438C0006036E7331C011
 
+Usage :
+    python tx_into_bcm.py FRAME NUM_OF_TX PORT
+    python tx_into_bcm.py --batch FILE [RATE]
+        Transmit the records of FILE ("-" for stdin), a record per line : FRAME NUM_OF_TX PORT
+        Empty lines and lines starting with "#" are ignored.
+        The diag shell is attached once, and each record is started no earlier than its due time at RATE records per second.
+        A line is printed per record, once the diag prompt is back after its Tx command :
+        "ACK <record number> <seconds>", or "NACK <record number> <reason>".
+        The exit code is 0 if all the records were acknowledged.
+        See tx_batch().
+    python tx_into_bcm.py --serve
+        Attach to the diag shell once, and transmit the frames requested on stdin, waiting for each to complete.
+        See serve().
+
 """
 import logging
+import os
 from os import system
+import re
+import signal
 import sys 
+import time
 
 # Log configuration
 # ---------------------------------------------------
@@ -46,10 +64,326 @@ def tx_frame(frame, num_of_tx, port) :
         logger.info("Got exception - Exiting")
         sys.exit(1)    
 
+def _parse_batch_record(line) :
+    """
+    Input : line - "FRAME NUM_OF_TX PORT"
+    Return value : Diag shell Tx command line
+    """
+    words = line.split()
+    if len(words) != 3 :
+        raise ValueError("Expected FRAME NUM_OF_TX PORT, got " + repr(line))
+    frame, num_of_tx, port = words
+    if frame.lower().startswith("0x") :
+        frame = frame[2:]
+    int(frame, 16)
+    if int(num_of_tx) <= 0 or int(port) < 0 :
+        raise ValueError("Bad NUM_OF_TX or PORT in " + repr(line))
+    return " Tx " + num_of_tx + " PSRC=" + port + " DATA=" + frame + "\n"
+
+# Persistent diag shell
+# ---------------------------------------------------
+# Command that attaches to the diag shell. -x attaches without detaching other displays.
+DIAG_SHELL_COMMAND = ["screen", "-x", "bcmrm"]
+DIAG_PROMPT_RE = re.compile(r"BCM\.\d+>")
+DIAG_ERROR_RE = re.compile(r"(?i)\berror\b|unknown command|invalid")
+# Terminal escape sequences, removed from the diag shell output
+ESCAPE_SEQUENCE_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]|\x1b[()][A-Za-z0-9]|\x1b[=>78DEHMc]|[\r\x07\x0f\x0e]")
+DIAG_TIMEOUT = 30
+# Seconds without output, after which the diag shell is considered settled
+DIAG_QUIET_TIME = 0.5
+
+class DiagShell(object) :
+    """
+    The diag shell, attached once through a pty. Commands are typed into it, and each command waits for the
+    diag prompt that follows it.
+    Input : command - Command that attaches to the diag shell
+            timeout - Seconds to wait for the diag prompt
+    """
+    def __init__(self, command = DIAG_SHELL_COMMAND, timeout = DIAG_TIMEOUT) :
+        self.command = command
+        self.timeout = timeout
+        self.pid = None
+        self.fd = None
+
+    def open(self) :
+        """
+        Attach to the diag shell, and wait for its prompt
+        """
+        import pty
+        import fcntl
+        import struct
+        import termios
+
+        os.environ.setdefault("TERM", "vt100")
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0 :
+            try :
+                os.execvp(self.command[0], self.command)
+            finally :
+                os._exit(127)
+        # A wide terminal, so Tx command lines are not wrapped
+        fcntl.ioctl(self.fd, termios.TIOCSWINSZ, struct.pack("HHHH", 50, 1000, 0, 0))
+        logger.info("Attached to the diag shell, pid " + str(self.pid) + ": " + " ".join(self.command))
+        self.run("")
+        # Wait for the output to settle - A prompt drawn on attach would otherwise be taken as the next command's
+        while self._read(DIAG_QUIET_TIME) != "" :
+            pass
+
+    def _read(self, timeout) :
+        """
+        Return value : Output read within timeout seconds, "" if none
+        """
+        import select
+
+        readable, _, _ = select.select([self.fd], [], [], max(0, timeout))
+        if len(readable) == 0 :
+            return ""
+        try :
+            data = os.read(self.fd, 65536)
+        except OSError :
+            data = b""
+        if len(data) == 0 :
+            raise Exception("The diag shell exited")
+        return ESCAPE_SEQUENCE_RE.sub("", data.decode("latin-1"))
+
+    def run(self, command) :
+        """
+        Type a command into the diag shell, and wait for the diag prompt
+        Input : command - Diag shell command, such as "Tx 3 PSRC=24 DATA=1e94..."
+        Return value : (Seconds until the prompt, Output of the command)
+        """
+        # Drop output that is not of this command, such as other displays
+        while self._read(0) != "" :
+            pass
+
+        start = time.time()
+        data = (command + "\r").encode("latin-1")
+        while len(data) > 0 :
+            data = data[os.write(self.fd, data):]
+
+        output = ""
+        while DIAG_PROMPT_RE.search(output) == None :
+            remaining = start + self.timeout - time.time()
+            if remaining <= 0 :
+                raise Exception("Timeout of " + str(self.timeout) + " seconds waiting for the diag prompt. Output: " + repr(output[-200:]))
+            output += self._read(remaining)
+        return time.time() - start, output
+
+    def close(self) :
+        """
+        Detach from the diag shell. Hanging up the pty detaches screen, the diag shell keeps running.
+        """
+        if self.fd == None :
+            return
+        os.close(self.fd)
+        self.fd = None
+        for _ in range(50) :
+            if os.waitpid(self.pid, os.WNOHANG)[0] != 0 :
+                break
+            time.sleep(0.1)
+        else :
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        logger.info("Detached from the diag shell")
+
+def _tx_record(shell, record) :
+    """
+    Transmit a record through the diag shell, and wait for the diag prompt
+    Input : shell - Open DiagShell
+            record - "FRAME NUM_OF_TX PORT"
+    Return value : Seconds until the diag prompt was back. Raises an exception on a bad record or a diag shell error.
+    """
+    seconds, output = shell.run(_parse_batch_record(record).strip())
+    if DIAG_ERROR_RE.search(output) :
+        raise Exception("Diag shell error: " + " ".join(output.split())[-200:])
+    return seconds
+
+def serve(shell, inp = sys.stdin, out = sys.stdout) :
+    """
+    Transmit frames requested on inp, through a persistent diag shell. One request per line :
+        TX FRAME NUM_OF_TX PORT - Reply "DONE <request number> <seconds>" once the diag prompt is back,
+                                  or "FAIL <request number> <reason>"
+        QUIT
+    "READY" is written once the diag shell is attached.
+    Input : shell - DiagShell, not opened
+    Return value : 0 on QUIT or end of input, 1 if the diag shell could not be attached
+    """
+    def reply(line) :
+        out.write(line + "\n")
+        out.flush()
+
+    try :
+        shell.open()
+    except Exception as e :
+        logger.exception(e)
+        reply("FAIL 0 " + str(e))
+        return 1
+    reply("READY")
+
+    request_number = 0
+    try :
+        while True :
+            # Not "for line in inp" - Python 2 reads ahead, and would wait for more requests
+            line = inp.readline()
+            words = line.split()
+            if line == "" or words == ["QUIT"] :
+                break
+            if len(words) == 0 :
+                continue
+            request_number += 1
+            try :
+                if words[0] != "TX" :
+                    raise ValueError("Unrecognized request " + repr(line.strip()))
+                seconds = _tx_record(shell, " ".join(words[1:]))
+                reply("DONE " + str(request_number) + " " + "%.6f" % seconds)
+            except Exception as e :
+                logger.error("Request " + str(request_number) + ": " + str(e))
+                reply("FAIL " + str(request_number) + " " + " ".join(str(e).split()))
+    finally :
+        shell.close()
+    return 0
+
+_FAKE_DIAG_SHELL_SCRIPT = """
+import sys, time
+sys.stdout.write("\\x1b[1mBCM.0> \\x1b[0m")
+sys.stdout.flush()
+while True :
+    line = sys.stdin.readline()
+    if line == "" :
+        break
+    if line.startswith("Tx ") :
+        time.sleep(0.02)
+        if "PSRC=99 " in line :
+            sys.stdout.write("TX: Error: invalid port\\n")
+    sys.stdout.write("BCM.0> ")
+    sys.stdout.flush()
+"""
+
+def _test_serve() :
+    """
+    Serve requests through a stand-in diag shell
+    """
+    try :
+        from StringIO import StringIO
+    except ImportError :
+        from io import StringIO
+
+    frame = '1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000'
+    requests = ["TX " + frame + " 42 5", "", "TX " + frame + " 1 99", "RX 1 2 3", "TX " + frame + " 1 6", "QUIT", "TX " + frame + " 1 6"]
+    out = StringIO()
+    shell = DiagShell(command = [sys.executable, "-c", _FAKE_DIAG_SHELL_SCRIPT], timeout = 5)
+    assert serve(shell, StringIO("\n".join(requests) + "\n"), out) == 0
+
+    replies = out.getvalue().splitlines()
+    assert replies[0] == "READY" and len(replies) == 5
+    assert replies[1].startswith("DONE 1 ") and float(replies[1].split()[2]) >= 0.02
+    assert replies[2].startswith("FAIL 2 Diag shell error") and replies[3].startswith("FAIL 3 Unrecognized")
+    assert replies[4].startswith("DONE 4 ")
+    assert shell.fd == None
+    print("_test_serve passed. " + str(replies))
+
+# Batch mode
+# ---------------------------------------------------
+# Default maximal number of records transmitted per second
+BATCH_RATE = 200
+
+def tx_batch(lines, rate = BATCH_RATE, shell = None, out = sys.stdout) :
+    """
+    Transmit a batch of records into bcm, through one attach to the diag shell.
+    Each record is acknowledged once the diag prompt is back after its Tx command, so an ACK means the Tx ran.
+    Input: lines : Iterable of record lines, "FRAME NUM_OF_TX PORT"
+           rate : Maximal number of records per second - A record is not started before its due time
+           shell : DiagShell, not opened. None for the bcmrm diag shell.
+           out : Stream of the per record acknowledgements
+    Return value : Number of records that were not acknowledged
+    """
+    if shell == None :
+        shell = DiagShell()
+    num_of_nacks = 0
+    record_number = 0
+    attach_error = None
+    try :
+        shell.open()
+    except Exception as e :
+        logger.exception(e)
+        attach_error = "Failed attaching to the diag shell: " + " ".join(str(e).split())
+
+    start = time.time()
+    try :
+        for line in lines :
+            line = line.strip()
+            if line == "" or line.startswith("#") :
+                continue
+            record_number += 1
+            try :
+                if attach_error != None :
+                    raise Exception(attach_error)
+                delay = start + float(record_number - 1) / rate - time.time()
+                if delay > 0 :
+                    time.sleep(delay)
+                seconds = _tx_record(shell, line)
+                out.write("ACK " + str(record_number) + " " + "%.6f" % seconds + "\n")
+            except Exception as e :
+                num_of_nacks += 1
+                logger.error("Record " + str(record_number) + ": " + str(e))
+                out.write("NACK " + str(record_number) + " " + " ".join(str(e).split()) + "\n")
+            out.flush()
+    finally :
+        shell.close()
+
+    logger.info("Batch of " + str(record_number) + " records, " + str(num_of_nacks) + " not acknowledged, " + \
+                "in " + str(round(time.time() - start, 3)) + " seconds")
+    return num_of_nacks
+
+def _test_tx_batch() :
+    """
+    Batch into a stand-in diag shell - verify the acknowledgements, and the rate control
+    """
+    try :
+        from StringIO import StringIO
+    except ImportError :
+        from io import StringIO
+
+    frame = '1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000'
+    lines = ["# frame count port", frame + " 42 5", "", "0x" + frame + " 1 6", "nothex 1 5", frame + " 0 5", frame + " 1 99"]
+    lines += [frame + " 1 5"] * 20
+    out = StringIO()
+    shell = DiagShell(command = [sys.executable, "-c", _FAKE_DIAG_SHELL_SCRIPT], timeout = 5)
+    start = time.time()
+    assert tx_batch(lines, rate = 100, shell = shell, out = out) == 3
+    elapsed = time.time() - start
+
+    acks = out.getvalue().splitlines()
+    assert len(acks) == 25 and [ack.split()[1] for ack in acks] == [str(number) for number in range(1, 26)]
+    assert acks[0].startswith("ACK 1 ") and float(acks[0].split()[2]) >= 0.02 and acks[1].startswith("ACK 2 ")
+    assert acks[2].startswith("NACK 3") and acks[3].startswith("NACK 4") and acks[4].startswith("NACK 5 Diag shell error")
+    assert acks[-1].startswith("ACK 25 ")
+    # 25 records at most 100 per second - The last one is started no earlier than 0.24 seconds
+    assert elapsed >= 0.24
+    assert shell.fd == None
+
+    # The diag shell could not be attached - Every record is not acknowledged
+    out = StringIO()
+    assert tx_batch([frame + " 1 5"] * 3, shell = DiagShell(command = ["/nonexistent"], timeout = 1), out = out) == 3
+    assert [ack.split()[0] for ack in out.getvalue().splitlines()] == ["NACK"] * 3
+    print("_test_tx_batch passed. " + str(len(acks)) + " records in " + str(round(elapsed, 3)) + " seconds")
+
 if __name__ == "__main__" :
-    if len(sys.argv) == 4 :
+    if len(sys.argv) == 2 and sys.argv[1] == "--serve" :
+        sys.exit(serve(DiagShell()))
+    elif len(sys.argv) in [3, 4] and sys.argv[1] == "--batch" :
+        rate = float(sys.argv[3]) if len(sys.argv) == 4 else BATCH_RATE
+        if sys.argv[2] == "-" :
+            num_of_nacks = tx_batch(sys.stdin, rate)
+        else :
+            with open(sys.argv[2]) as batch_file :
+                num_of_nacks = tx_batch(batch_file, rate)
+        sys.exit(0 if num_of_nacks == 0 else 1)
+    elif len(sys.argv) == 4 :
         tx_frame(frame = sys.argv[1], num_of_tx = sys.argv[2], port = sys.argv[3])
     else :
+        # _test_tx_batch()
+        # _test_serve()
         # Send an example frame : "screen -r bcmrm -X   stuff   $' Tx 3 PSRC=24 DATA=0x1e94a004171a00155d6929ba08004500001400010000400066b70a1800020a180001\n'"
         logger.info("Running UT values- Sending an ICMP frame (ping)")
         frame = '1e94a004170600155dcdff0708004500001c00010000400172d601020304010203030800f7ff00000000'
@@ -0,0 +1,181 @@
+"""
+Index of the lab alias file (/home/exaware/alias_sw_lab_new).
+This is a fork of the alias_index.py file in the folder dut_ctrl.
+The file is parsed once into a dictionary {(device_type, device_num, command) : aliased command}, and parsed again
+only when its modification time changes. Lines of the file look like :
+    alias exa-il01-dl-3010-s='telnet 10.1.10.253 2091'
+    alias exa-il01-dl-3010-sc='ts-cl 10.1.10.253 hw-lab-gw-1 lab lab 91'
+"""
+import os
+import re
+import threading
+import logging
+
+logging.basicConfig(
+                    format='%(asctime)s.%(msecs)03d [%(filename)s line %(lineno)d] %(levelname)-8s %(message)s',
+                    level=logging.INFO,
+                    datefmt='%H:%M:%S')
+
+ALIAS_FILE = '/home/exaware/alias_sw_lab_new'
+
+ALIAS_LINE_RE = re.compile(r"^alias exa-il01-(?P<device_type>[a-z]+)-(?P<device_num>\d+)-(?P<command>\S+?)='(?P<value>.*)'", re.MULTILINE)
+
+class AliasIndex(object):
+    """
+    Input : alias_file - Path of the alias file
+    """
+    def __init__(self, alias_file=ALIAS_FILE):
+        self.alias_file = alias_file
+        # (device_type, device_num, command) -> List of aliased commands. More than one is an error in the file.
+        self.aliases = {}
+        self.file_version = None
+        self.num_of_loads = 0
+        self.lock = threading.Lock()
+
+    def _load(self):
+        """
+        Parse the alias file, if it was changed since the last parse
+        """
+        stat = os.stat(self.alias_file)
+        file_version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock :
+            if file_version == self.file_version :
+                return
+            with open(self.alias_file, 'r') as f:
+                text = f.read()
+
+            aliases = {}
+            for match in ALIAS_LINE_RE.finditer(text) :
+                key = (match.group("device_type"), match.group("device_num"), match.group("command"))
+                aliases.setdefault(key, []).append(match.group("value"))
+
+            self.aliases = aliases
+            self.file_version = file_version
+            self.num_of_loads += 1
+            logging.debug(f"Loaded {len(aliases)} aliases from {self.alias_file}")
+
+    def get_command(self, device_num: str, device_type: str, command: str) -> str :
+        """
+        Input : device_num  - e.g., '3010'
+                device_type - Applicable values : 'dl', 'ec', 'al', 'uf'
+                command     - Applicable values : 'm', 'o', 'off', 'on', 'reset', 's', 'sc'
+        Return value : The aliased command, such as 'telnet 10.1.10.253 2091'
+        """
+        self._load()
+        full_device_num = f"30{device_num[-2:]}"
+        matches = self.aliases.get((device_type, full_device_num, command), [])
+
+        if len(matches) != 1 :
+            raise Exception (f"Could not find command alias exa-il01-{device_type}-{full_device_num}-{command} in alias file {self.alias_file}")
+        return matches[0]
+
+    def get_devices(self) -> list :
+        """
+        Return value : Sorted list of (device_type, device_num) of all the devices in the alias file
+        """
+        self._load()
+        return sorted({(device_type, device_num) for device_type, device_num, _ in self.aliases})
+
+    def get_commands(self, device_num: str, device_type: str) -> dict :
+        """
+        Return value : Dictionary {command : aliased command} of a device
+        """
+        self._load()
+        return {command : values[0] for (alias_device_type, alias_device_num, command), values in self.aliases.items()
+                if alias_device_type == device_type and alias_device_num == device_num and len(values) == 1}
+
+# Alias file path -> AliasIndex
+_ALIAS_INDEXES = {}
+
+def get_alias_index(alias_file=ALIAS_FILE) -> AliasIndex :
+    if alias_file not in _ALIAS_INDEXES :
+        _ALIAS_INDEXES[alias_file] = AliasIndex(alias_file)
+    return _ALIAS_INDEXES[alias_file]
+
+def get_dut_alias_to_cmd(device_num: str, device_type: str, command: str, alias_file=ALIAS_FILE) -> str :
+    """
+    Return value : The aliased command of a device. See AliasIndex.get_command()
+    """
+    return get_alias_index(alias_file).get_command(device_num, device_type, command)
+
+# ***************************************************************************************
+# UT
+# ***************************************************************************************
+def _create_alias_file(num_of_devices=4) -> str :
+    import tempfile
+
+    lines = ["# Lab aliases", "alias ll='ls -l'"]
+    for index in range(num_of_devices) :
+        device_num = f"30{index % 100:02d}"
+        for device_type in ["dl", "ec"] :
+            lines.append(f"alias exa-il01-{device_type}-{device_num}-s='telnet 10.1.10.253 20{index % 100:02d}'")
+            lines.append(f"alias exa-il01-{device_type}-{device_num}-sc='ts-cl 10.1.10.253 hw-lab-gw-1 lab lab {index % 100}'")
+            lines.append(f"alias exa-il01-{device_type}-{device_num}-reset='ts-reset {device_num}'")
+    with tempfile.NamedTemporaryFile('w', suffix='.alias', delete=False) as f :
+        f.write("\n".join(lines) + "\n")
+    return f.name
+
+def _test_alias_index() :
+    alias_file = _create_alias_file()
+    alias_index = AliasIndex(alias_file)
+
+    assert alias_index.get_command("3000", "dl", "s") == "telnet 10.1.10.253 2000"
+    assert alias_index.get_command("3003", "ec", "sc") == "ts-cl 10.1.10.253 hw-lab-gw-1 lab lab 3"
+    assert alias_index.get_devices()[:3] == [("dl", "3000"), ("dl", "3001"), ("dl", "3002")]
+    assert alias_index.get_commands("3001", "ec") == {"s" : "telnet 10.1.10.253 2001", "sc" : "ts-cl 10.1.10.253 hw-lab-gw-1 lab lab 1",
+                                                      "reset" : "ts-reset 3001"}
+    try :
+        alias_index.get_command("3001", "uf", "s")
+        assert False
+    except Exception as error :
+        assert "exa-il01-uf-3001-s" in str(error)
+    assert alias_index.num_of_loads == 1
+
+    # The file is changed - parsed again
+    with open(alias_file, 'a') as f :
+        f.write("alias exa-il01-uf-3001-s='telnet 10.1.10.254 2001'\n")
+    stat = os.stat(alias_file)
+    os.utime(alias_file, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert alias_index.get_command("3001", "uf", "s") == "telnet 10.1.10.254 2001"
+    assert alias_index.num_of_loads == 2
+
+    # Duplicated alias
+    with open(alias_file, 'a') as f :
+        f.write("alias exa-il01-uf-3001-s='telnet 10.1.10.254 2002'\n")
+    try :
+        alias_index.get_command("3001", "uf", "s")
+        assert False
+    except Exception :
+        pass
+
+    os.remove(alias_file)
+    logging.info("_test_alias_index passed")
+
+def _benchmark_alias_index(num_of_devices=100, num_of_lookups=1000) :
+    """
+    Lookup time, compared with reading the file and searching it with a regular expression on every lookup
+    """
+    import time
+
+    alias_file = _create_alias_file(num_of_devices)
+    alias_index = AliasIndex(alias_file)
+
+    start = time.perf_counter()
+    for index in range(num_of_lookups) :
+        with open(alias_file, 'r') as f :
+            text = f.read()
+        matches = re.findall(f"alias exa-il01-ec-30{index % num_of_devices:02d}-sc='(.*)'", text)
+        assert len(matches) == 1
+    regex_time = (time.perf_counter() - start) / num_of_lookups
+
+    start = time.perf_counter()
+    for index in range(num_of_lookups) :
+        alias_index.get_command(f"30{index % num_of_devices:02d}", "ec", "sc")
+    index_time = (time.perf_counter() - start) / num_of_lookups
+
+    os.remove(alias_file)
+    logging.info(f"{num_of_devices} devices. Read and search per lookup {regex_time * 1e6:.0f} us, index {index_time * 1e6:.0f} us")
+
+if __name__ == "__main__" :
+    _test_alias_index()
+    # _benchmark_alias_index()
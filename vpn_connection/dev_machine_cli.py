@@ -21,25 +21,14 @@ def _get_dut_alias_to_cmd (device_num: str, device_type: str, command: str) -> s
     device_num  : e.g., '3010'
     device_type : Applicable values : 'dl', 'ec', 'al', 'uf'
     command     : Applicable values : 'm', 'o', 'off', 'on', 'reset', 's', 'sc' 
+    The alias file is parsed once, and again only when it changes (see alias_index.py)
     """
-    import re
-
-    alias_file = '/home/exaware/alias_sw_lab_new'
-    dev_specific_num = device_num[-2:]
-    
-    with open(alias_file, 'r') as f:
-        text = f.read()
-
-    full_command = f"alias exa-il01-{device_type}-30{dev_specific_num}-{command}"
-    pattern = f"{full_command}='(.*)'"
-
-    matches = re.findall(pattern, text)
+    from alias_index import get_dut_alias_to_cmd
 
-    if len(matches) != 1 :
-        raise Exception (f"Could not find command {full_command} in alias file {alias_file}")
+    aliased_command = get_dut_alias_to_cmd(device_num, device_type, command)
     
-    print(f"Command {full_command} in aliased to {matches[0]}")
-    return matches[0]
+    print(f"Command alias exa-il01-{device_type}-30{device_num[-2:]}-{command} in aliased to {aliased_command}")
+    return aliased_command
 
 def reset_serial_server_connection(device_number: str, device_type: str) -> None :
     """
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
-'''This module implements a Finite State Machine (FSM). In addition to state
+'''This is a fork of the fsm.py file in the folder dut_ctrl. Keep the two in step.
+
+This module implements a Finite State Machine (FSM). In addition to state
 this FSM also maintains a user defined "memory". So this FSM can be used as a
 Push-down Automata (PDA) since a PDA is a FSM + memory.
 
@@ -84,6 +86,8 @@ PEXPECT LICENSE
 
 '''
 
+import logging
+
 class ExceptionFSM(Exception):
 
     '''This is the FSM Exception class.'''
@@ -99,12 +103,13 @@ class FSM:
     '''This is a Finite State Machine (FSM).
     '''
 
-    def __init__(self, initial_state, memory=None):
+    def __init__(self, initial_state, memory=None, print_transitions=True):
 
         '''This creates the FSM. You set the initial state here. The "memory"
         attribute is any object that you want to pass along to the action
         functions. It is not used by the FSM. For parsing you would typically
-        pass a list to be used as a stack. '''
+        pass a list to be used as a stack. State changes are printed if
+        print_transitions is True, and logged at debug level otherwise. '''
 
         # Map (input_symbol, current_state) --> (action, next_state).
         self.state_transitions = {}
@@ -118,6 +123,7 @@ class FSM:
         self.next_state = None
         self.action = None
         self.memory = memory
+        self.print_transitions = print_transitions
 
     def reset (self):
 
@@ -239,7 +245,12 @@ class FSM:
         (self.action, self.next_state) = self.get_transition (self.input_symbol, self.current_state)
 
         if self.current_state != self.next_state :
-            print (f'*** {self.action.__name__} *** Input Symbol: "{input_symbol}" ({self.current_state} -> {self.next_state})')
+            action_name = self.action.__name__ if self.action is not None else None
+            transition = f'*** {action_name} *** Input Symbol: "{input_symbol}" ({self.current_state} -> {self.next_state})'
+            if self.print_transitions :
+                print (transition)
+            else :
+                logging.debug (transition)
 
         if self.action is not None:
             self.action (self)